@@ -0,0 +1,53 @@
+"""
+hit count and last view time of views, one view per entity and user
+
+Revision ID: 3f7a9c2d5e18
+Revises: 8e2f4b6a1c73
+Create Date: 2026-10-17 16:00:00.000000
+"""
+
+# revision identifiers, used by Alembic.
+from __future__ import annotations
+
+revision = "3f7a9c2d5e18"
+down_revision = "8e2f4b6a1c73"
+branch_labels = None
+depends_on = None
+
+import sqlalchemy as sa
+from alembic import op
+
+
+def upgrade():
+    # merge duplicate views of an entity by a user into the oldest one
+    op.execute(
+        "UPDATE hit SET view_id = ("
+        " SELECT MIN(v2.id) FROM view v1 JOIN view v2"
+        " ON v1.entity_id = v2.entity_id AND v1.user_id = v2.user_id"
+        " WHERE v1.id = hit.view_id)"
+    )
+    op.execute(
+        "DELETE FROM view WHERE id NOT IN ("
+        " SELECT MIN(id) FROM view GROUP BY entity_id, user_id)"
+    )
+
+    op.add_column(
+        "view",
+        sa.Column("hit_count", sa.Integer, server_default="0", nullable=False),
+    )
+    op.add_column("view", sa.Column("last_viewed_at", sa.DateTime, nullable=True))
+    op.execute(
+        "UPDATE view SET"
+        " hit_count = (SELECT COUNT(*) FROM hit WHERE hit.view_id = view.id),"
+        " last_viewed_at = (SELECT MAX(viewed_at) FROM hit WHERE hit.view_id = view.id)"
+    )
+
+    op.create_index(
+        "ix_view_entity_user", "view", ["entity_id", "user_id"], unique=True
+    )
+
+
+def downgrade():
+    op.drop_index("ix_view_entity_user", table_name="view")
+    op.drop_column("view", "last_viewed_at")
+    op.drop_column("view", "hit_count")
@@ -0,0 +1,61 @@
+"""
+materialized paths for cmis objects
+
+Revision ID: 5c1d0e7a9b42
+Revises: 1f4631da751b
+Create Date: 2026-10-17 09:00:00.000000
+"""
+
+# revision identifiers, used by Alembic.
+from __future__ import annotations
+
+revision = "5c1d0e7a9b42"
+down_revision = "1f4631da751b"
+branch_labels = None
+depends_on = None
+
+import sqlalchemy as sa
+from alembic import op
+
+
+def upgrade():
+    op.add_column("cmisobject", sa.Column("id_path", sa.Text(), nullable=True))
+    op.add_column("cmisobject", sa.Column("path", sa.UnicodeText(), nullable=True))
+    op.create_index(
+        "ix_cmisobject_id_path",
+        "cmisobject",
+        ["id_path"],
+        postgresql_ops={"id_path": "text_pattern_ops"},
+    )
+    op.create_index("ix_cmisobject_path", "cmisobject", ["path"])
+
+    # fill paths one tree level at a time, starting from root folders
+    connection = op.get_bind()
+    connection.execute(
+        sa.text(
+            "UPDATE cmisobject SET id_path = '/' || CAST(id AS TEXT), path = '' "
+            "WHERE _parent_id IS NULL"
+        )
+    )
+    while True:
+        result = connection.execute(
+            sa.text(
+                "UPDATE cmisobject SET "
+                "id_path = (SELECT p.id_path FROM cmisobject p "
+                "           WHERE p.id = cmisobject._parent_id) "
+                "          || '/' || CAST(id AS TEXT), "
+                "path = (SELECT p.path FROM cmisobject p "
+                "        WHERE p.id = cmisobject._parent_id) || '/' || title "
+                "WHERE id_path IS NULL AND _parent_id IN "
+                "  (SELECT id FROM cmisobject WHERE id_path IS NOT NULL)"
+            )
+        )
+        if not result.rowcount:
+            break
+
+
+def downgrade():
+    op.drop_index("ix_cmisobject_path", table_name="cmisobject")
+    op.drop_index("ix_cmisobject_id_path", table_name="cmisobject")
+    op.drop_column("cmisobject", "path")
+    op.drop_column("cmisobject", "id_path")
@@ -0,0 +1,28 @@
+"""
+content hash of blobs
+
+Revision ID: 8e2f4b6a1c73
+Revises: 5c1d0e7a9b42
+Create Date: 2026-10-17 14:00:00.000000
+"""
+
+# revision identifiers, used by Alembic.
+from __future__ import annotations
+
+revision = "8e2f4b6a1c73"
+down_revision = "5c1d0e7a9b42"
+branch_labels = None
+depends_on = None
+
+import sqlalchemy as sa
+from alembic import op
+
+
+def upgrade():
+    op.add_column("blob", sa.Column("content_hash", sa.String(64), nullable=True))
+    op.create_index("ix_blob_content_hash", "blob", ["content_hash"])
+
+
+def downgrade():
+    op.drop_index("ix_blob_content_hash", table_name="blob")
+    op.drop_column("blob", "content_hash")
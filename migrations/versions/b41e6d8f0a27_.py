@@ -0,0 +1,60 @@
+"""
+last activity of memberships, digest of user photos
+
+Revision ID: b41e6d8f0a27
+Revises: 3f7a9c2d5e18
+Create Date: 2026-10-17 18:00:00.000000
+"""
+
+# revision identifiers, used by Alembic.
+from __future__ import annotations
+
+revision = "b41e6d8f0a27"
+down_revision = "3f7a9c2d5e18"
+branch_labels = None
+depends_on = None
+
+import hashlib
+
+import sqlalchemy as sa
+from alembic import op
+
+
+def upgrade():
+    op.add_column(
+        "community_membership",
+        sa.Column("last_activity_at", sa.DateTime, nullable=True),
+    )
+    op.execute(
+        "UPDATE community_membership SET last_activity_at = ("
+        " SELECT MAX(activity_entry.happened_at) FROM activity_entry"
+        " WHERE activity_entry.actor_id = community_membership.user_id"
+        " AND activity_entry.target_id = community_membership.community_id)"
+    )
+
+    op.add_column("user", sa.Column("photo_digest", sa.String(32), nullable=True))
+    connection = op.get_bind()
+    user = sa.table(
+        "user",
+        sa.column("id", sa.Integer),
+        sa.column("photo", sa.LargeBinary),
+        sa.column("photo_digest", sa.String),
+    )
+    query = sa.select([user.c.id]).where(user.c.photo.isnot(None))
+    user_ids = connection.execute(query).scalars().all()
+    # one photo at a time: they can be large
+    for user_id in user_ids:
+        query = sa.select([user.c.photo]).where(user.c.id == user_id)
+        photo = connection.execute(query).scalar()
+        if not photo:
+            continue
+        connection.execute(
+            user.update()
+            .where(user.c.id == user_id)
+            .values(photo_digest=hashlib.md5(photo).hexdigest())  # noqa: S324
+        )
+
+
+def downgrade():
+    op.drop_column("user", "photo_digest")
+    op.drop_column("community_membership", "last_activity_at")
@@ -3,4 +3,6 @@
 from __future__ import annotations
 
 from .base import *  # noqa
+from .blobs import *  # noqa
+from .conversion import *  # noqa
 from .indexing import *  # noqa
@@ -0,0 +1,33 @@
+# Copyright (c) 2012-2024, Abilian SAS
+
+""""""
+
+from __future__ import annotations
+
+import click
+import sqlalchemy as sa
+from flask.cli import with_appcontext
+from flask_super.cli import command
+
+from abilian.core.extensions import db
+from abilian.core.models.blob import Blob
+from abilian.services.blob_store import blob_store
+
+
+@command()
+@click.option("--min-age", default=3600, help="Keep files younger (in seconds).")
+@click.option("--dry-run/--no-dry-run", default=False)
+@with_appcontext
+def collect_blobs(min_age: int, dry_run: bool) -> None:
+    """Delete content-addressed files no longer used by any blob."""
+    query = sa.select([Blob.content_hash]).where(Blob.content_hash.isnot(None))
+    referenced = set(db.session.execute(query.distinct()).scalars())
+
+    try:
+        count, size = blob_store.collect_garbage(
+            referenced, min_age=min_age, dry_run=dry_run
+        )
+    except RuntimeError as e:
+        raise click.ClickException(str(e)) from e
+    verb = "Would delete" if dry_run else "Deleted"
+    print(f"{verb} {count} files ({size} bytes)")
@@ -0,0 +1,33 @@
+# Copyright (c) 2012-2024, Abilian SAS
+
+""""""
+
+from __future__ import annotations
+
+import click
+from flask.cli import with_appcontext
+from flask_super.cli import command
+
+from abilian.services.conversion import converter
+
+
+@command()
+@click.option("--prune/--no-prune", default=False, help="Evict entries over budget.")
+@click.option("--max-size", type=int, help="Size budget in bytes, for --prune.")
+@click.option("--rebuild/--no-rebuild", default=False, help="Index unknown files.")
+@with_appcontext
+def conversion_cache(prune: bool, max_size: int | None, rebuild: bool) -> None:
+    """Report conversion cache usage, and optionally prune it."""
+    cache = converter.cache
+    if rebuild:
+        cache.rebuild_index()
+
+    if prune:
+        count, size = cache.prune(max_size)
+        print(f"Evicted {count} entries ({size} bytes)")
+
+    stats = cache.stats()
+    print(f"{stats['entries']} entries, {stats['bytes']} bytes")
+    print(f"Budget: {stats['max_size'] or 'unbounded'} ({stats['policy']})")
+    for type_, entry in stats["types"].items():
+        print(f"  {type_:20s} {entry['entries']:8d} {entry['bytes']:14d}")
@@ -5,14 +5,18 @@
 from __future__ import annotations
 
 import contextlib
+import json
+import multiprocessing
 import time
 from collections import deque
-from typing import TYPE_CHECKING
+from pathlib import Path
+from typing import TYPE_CHECKING, Any
 
 import click
 import sqlalchemy as sa
 import whoosh
 import whoosh.index
+from flask import current_app
 from flask.cli import with_appcontext
 from flask_super.cli import command
 from loguru import logger
@@ -22,8 +26,13 @@ from whoosh.writing import CLEAR, AsyncWriter
 
 from abilian.core.extensions import db
 from abilian.services import get_service
+from abilian.services.indexing import indexing_batch
 
 if TYPE_CHECKING:
+    from collections.abc import Iterator
+
+    from flask import Flask
+
     from abilian.core.entities import Entity
 
 STOP = object()
@@ -34,8 +43,20 @@ COMMIT = object()
 @click.option("--batch-size", default=0)
 @click.option("--progressive/--no-progressive")
 @click.option("--clear/--no-clear")
+@click.option("--parallel/--no-parallel", default=False)
+@click.option("--procs", default=0)
+@click.option("--range-size", default=1000)
+@click.option("--resume/--no-resume", default=False)
 @with_appcontext
-def reindex(clear: bool, progressive: bool, batch_size: int) -> None:
+def reindex(  # noqa: PLR0917
+    clear: bool,
+    progressive: bool,
+    batch_size: int,
+    parallel: bool,
+    procs: int,
+    range_size: int,
+    resume: bool,
+) -> None:
     """Reindex all content; optionally clear index before.
 
     All is done in asingle transaction by default.
@@ -45,8 +66,20 @@ def reindex(clear: bool, progressive: bool, batch_size: int) -> None:
     :param batch_size: number of documents to process before writing to the
                      index. Unused in single transaction mode. If `None` then
                      all documents of same content type are written at once.
+    :param parallel: split classes in primary key ranges, build documents in a
+                     process pool and save a checkpoint after each range.
+    :param procs: number of worker processes in parallel mode. `0` means one
+                  per CPU.
+    :param range_size: number of objects per range in parallel mode.
+    :param resume: in parallel mode, restart from the last checkpoint instead
+                   of starting from scratch.
     """
-    reindexer = Reindexer(clear, progressive, batch_size)
+    if parallel:
+        reindexer = ParallelReindexer(
+            clear, procs=procs, range_size=range_size, resume=resume
+        )
+    else:
+        reindexer = Reindexer(clear, progressive, batch_size)
     reindexer.reindex_all()
 
 
@@ -115,7 +148,7 @@ class Reindexer:
             print("*" * 79)
             print(f"{name}")
 
-            with tqdm(total=count) as bar:
+            with tqdm(total=count) as bar, indexing_batch():
                 self.reindex_batch(query, current_object_type, adapter, bar)
 
             if not self.batch_size:
@@ -150,6 +183,233 @@ class Reindexer:
             bar.update()
 
 
+class Checkpoint:
+    """Progress of a parallel reindexing, saved on disk after each range."""
+
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        self.data: dict[str, Any] = {"done": [], "last_pk": {}}
+
+    @property
+    def started(self) -> bool:
+        return bool(self.data["done"] or self.data["last_pk"])
+
+    def load(self) -> None:
+        if self.path.exists():
+            self.data = json.loads(self.path.read_text())
+
+    def save(self) -> None:
+        # write then rename, so that an interrupted run never leaves a truncated
+        # checkpoint behind.
+        tmp_path = self.path.with_suffix(".tmp")
+        tmp_path.write_text(json.dumps(self.data))
+        tmp_path.replace(self.path)
+
+    def remove(self) -> None:
+        self.data = {"done": [], "last_pk": {}}
+        self.path.unlink(missing_ok=True)
+
+    def is_done(self, object_type: str) -> bool:
+        return object_type in self.data["done"]
+
+    def mark_done(self, object_type: str) -> None:
+        self.data["done"].append(object_type)
+        self.data["last_pk"].pop(object_type, None)
+        self.save()
+
+    def last_pk(self, object_type: str) -> int | None:
+        return self.data["last_pk"].get(object_type)
+
+    def set_last_pk(self, object_type: str, pk: int) -> None:
+        self.data["last_pk"][object_type] = pk
+        self.save()
+
+
+class ParallelReindexer:
+    """Reindex classes by primary key ranges, using a pool of processes to
+    build documents.
+
+    A checkpoint is saved after each range has been committed to the index,
+    so that an interrupted run can be resumed with `resume=True`.
+    """
+
+    checkpoint_filename = "reindex-checkpoint.json"
+
+    def __init__(
+        self,
+        clear: bool,
+        procs: int = 0,
+        range_size: int = 1000,
+        resume: bool = False,
+        checkpoint_path: Path | None = None,
+    ) -> None:
+        self.clear = clear
+        self.procs = int(procs or multiprocessing.cpu_count())
+        self.range_size = max(int(range_size), 1)
+
+        self.index_service = get_service("indexing")
+        self.index = self.index_service.app_state.indexes["default"]
+        self.adapted = self.index_service.adapted
+        self.session = Session(bind=db.session.get_bind(None, None), autocommit=True)
+        #: object_type -> (number of documents, elapsed seconds)
+        self.stats: dict[str, tuple[int, float]] = {}
+
+        if checkpoint_path is None:
+            whoosh_base = Path(self.index_service.app_state.whoosh_base)
+            checkpoint_path = whoosh_base / self.checkpoint_filename
+        self.checkpoint = Checkpoint(checkpoint_path)
+        if resume:
+            self.checkpoint.load()
+        else:
+            self.checkpoint.remove()
+
+    def reindex_all(self) -> None:
+        if self.clear and not self.checkpoint.started:
+            print("*" * 80)
+            print("CLEAR INDEX BEFORE REINDEXING")
+            print("*" * 80)
+            writer = _get_writer(self.index)
+            writer.commit(mergetype=CLEAR)
+
+        pool = self._make_pool()
+        try:
+            indexed_classes = self.index_service.app_state.indexed_classes
+            for cls in sorted(indexed_classes, key=lambda c: c.__name__):
+                self.reindex_class(cls, pool)
+        finally:
+            if pool is not None:
+                pool.close()
+                pool.join()
+
+        # ranges are committed without merging: merge small segments now.
+        writer = _get_writer(self.index)
+        writer.commit(merge=True)
+        self.checkpoint.remove()
+
+    def _make_pool(self):
+        if self.procs <= 1:
+            return None
+
+        app = current_app._get_current_object()
+        context = multiprocessing.get_context("fork")
+        return context.Pool(self.procs, initializer=_init_worker, initargs=(app,))
+
+    def pk_ranges(
+        self, cls: type[Entity], start_after: int | None = None
+    ) -> Iterator[tuple[int, int]]:
+        """Yield (first pk, last pk) ranges of at most `range_size` objects."""
+        with self.session.begin():
+            query = self.session.query(cls.id).order_by(cls.id)
+            if start_after is not None:
+                query = query.filter(cls.id > start_after)
+            pks = [row[0] for row in query]
+
+        for i in range(0, len(pks), self.range_size):
+            chunk = pks[i : i + self.range_size]
+            yield chunk[0], chunk[-1]
+
+    def reindex_class(self, cls: type[Entity], pool=None) -> None:
+        object_type = cls._object_type()
+        adapter = self.adapted.get(object_type)
+
+        if not adapter or not adapter.indexable:
+            return
+
+        name = cls.__name__
+        if self.checkpoint.is_done(object_type):
+            print(f"{name}: already indexed, skipping")
+            return
+
+        last_pk = self.checkpoint.last_pk(object_type)
+        if last_pk is None and not self.clear:
+            writer = _get_writer(self.index)
+            writer.delete_by_term("object_type", object_type)
+            writer.commit(merge=False)
+
+        ranges = list(self.pk_ranges(cls, start_after=last_pk))
+        tasks = [(object_type, first, last) for first, last in ranges]
+        if pool is None:
+            results = map(build_documents, tasks)
+        else:
+            results = pool.imap(build_documents, tasks)
+
+        print("*" * 79)
+        print(f"{name}")
+        print("*" * 79)
+
+        count = 0
+        start = time.perf_counter()
+        with tqdm(total=len(ranges)) as bar:
+            for (_first, last), documents in zip(ranges, results, strict=True):
+                # when resuming, the range following the checkpoint may have been
+                # written before the run was interrupted.
+                self.write_documents(documents, delete=last_pk is not None)
+                self.checkpoint.set_last_pk(object_type, last)
+                count += len(documents)
+                bar.update()
+        elapsed = time.perf_counter() - start
+
+        self.checkpoint.mark_done(object_type)
+        self.stats[object_type] = (count, elapsed)
+        rate = count / elapsed if elapsed else 0.0
+        print(f"{name}: {count} documents in {elapsed:.1f}s ({rate:.1f} docs/sec)")
+
+    def write_documents(self, documents: list[dict[str, Any]], delete: bool) -> None:
+        if not documents:
+            return
+
+        if self.procs > 1:
+            writer = _get_writer(self.index, procs=self.procs, multisegment=True)
+        else:
+            writer = _get_writer(self.index)
+
+        for document in documents:
+            if delete:
+                writer.delete_by_term("object_key", document["object_key"])
+            writer.add_document(**document)
+        writer.commit(merge=False)
+
+
+def _init_worker(app: Flask) -> None:
+    app.app_context().push()
+    # connections inherited from the parent process must not be reused, nor
+    # closed (they are still in use by the parent).
+    db.engine.dispose(close=False)
+
+
+def build_documents(task: tuple[str, int, int]) -> list[dict[str, Any]]:
+    """Build index documents for objects of `object_type` with `first <= pk <=
+    last`.
+
+    Runs in worker processes of :class:`ParallelReindexer`.
+    """
+    object_type, first, last = task
+    index_service = get_service("indexing")
+    adapter = index_service.adapted[object_type]
+    cls = adapter.model_class
+
+    session = Session(bind=db.session.get_bind(None, None))
+    try:
+        query = (
+            session.query(cls)
+            .options(sa.orm.lazyload("*"))
+            .filter(cls.id.between(first, last))
+            .order_by(cls.id)
+        )
+        documents = []
+        with indexing_batch():
+            for obj in query:
+                if obj.object_type != object_type:
+                    # subclass instance: indexed with its own class
+                    continue
+                document = index_service.get_document(obj, adapter)
+                if document:
+                    documents.append(document)
+        return documents
+    finally:
+        session.close()
+
+
 # indexing strategies
 def single_transaction(index, clear):
     with AsyncWriter(index) as writer:
@@ -204,11 +464,11 @@ def progressive_mode(index, clear):
         doc = yield True
 
 
-def _get_writer(index):
+def _get_writer(index, **kwargs):
     writer = None
     while writer is None:
         try:
-            writer = index.writer()
+            writer = index.writer(**kwargs)
         except whoosh.index.LockError:
             time.sleep(0.25)
 
@@ -14,7 +14,7 @@ from typing import IO, TYPE_CHECKING
 import sqlalchemy as sa
 from sqlalchemy.event import listens_for
 from sqlalchemy.schema import Column
-from sqlalchemy.types import Integer
+from sqlalchemy.types import Integer, String
 
 from abilian.core.models.base import Model
 from abilian.core.sqlalchemy import UUID, JSONDict
@@ -31,6 +31,10 @@ class Blob(Model):
 
     Files are stored on-disk, named after their uuid. Repository is
     located in instance folder/data/files.
+
+    When the blob store is content-addressed, files are named after the
+    sha256 of their content (stored in `content_hash`), and blobs with the
+    same content share the same file.
     """
 
     __tablename__ = "blob"
@@ -38,6 +42,8 @@ class Blob(Model):
     id = Column(Integer(), primary_key=True, autoincrement=True)
     uuid = Column(UUID(), unique=True, nullable=False, default=uuid.uuid4)
     meta = Column(JSONDict(), nullable=False, default=dict)
+    #: sha256 of content, set when content is stored by hash
+    content_hash = Column(String(64), index=True, nullable=True)
 
     def __init__(self, value=None, *args, **kwargs) -> None:
         super().__init__(*args, **kwargs)
@@ -60,41 +66,65 @@ class Blob(Model):
 
     @property
     def file(self) -> Path | None:
-        """Return :class:`pathlib.Path` object used for storing value."""
+        """Return :class:`pathlib.Path` object used for storing value, or
+        `None` if it's not stored on the local file system.
+
+        Prefer :meth:`open`, which works with all blob store backends.
+        """
         from abilian.services.blob_store import session_blob_store
 
-        return session_blob_store.get(self, self.uuid)
+        return session_blob_store.get(self, self.uuid, content_hash=self.content_hash)
+
+    def open(self) -> IO[bytes]:
+        """Return a binary stream on value.
+
+        :raises:KeyError if there is no value
+        """
+        from abilian.services.blob_store import session_blob_store
+
+        return session_blob_store.open(self, self.uuid, content_hash=self.content_hash)
 
     @property
     def size(self) -> int:
         """Return size in bytes of value."""
-        file = self.file
-        if file is None:
+        from abilian.services.blob_store import session_blob_store
+
+        try:
+            return session_blob_store.size(
+                self, self.uuid, content_hash=self.content_hash
+            )
+        except KeyError:
             return 0
-        return file.stat().st_size
 
     @property
     def value(self) -> bytes | None:
         """Binary value content."""
-        file = self.file
-        if file is None:
+        try:
+            stream = self.open()
+        except KeyError:
             return None
-        return file.read_bytes()
+        with stream:
+            return stream.read()
 
     @value.setter
     def value(self, value: bytes | str | IO) -> None:
         """Store binary content to the repository and update
         `self.meta['md5']`.
 
+        Streams are copied by chunks, and md5 is computed while copying.
+
         :param:content: bytes, or any object with a `read()` method
         :param:encoding: encoding to use when content is Unicode
         """
-        from abilian.services.blob_store import session_blob_store
+        from abilian.services.blob_store import blob_store, session_blob_store
 
-        session_blob_store.set(self, self.uuid, value)
+        stored = session_blob_store.set(self, self.uuid, value)
+        self.content_hash = stored.sha256 if blob_store.content_addressed else None
 
-        if self.value:
-            self.meta["md5"] = self._md5_hexdigest()
+        # a stored size tells that the blob has a file, see `__bool__`
+        self.meta["size"] = stored.size
+        if stored.size:
+            self.meta["md5"] = stored.md5
 
         filename = getattr(value, "filename", None)
         if filename:
@@ -111,7 +141,15 @@ class Blob(Model):
         """Remove value from repository."""
         from abilian.services.blob_store import session_blob_store
 
-        session_blob_store.delete(self, self.uuid)
+        session_blob_store.delete(self, self.uuid, content_hash=self.content_hash)
+
+        # rows of deleted blobs are not updated anymore
+        state = sa.inspect(self)
+        if not (state.deleted or state.was_deleted):
+            self.content_hash = None
+            for name in ("size", "md5"):
+                if name in self.meta:
+                    del self.meta[name]
 
     @property
     def md5(self) -> str | None:
@@ -123,8 +161,20 @@ class Blob(Model):
         return md5
 
     def __bool__(self) -> bool:
-        """A blob is considered falsy if it has no file."""
-        return self.file is not None and self.file.exists()
+        """A blob is considered falsy if it has no file.
+
+        Content written with :attr:`value` is recorded in `meta`: the blob
+        store, a remote service with some backends, is only checked for
+        blobs written before.
+        """
+        if "size" in self.meta or "md5" in self.meta:
+            return True
+
+        from abilian.services.blob_store import session_blob_store
+
+        return session_blob_store.exists(
+            self, self.uuid, content_hash=self.content_hash
+        )
 
     # Py3k compat
     __nonzero__ = __bool__
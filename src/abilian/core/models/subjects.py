@@ -10,6 +10,7 @@ else, like "people" or "principal" ?
 
 from __future__ import annotations
 
+import hashlib
 import random
 import string
 from abc import ABC, abstractmethod
@@ -24,7 +25,14 @@ from sqlalchemy.event import listens_for
 from sqlalchemy.ext.hybrid import hybrid_property
 from sqlalchemy.orm import backref, deferred, relationship
 from sqlalchemy.schema import Column, ForeignKey, UniqueConstraint
-from sqlalchemy.types import Boolean, DateTime, Integer, LargeBinary, UnicodeText
+from sqlalchemy.types import (
+    Boolean,
+    DateTime,
+    Integer,
+    LargeBinary,
+    String,
+    UnicodeText,
+)
 
 from abilian.core import sqlalchemy as sa_types
 from abilian.core.util import fqcn
@@ -203,6 +211,9 @@ class User(Principal, UserMixin, db.Model):
     password = Column(UnicodeText, default="*", info={"audit_hide_content": True})
 
     photo = deferred(Column(LargeBinary))
+    #: md5 digest of :attr:`photo`, maintained when it is set. Allows building
+    #: photo URLs without loading the photo.
+    photo_digest = Column(String(32), nullable=True, info=SYSTEM)
 
     last_active = Column(DateTime, info=SYSTEM)
     locale = Column(sa_types.Locale, nullable=True, default=None)
@@ -297,6 +308,11 @@ class User(Principal, UserMixin, db.Model):
         return f"<{cls.__module__}.{cls.__name__} id={self.id!r} email={self.email!r} at 0x{id(self):x}>"
 
 
+@listens_for(User.photo, "set")
+def _set_photo_digest(user: User, value: bytes | None, oldvalue, initiator) -> None:
+    user.photo_digest = hashlib.md5(value).hexdigest() if value else None  # noqa: S324
+
+
 @listens_for(User, "mapper_configured", propagate=True)
 def _add_user_indexes(mapper: Mapper, cls: type[User]) -> None:
     # this is a functional index (indexes on a function result), we cannot define
@@ -33,3 +33,6 @@ activity = signals.signal("activity")
 user_loaded = signals.signal("user_loaded")
 
 auth_failed = signals.signal("auth_failed")
+
+#: Triggered when roles are granted or revoked, or permissions changed.
+security_changed = signals.signal("security:changed")
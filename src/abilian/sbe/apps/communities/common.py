@@ -31,7 +31,7 @@ def object_viewers(entity: Document | WikiPage) -> list:
                 viewers.append(
                     {
                         "user": view.user,
-                        "viewed_at": view.hits[-1].viewed_at,
+                        "viewed_at": view.last_viewed_at,
                     }
                 )
         return viewers
@@ -34,6 +34,7 @@ from abilian.core.models.subjects import Group, User
 from abilian.i18n import _l
 from abilian.sbe.apps.documents.models import Folder
 from abilian.sbe.apps.documents.repository import content_repository
+from abilian.services.activity import ActivityEntry
 from abilian.services.indexing import indexable_role
 from abilian.services.security import (
     ADMIN,
@@ -51,6 +52,8 @@ from abilian.services.security import (
 from . import signals
 
 if TYPE_CHECKING:
+    from sqlalchemy.engine import Connection
+    from sqlalchemy.orm import Mapper
     from werkzeug.local import LocalProxy
 
 MEMBER = Role("member", label=_l("role_member"), assignable=False)
@@ -74,6 +77,10 @@ class Membership(db.Model):
 
     role = Column(RoleType())  # should be either 'member' or 'manager'
 
+    #: time of the last activity of the user in the community, maintained when
+    #: activities are recorded
+    last_activity_at = Column(DateTime, nullable=True)
+
     __table_args__ = (UniqueConstraint("user_id", "community_id"),)
 
     def __repr__(self) -> str:
@@ -529,3 +536,28 @@ def _on_group_members_replace(group, value, oldvalue, initiator) -> None:
             continue
         setattr(u, _PROCESSED_ATTR, OP_APPEND)
         community.set_membership(u, MEMBER)
+
+
+@listens_for(ActivityEntry, "after_insert")
+def _on_activity(mapper: Mapper, connection: Connection, entry: ActivityEntry) -> None:
+    """Update :attr:`Membership.last_activity_at` of the actor in the target
+    community, if any."""
+    if entry.actor_id is None or entry.target_id is None:
+        return
+
+    table = Membership.__table__
+    last_activity_at = table.c.last_activity_at
+    connection.execute(
+        table.update()
+        .where(
+            and_(
+                table.c.user_id == entry.actor_id,
+                table.c.community_id == entry.target_id,
+                sa.or_(
+                    last_activity_at.is_(None),
+                    last_activity_at < entry.happened_at,
+                ),
+            )
+        )
+        .values(last_activity_at=entry.happened_at)
+    )
@@ -6,15 +6,12 @@ import contextlib
 import hashlib
 from collections import Counter
 from functools import wraps
-from io import BytesIO
 from operator import attrgetter
 from pathlib import Path
 from time import gmtime, strftime
 from typing import TYPE_CHECKING, Any
 
-import openpyxl
 import sqlalchemy as sa
-import sqlalchemy.sql.functions
 from flask import (
     current_app,
     flash,
@@ -27,7 +24,6 @@ from flask import (
     url_for,
 )
 from flask_login import current_user, login_required
-from openpyxl.cell import WriteOnlyCell
 from werkzeug.exceptions import BadRequest, InternalServerError, NotFound
 from whoosh.searching import Hit
 
@@ -46,15 +42,15 @@ from abilian.sbe.apps.communities.security import (
     require_manage,
 )
 from abilian.sbe.apps.documents.models import Document
-from abilian.services.activity import ActivityEntry
-from abilian.services.security import Role
+from abilian.sbe.apps.forum.models import Thread
 from abilian.web import csrf, views
 from abilian.web.action import Endpoint
 from abilian.web.nav import BreadcrumbItem
 from abilian.web.views import images as image_views
+from abilian.web.xlsx import xlsx_response
 
 if TYPE_CHECKING:
-    from collections.abc import Callable
+    from collections.abc import Callable, Iterator
     from datetime import datetime
 
     from flask.blueprints import BlueprintSetupState
@@ -332,30 +328,67 @@ def image_url(community: Community | CommunityPresenter, **kwargs: Any) -> str:
     return url_for("communities.image", **kwargs)
 
 
+#: members listed per page
+MEMBERS_PAGE_SIZE = 100
+
+#: sort order of members, unique so that it can be used for keyset pagination
+_MEMBERS_ORDER = (
+    sa.func.coalesce(User.last_name, ""),
+    sa.func.coalesce(User.first_name, ""),
+    User.id,
+)
+
+
 def _members_query() -> UserQuery:
     """Helper used in members views."""
-    last_activity_date = sa.sql.functions.max(ActivityEntry.happened_at).label(
-        "last_activity_date"
-    )
     memberships = (
-        User.query.options(sa.orm.undefer("photo"))
-        .join(Membership)
-        .outerjoin(
-            ActivityEntry,
-            sa.sql.and_(
-                ActivityEntry.actor_id == User.id,
-                ActivityEntry.target_id == Membership.community_id,
-            ),
-        )
+        User.query.join(Membership)
         .filter(Membership.community == g.community, User.can_login == True)
-        .add_columns(Membership.id, Membership.role, last_activity_date)
-        .group_by(User, Membership.id, Membership.role)
-        .order_by(User.last_name.asc(), User.first_name.asc())
+        .add_columns(
+            Membership.id,
+            Membership.role,
+            Membership.last_activity_at.label("last_activity_date"),
+        )
+        .order_by(*_MEMBERS_ORDER)
     )
 
     return memberships
 
 
+def _members_page(
+    after: int | None = None, size: int = MEMBERS_PAGE_SIZE
+) -> tuple[list, int | None]:
+    """Return `size` memberships following user `after`, and the id of the
+    user to start the next page after, if any."""
+    query = _members_query()
+    if after is not None:
+        user = User.query.get(after)
+        if user is not None:
+            key = (user.last_name or "", user.first_name or "", user.id)
+            query = query.filter(sa.tuple_(*_MEMBERS_ORDER) > key)
+
+    memberships = query.limit(size + 1).all()
+    if len(memberships) <= size:
+        return memberships, None
+
+    memberships = memberships[:size]
+    return memberships, memberships[-1][0].id
+
+
+def _threads_count(users: list[User]) -> Counter:
+    """Number of threads created by `users` in the current community."""
+    rows = (
+        db.session.query(Thread.creator_id, sa.func.count(Thread.id))
+        .filter(
+            Thread.community_id == g.community.id,
+            Thread.creator_id.in_([user.id for user in users]),
+        )
+        .group_by(Thread.creator_id)
+    )
+    counts = dict(rows.all())
+    return Counter({user: counts[user.id] for user in users if user.id in counts})
+
+
 @route("/<string:community_id>/members")
 @tab("members")
 def members() -> str:
@@ -365,15 +398,17 @@ def members() -> str:
             url=Endpoint("communities.members", community_id=g.community.slug),
         )
     )
-    memberships = _members_query().all()
-    community_threads_users = [thread.creator for thread in g.community.threads]
-    threads_count = Counter(community_threads_users)
+    after = request.args.get("after", type=int)
+    memberships, next_after = _members_page(after)
+    threads_count = _threads_count([user for user, *_columns in memberships])
 
     ctx = {
         "seconds_since_epoch": seconds_since_epoch,
         "is_manager": is_manager(user=current_user),
         "memberships": memberships,
         "threads_count": threads_count,
+        "is_first_page": after is None,
+        "next_after": next_after,
     }
     return render_template("community/members.html", **ctx)
 
@@ -431,11 +466,8 @@ MEMBERS_EXPORT_HEADERS = [
 
 MEMBERS_EXPORT_ATTRS = ["User", "User.email", "last_activity_date", "role"]
 
-HEADER_FONT = openpyxl.styles.Font(bold=True)
-HEADER_ALIGN = openpyxl.styles.Alignment(
-    horizontal="center", vertical="top", wrapText=True
-)
-XLSX_MIME = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+#: rows loaded at once by the members export
+MEMBERS_EXPORT_BATCH_SIZE = 500
 
 
 @route("/<string:community_id>/members/excel")
@@ -443,71 +475,26 @@ XLSX_MIME = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
 def members_excel_export():
     community = g.community
     attributes = [attrgetter(a) for a in MEMBERS_EXPORT_ATTRS]
-    BaseModel = db.Model
-    wb = openpyxl.Workbook()
-
-    if wb.worksheets:
-        wb.remove_sheet(wb.active)
-
-    ws_title = _("%(community)s members", community=community.name)
-    ws_title = ws_title.strip()
-    if len(ws_title) > 31:
-        # sheet title cannot exceed 31 char. max length
-        ws_title = f"{ws_title[:30]}…"
-    ws = wb.create_sheet(title=ws_title)
-    cells = []
 
-    cols_width = []
-    for label in MEMBERS_EXPORT_HEADERS:
-        value = str(label)
-        cell = WriteOnlyCell(ws, value=value)
-        cell.font = HEADER_FONT
-        cell.alignment = HEADER_ALIGN
-        cells.append(cell)
-        cols_width.append(len(value) + 1)
-
-    ws.append(cells)
-
-    for membership_info in _members_query().all():
-        cells = []
-        for col, getter in enumerate(attributes):
-            with contextlib.suppress(AttributeError):
-                value = getter(membership_info)
-
-            if isinstance(value, (BaseModel, Role)):
-                value = str(value)
-
-            cell = WriteOnlyCell(ws, value=value)
-            cells.append(value)
-
-            # estimate width
-            value = str(cell.value)
-            width = max(len(l) for l in value.split("\n")) + 1
-            cols_width[col] = max(width, cols_width[col])
-
-        ws.append(cells)
-
-    # adjust columns width
-    MIN_WIDTH = 3
-    MAX_WIDTH = openpyxl.utils.units.BASE_COL_WIDTH * 4
-
-    for idx, width in enumerate(cols_width, 1):
-        letter = openpyxl.utils.get_column_letter(idx)
-        width = min(max(width, MIN_WIDTH), MAX_WIDTH)
-        ws.column_dimensions[letter].width = width
-
-    fd = BytesIO()
-    wb.save(fd)
-    fd.seek(0)
-
-    response = current_app.response_class(fd, mimetype=XLSX_MIME)
+    def rows() -> Iterator[list]:
+        for membership_info in _members_query().yield_per(MEMBERS_EXPORT_BATCH_SIZE):
+            row = []
+            for getter in attributes:
+                value = None
+                with contextlib.suppress(AttributeError):
+                    value = getter(membership_info)
+                row.append(value)
+            yield row
 
     filename = (
         f"{community.slug}-members-{strftime('%d:%m:%Y-%H:%M:%S', gmtime())}.xlsx"
     )
-    response.headers["content-disposition"] = f'attachment;filename="{filename}"'
-
-    return response
+    return xlsx_response(
+        filename,
+        title=_("%(community)s members", community=community.name),
+        headers=MEMBERS_EXPORT_HEADERS,
+        rows=rows(),
+    )
 
 
 #
@@ -12,7 +12,7 @@ import mimetypes
 import threading
 import uuid
 from importlib import resources as rso
-from typing import TYPE_CHECKING, Any
+from typing import IO, TYPE_CHECKING, Any, NamedTuple
 
 import sqlalchemy as sa
 import whoosh.fields as wf
@@ -24,6 +24,7 @@ from loguru import logger
 from sqlalchemy.event import listen, listens_for
 from sqlalchemy.ext.hybrid import hybrid_property
 from sqlalchemy.orm import backref, foreign, relationship, remote
+from sqlalchemy.orm.attributes import set_committed_value
 from sqlalchemy.orm.session import Session
 from sqlalchemy.schema import Column, ForeignKey, UniqueConstraint
 from sqlalchemy.types import Integer, Text, UnicodeText
@@ -37,16 +38,19 @@ from abilian.core.models.blob import Blob
 from abilian.core.models.subjects import Group, User
 from abilian.core.util import md5
 from abilian.services.conversion import converter
-from abilian.services.indexing import indexable_role
+from abilian.services.indexing import batch_cache, indexable_role
 from abilian.services.security import ADMIN, ANONYMOUS, InheritSecurity, security
 
 from . import tasks
 from .lock import Lock
 
 if TYPE_CHECKING:
-    from collections.abc import Collection, Iterator
+    from collections.abc import Collection, Iterator, Sequence
 
+    from sqlalchemy.engine import Connection
+    from sqlalchemy.orm import Mapper, Query
     from sqlalchemy.orm.attributes import Event
+    from sqlalchemy.orm.state import InstanceState
     from sqlalchemy.util.langhelpers import symbol
 
     from abilian.sbe.apps.communities.models import Community
@@ -59,7 +63,9 @@ __all__ = (
     "CmisObject",
     "Document",
     "Folder",
+    "FolderStats",
     "PathAndSecurityIndexable",
+    "folder_stats",
     "icon_for",
     "icon_url",
     "setup_listener",
@@ -107,8 +113,23 @@ class CmisObject(InheritSecurity, Entity):
 
     _parent_id = Column(Integer, ForeignKey("cmisobject.id"), nullable=True)
 
-    # no duplicate name in same folder
-    __table_args__ = (UniqueConstraint("_parent_id", "title"),)
+    #: materialized path of ids from the root folder, i.e "/1/3/4" (4 being
+    #: self.id). Maintained on insert, move and rename.
+    _id_path = Column("id_path", Text, nullable=True, info=NOT_AUDITABLE)
+
+    #: materialized path of titles, see :attr:`path`.
+    _path = Column("path", UnicodeText, nullable=True, index=True, info=NOT_AUDITABLE)
+
+    __table_args__ = (
+        # no duplicate name in same folder
+        UniqueConstraint("_parent_id", "title"),
+        # allows prefix searches ("LIKE '/1/3/%'") on subtrees
+        sa.Index(
+            "ix_cmisobject_id_path",
+            "id_path",
+            postgresql_ops={"id_path": "text_pattern_ops"},
+        ),
+    )
 
     # Set in concrete classes
     sbe_type: str = ""
@@ -168,10 +189,36 @@ class CmisObject(InheritSecurity, Entity):
 
     @property
     def path(self) -> str:
+        if self._has_materialized_path():
+            return self._path
+
         if self.parent:
             return f"{self.parent.path}/{self.title}"
         return ""
 
+    def _has_materialized_path(self) -> bool:
+        """True if `_id_path` and `_path` are up to date with `parent` and
+        `title` of the object and its ancestors, i.e they have been flushed
+        since they were changed."""
+        state = sa.inspect(self)
+        if not state.persistent or self._id_path is None:
+            return False
+
+        if _paths_changed(state):
+            return False
+
+        # a renamed or moved ancestor invalidates paths of its descendants
+        ancestor_ids = {int(id_) for id_ in self._id_path.split("/")[1:-1]}
+        if not ancestor_ids or state.session is None:
+            return True
+
+        return not any(
+            isinstance(obj, CmisObject)
+            and obj.id in ancestor_ids
+            and _paths_changed(sa.inspect(obj))
+            for obj in state.session.dirty
+        )
+
     @property
     def is_folder(self) -> bool:
         return self.sbe_type == "cmis:folder"
@@ -228,6 +275,9 @@ class PathAndSecurityIndexable:
     def _indexable_parent_ids(self) -> str:
         """Return a string made of ids separated by a slash: "/1/3/4/5", "5"
         being self.parent.id."""
+        if isinstance(self, CmisObject) and self._has_materialized_path():
+            return self._id_path.rsplit("/", 1)[0] or "/"
+
         ids = [str(obj.id) for obj in self._iter_to_root(skip_self=True)]
         return f"/{'/'.join(reversed(ids))}"
 
@@ -235,48 +285,80 @@ class PathAndSecurityIndexable:
     def _indexable_roles_and_users(self) -> str:
         """Returns a string made of type:id elements, like "user:2 group:1
         user:6"."""
-        iter_from_root = reversed(list(self._iter_to_root()))
-        if self.parent:
-            # skip root folder only on non-root folder!
-            next(iter_from_root)
-        allowed = {o[0] for o in security.get_role_assignements(next(iter_from_root))}
-
-        for obj in iter_from_root:
-            if obj.inherit_security:
-                continue
-            obj_allowed = {o[0] for o in security.get_role_assignements(obj)}
-
-            if ANONYMOUS in obj_allowed:
-                continue
-
-            parent_allowed = allowed
-            # pure intersection: users and groups in both are preserved
-            allowed &= obj_allowed
-            remaining = parent_allowed - obj_allowed
-            # find users who can access 'obj' because of their group memberships
-            # 1. extends groups in obj_allowed with their actual member list
-            extended_allowed = set(
-                itertools.chain(
-                    *(p.members if isinstance(p, Group) else (p,) for p in obj_allowed)
-                )
-            )
-
-            # 2. remaining_users are users explicitly listed in parents but not on
-            # obj. Are they in a group?
-            remaining_users = {o for o in remaining if isinstance(o, User)}
-            allowed |= remaining_users & extended_allowed
-
-            # remaining groups: find if some users are eligible
-            remaining_groups_members = set(
-                itertools.chain(*(p.members for p in remaining if isinstance(p, Group)))
-            )
-            allowed |= remaining_groups_members - extended_allowed
-
+        allowed = set(_allowed_principals(self))
         # admin role is always granted access
         allowed.add(ADMIN)
         return " ".join(indexable_role(p) for p in allowed)
 
 
+def _allowed_principals(obj: BaseContent) -> frozenset:
+    """Principals allowed to access `obj` (admin role excluded).
+
+    During an indexing batch, results for folders are memoized so that
+    objects in the same subtree reuse the computation made for their
+    parents.
+    """
+    parent = obj.parent
+    if parent is None or parent.parent is None:
+        # root folder, or direct child of the root folder (root folder security
+        # is skipped on non-root objects)
+        return frozenset(o[0] for o in security.get_role_assignements(obj))
+
+    cache = batch_cache("documents:allowed_principals")
+    if cache is not None and obj.is_folder and obj.id in cache:
+        return cache[obj.id]
+
+    allowed = _restrict_allowed_principals(_allowed_principals(parent), obj)
+
+    if cache is not None and obj.is_folder and obj.id is not None:
+        cache[obj.id] = allowed
+    return allowed
+
+
+def _restrict_allowed_principals(allowed: frozenset, obj: BaseContent) -> frozenset:
+    """Restrict principals allowed on the parent of `obj` to those allowed on
+    `obj`."""
+    if obj.inherit_security:
+        return allowed
+
+    obj_allowed = {o[0] for o in security.get_role_assignements(obj)}
+    if ANONYMOUS in obj_allowed:
+        return allowed
+
+    # pure intersection: users and groups in both are preserved
+    result = allowed & obj_allowed
+    remaining = allowed - obj_allowed
+    # find users who can access 'obj' because of their group memberships
+    # 1. extends groups in obj_allowed with their actual member list
+    extended_allowed = set(
+        itertools.chain(
+            *(_group_members(p) if isinstance(p, Group) else (p,) for p in obj_allowed)
+        )
+    )
+
+    # 2. remaining_users are users explicitly listed in parents but not on
+    # obj. Are they in a group?
+    remaining_users = {o for o in remaining if isinstance(o, User)}
+    result |= remaining_users & extended_allowed
+
+    # remaining groups: find if some users are eligible
+    remaining_groups_members = set(
+        itertools.chain(*(_group_members(p) for p in remaining if isinstance(p, Group)))
+    )
+    result |= remaining_groups_members - extended_allowed
+    return frozenset(result)
+
+
+def _group_members(group: Group) -> Collection[User]:
+    cache = batch_cache("documents:group_members")
+    if cache is None:
+        return group.members
+
+    if group.id not in cache:
+        cache[group.id] = frozenset(group.members)
+    return cache[group.id]
+
+
 class Folder(PathAndSecurityIndexable, CmisObject):
     __tablename__ = "folder"
     sbe_type = "cmis:folder"
@@ -306,18 +388,43 @@ class Folder(PathAndSecurityIndexable, CmisObject):
 
     @property
     def document_count(self) -> int:
+        if self._has_materialized_path():
+            return folder_stats([self])[self.id].document_count
+
         count = len(self.documents)
         for f in self.subfolders:
             count += f.document_count
         return count
 
+    @property
+    def total_size(self) -> int:
+        """Sum of the sizes of all documents in this folder subtree."""
+        if self._has_materialized_path():
+            return folder_stats([self])[self.id].content_length
+
+        size = sum(d.content_length for d in self.documents)
+        for f in self.subfolders:
+            size += f.total_size
+        return size
+
     @property
     def depth(self) -> int:
+        if self._has_materialized_path():
+            return self._id_path.count("/") - 1
+
         if self.parent is None:
             return 0
 
         return self.parent.depth + 1
 
+    def query_descendants(self, model: type[CmisObject] = CmisObject) -> Query:
+        """Query all objects of this folder subtree (self excluded).
+
+        :param model: restrict to this class (i.e `Document` or `Folder`).
+        """
+        assert self._has_materialized_path()
+        return model.query.filter(model._id_path.like(f"{self._id_path}/%"))
+
     def create_subfolder(self, title: str) -> Folder:
         subfolder = Folder(title=title, parent=self)
         assert subfolder in self.children
@@ -336,6 +443,13 @@ class Folder(PathAndSecurityIndexable, CmisObject):
         if path == "/":
             return self
 
+        if self._has_materialized_path():
+            return (
+                self.query_descendants()
+                .filter(CmisObject._path == f"{self._path}{path}")
+                .first()
+            )
+
         path_segments = path[1:].split("/")
         obj = self
         try:
@@ -422,6 +536,51 @@ class Folder(PathAndSecurityIndexable, CmisObject):
         return members
 
 
+class FolderStats(NamedTuple):
+    """Aggregates over the documents of a folder subtree."""
+
+    document_count: int
+    content_length: int
+
+
+def folder_stats(folders: Sequence[Folder]) -> dict[int, FolderStats]:
+    """Count documents and sum their sizes in the subtrees of `folders`.
+
+    All folders are computed with a single grouped query, joining documents
+    to the folders their materialized id path starts with, without loading
+    any document. Folders whose materialized path is not up to date are
+    counted recursively.
+    """
+    stats = {}
+    materialized = []
+    for folder in folders:
+        if folder._has_materialized_path():
+            stats[folder.id] = FolderStats(0, 0)
+            materialized.append(folder)
+        else:
+            stats[folder.id] = FolderStats(folder.document_count, folder.total_size)
+
+    if not materialized:
+        return stats
+
+    session = sa.orm.object_session(materialized[0]) or db.session()
+    ancestor = CmisObject.__table__.alias("ancestor")
+    query = (
+        session.query(
+            ancestor.c.id,
+            sa.func.count(Document.id),
+            sa.func.coalesce(sa.func.sum(Document.content_length), 0),
+        )
+        .select_from(ancestor)
+        .join(Document, Document._id_path.like(ancestor.c.id_path + "/%"))
+        .filter(ancestor.c.id.in_([folder.id for folder in materialized]))
+        .group_by(ancestor.c.id)
+    )
+    for folder_id, count, size in query:
+        stats[folder_id] = FolderStats(count, size)
+    return stats
+
+
 class BaseContent(CmisObject):
     """A base class for cmisobject with an attached file."""
 
@@ -457,21 +616,25 @@ class BaseContent(CmisObject):
         return self.content_blob.value
 
     @content.setter
-    def content(self, value: bytes) -> None:
-        assert isinstance(value, bytes)
-        self.content_blob = Blob()
-        self.content_blob.value = value
-        self.content_length = len(value)
-
-    def set_content(self, content: bytes, content_type: str = "") -> None:
+    def content(self, value: bytes | IO[bytes]) -> None:
+        assert isinstance(value, bytes) or hasattr(value, "read")
+        self.content_blob = Blob(value)
+        self.content_length = self.content_blob.size
+
+    def set_content(self, content: bytes | IO[bytes], content_type: str = "") -> None:
+        """Set content from bytes or a stream, which is copied by chunks to the
+        blob store."""
         assert isinstance(content_type, str)
 
-        new_digest = md5(content)
+        blob = Blob(content)
+        new_digest = blob.meta.get("md5", md5(b""))
         if new_digest == self.content_digest:
+            del blob.value
             return
 
         self.content_digest = new_digest
-        self.content = content
+        self.content_blob = blob
+        self.content_length = blob.size
         content_type = self.find_content_type(content_type)
         if content_type:
             self.content_type = content_type
@@ -634,8 +797,8 @@ class Document(BaseContent, PathAndSecurityIndexable):
         return self.pdf_blob and self.pdf_blob.value
 
     @pdf.setter
-    def pdf(self, value: bytes) -> None:
-        assert isinstance(value, bytes)
+    def pdf(self, value: bytes | IO[bytes]) -> None:
+        assert isinstance(value, bytes) or hasattr(value, "read")
         self.pdf_blob = Blob()
         self.pdf_blob.value = value
 
@@ -726,6 +889,101 @@ class Document(BaseContent, PathAndSecurityIndexable):
         self.meta.changed()
 
 
+# Materialized paths
+def _paths_changed(state: InstanceState) -> bool:
+    """True if title or parent of an object have changed since last flush."""
+    return any(
+        state.attrs[name].history.has_changes()
+        for name in ("_title", "_parent_id", "parent")
+        if name in state.attrs
+    )
+
+
+def _parent_paths(connection: Connection, obj: CmisObject) -> tuple[str, str]:
+    """Return (id_path, path) of the parent of `obj`."""
+    parent = obj.__dict__.get("parent")
+    if (
+        parent is not None
+        and parent.id == obj._parent_id
+        and parent.__dict__.get("_id_path") is not None
+    ):
+        return parent._id_path, parent._path
+
+    table = CmisObject.__table__
+    query = sa.select([table.c.id_path, table.c.path]).where(
+        table.c.id == obj._parent_id
+    )
+    id_path, path = connection.execute(query).first()
+    return id_path, path
+
+
+def _store_paths(
+    connection: Connection, obj: CmisObject, id_path: str, path: str
+) -> None:
+    table = CmisObject.__table__
+    connection.execute(
+        table.update().where(table.c.id == obj.id).values(id_path=id_path, path=path)
+    )
+    set_committed_value(obj, "_id_path", id_path)
+    set_committed_value(obj, "_path", path)
+
+
+@listens_for(CmisObject, "after_insert", propagate=True)
+def _set_materialized_paths(
+    mapper: Mapper, connection: Connection, obj: CmisObject
+) -> None:
+    if obj._parent_id is None:
+        _store_paths(connection, obj, f"/{obj.id}", "")
+        return
+
+    parent_id_path, parent_path = _parent_paths(connection, obj)
+    _store_paths(
+        connection, obj, f"{parent_id_path}/{obj.id}", f"{parent_path}/{obj.title}"
+    )
+
+
+@listens_for(CmisObject, "after_update", propagate=True)
+def _update_materialized_paths(
+    mapper: Mapper, connection: Connection, obj: CmisObject
+) -> None:
+    """Update paths of `obj` and its descendants when it's moved or
+    renamed."""
+    if not _paths_changed(sa.inspect(obj)):
+        return
+
+    old_id_path, old_path = obj._id_path, obj._path
+    _set_materialized_paths(mapper, connection, obj)
+    if old_id_path is None or (old_id_path, old_path) == (obj._id_path, obj._path):
+        return
+
+    # descendants: replace the old prefix with the new one
+    table = CmisObject.__table__
+    connection.execute(
+        table.update()
+        .where(table.c.id_path.like(f"{old_id_path}/%"))
+        .values(
+            id_path=obj._id_path
+            + sa.func.substr(table.c.id_path, len(old_id_path) + 1),
+            path=obj._path + sa.func.substr(table.c.path, len(old_path) + 1),
+        )
+    )
+
+    session = sa.orm.object_session(obj)
+    for item in list(session.identity_map.values()):
+        item_id_path = item.__dict__.get("_id_path")
+        if (
+            isinstance(item, CmisObject)
+            and item_id_path
+            and (item_id_path.startswith(f"{old_id_path}/"))
+        ):
+            set_committed_value(
+                item, "_id_path", obj._id_path + item_id_path[len(old_id_path) :]
+            )
+            set_committed_value(
+                item, "_path", obj._path + item.__dict__["_path"][len(old_path) :]
+            )
+
+
 def icon_for(content_type: str) -> str:
     for extension, mime_type in mimetypes.types_map.items():
         if mime_type == content_type:
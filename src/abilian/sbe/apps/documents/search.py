@@ -16,6 +16,8 @@ from abilian.services import get_service
 from .models import CmisObject
 
 if TYPE_CHECKING:
+    from sqlalchemy.orm import Query, Session
+
     from abilian.sbe.apps.documents.models import Folder
 
 
@@ -30,6 +32,28 @@ def reindex_tree(obj: Folder) -> None:
     if not index_service.running:
         return
 
+    session = sa.orm.object_session(obj) or db.session()
+
+    if obj._has_materialized_path():
+        # "obj" is included in results, thus will be added in "to_update" without
+        # needing to do it apart.
+        entity_ids_q = sa.select([CmisObject.id]).where(
+            (CmisObject.id == obj.id) | CmisObject._id_path.like(f"{obj._id_path}/%")
+        )
+        query = session.query(Entity).filter(Entity.id.in_(entity_ids_q))
+    else:
+        query = _descendants_query(session, obj)
+
+    query = query.options(sa.orm.noload("*"))
+    to_update = index_service.app_state.to_update
+    key = "changed"
+
+    for item in query.yield_per(1000):
+        to_update.append((key, item))
+
+
+def _descendants_query(session: Session, obj: Folder) -> Query:
+    """Query `obj` and its descendants with a recursive CTE."""
     descendants = (
         sa.select([CmisObject.id, CmisObject._parent_id])
         .where(CmisObject._parent_id == sa.bindparam("ancestor_id"))
@@ -39,7 +63,6 @@ def reindex_tree(obj: Folder) -> None:
     CA = sa.orm.aliased(CmisObject)
     d_ids = sa.select([CA.id, CA._parent_id])
     descendants = descendants.union_all(d_ids.where(CA._parent_id == da.c.id))
-    session = sa.orm.object_session(obj) or db.session()
 
     # including ancestor_id in entity_ids_q will garantee at least 1 value for the
     # "IN" predicate; otherwise when using sqlite (as during tests...)
@@ -50,15 +73,8 @@ def reindex_tree(obj: Folder) -> None:
     entity_ids_q = sa.union(
         sa.select([descendants.c.id]), sa.select([sa.bindparam("ancestor_id")])
     )
-    query = (
+    return (
         session.query(Entity)
         .filter(Entity.id.in_(entity_ids_q))
-        .options(sa.orm.noload("*"))
         .params(ancestor_id=obj.id)
     )
-
-    to_update = index_service.app_state.to_update
-    key = "changed"
-
-    for item in query.yield_per(1000):
-        to_update.append((key, item))
@@ -165,10 +165,14 @@ def convert_to_pdf(doc: Document) -> None:
     logger.debug("convert_to_pdf() document={document}", document=doc)
 
     if doc.content_type == "application/pdf":
-        doc.pdf = doc.content
+        with doc.content_blob.open() as stream:
+            doc.pdf = stream
         return
     try:
-        doc.pdf = converter.to_pdf(doc.content_digest, doc.content, doc.content_type)
+        with converter.open_pdf(
+            doc.content_digest, doc.content, doc.content_type
+        ) as pdf:
+            doc.pdf = pdf
     except (HandlerNotFoundError, ConversionError) as e:
         doc.pdf = b""
         logger.info(
@@ -226,4 +230,7 @@ def extract_metadata(doc: Document) -> None:
 
         doc.language = langid.classify(doc.text)[0]
 
-    doc.page_num = doc.extra_metadata.get("PDF:Pages", 1)
+    try:
+        doc.page_num = int(doc.extra_metadata.get("PDF:Pages", 1))
+    except ValueError:
+        doc.page_num = 1
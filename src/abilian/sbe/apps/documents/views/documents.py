@@ -5,7 +5,6 @@ from __future__ import annotations
 import contextlib
 from datetime import datetime
 from typing import TYPE_CHECKING
-from urllib.parse import quote
 
 import sqlalchemy as sa
 import sqlalchemy.orm
@@ -39,6 +38,7 @@ from abilian.web import csrf, url_for
 from abilian.web.action import actions
 from abilian.web.frontend import add_to_recent_items
 from abilian.web.views import default_view
+from abilian.web.views.files import send_blob
 
 from .util import (
     breadcrumbs_for,
@@ -170,7 +170,7 @@ def document_upload(doc_id):
     check_write_access(doc)
 
     fd = request.files["file"]
-    doc.set_content(fd.read(), fd.content_type)
+    doc.set_content(fd, fd.content_type)
     del doc.lock
 
     self = unwrap(current_app)
@@ -185,23 +185,19 @@ def document_download(doc_id: int, attach: bool = False) -> Response:
     """Download the file content."""
     doc = get_document(doc_id)
 
-    response = make_response(doc.content)
-    response.headers["content-length"] = doc.content_length
-    response.headers["content-type"] = doc.content_type
-
     if not attach:
         attach = request.args.get("attach", False)
 
-    if attach or not match(
+    # Note: we omit text/html for security reasons.
+    attach = bool(attach) or not match(
         doc.content_type, ("text/plain", "application/pdf", "image/*")
-    ):
-        # Note: we omit text/html for security reasons.
-        quoted_filename = quote(doc.title.encode("utf8"))
-        response.headers["content-disposition"] = (
-            f'attachment;filename="{quoted_filename}"'
-        )
-
-    return response
+    )
+    return send_blob(
+        doc.content_blob,
+        mimetype=doc.content_type,
+        filename=doc.title if attach else None,
+        as_attachment=attach,
+    )
 
 
 @route("/doc/<int:doc_id>/checkin_checkout", methods=["POST"])
@@ -272,9 +268,10 @@ def document_preview_image(doc_id: int) -> Response:
         image = doc.content
         content_type = doc.content_type
     elif doc.content_type.startswith("image/"):
-        image = doc.content
         if size:
-            image = resize(image, size, size, mode=FIT)
+            image = resize(doc.content_blob, size, size, mode=FIT)
+        else:
+            image = doc.content
     else:
         page = int(request.args.get("page", 0))
         try:
@@ -5,22 +5,20 @@ from __future__ import annotations
 import contextlib
 import fnmatch
 import itertools
-import os
 import re
 import sys
-import tempfile
 import traceback
 from datetime import datetime
 from functools import partial
 from io import StringIO
 from itertools import takewhile
 from typing import IO, TYPE_CHECKING, Any
-from urllib.parse import quote
 from zipfile import ZipFile, is_zipfile
 
 import sqlalchemy as sa
 import whoosh.query as wq
 from flask import (
+    Response,
     current_app,
     flash,
     g,
@@ -30,8 +28,8 @@ from flask import (
     render_template,
     render_template_string,
     request,
-    send_file,
     session,
+    stream_with_context,
 )
 from flask_login import current_user
 from loguru import logger
@@ -46,9 +44,16 @@ from abilian.core.signals import activity
 from abilian.core.util import unwrap
 from abilian.i18n import _, _n
 from abilian.sbe.apps.communities.views import default_view_kw
-from abilian.sbe.apps.documents.models import Document, Folder, icon_for, icon_url
+from abilian.sbe.apps.documents.models import (
+    Document,
+    Folder,
+    folder_stats,
+    icon_for,
+    icon_url,
+)
 from abilian.sbe.apps.documents.repository import content_repository
 from abilian.sbe.apps.documents.search import reindex_tree
+from abilian.sbe.apps.documents.zipstream import zip_stream
 from abilian.services import get_service
 from abilian.services.security import READ, WRITE, Role, security
 from abilian.web import csrf, http, url_for
@@ -73,7 +78,6 @@ if TYPE_CHECKING:
     from collections.abc import Iterator
 
     from werkzeug.datastructures import FileStorage
-    from werkzeug.wrappers import Response
 
 route = community_blueprint.route
 
@@ -106,7 +110,13 @@ def folder_view(folder_id):
     folder = get_folder(folder_id)
     bc = breadcrumbs_for(folder)
     actions.context["object"] = folder
-    ctx = {"folder": folder, "children": folder.filtered_children, "breadcrumbs": bc}
+    children = folder.filtered_children
+    ctx = {
+        "folder": folder,
+        "children": children,
+        "breadcrumbs": bc,
+        "folder_stats": folder_stats([c for c in children if c.is_folder]),
+    }
 
     view_style = session.get("sbe_doc_view_style", "thumbnail_view")
     if view_style == "thumbnail_view":
@@ -753,49 +763,79 @@ def download_multiple(folder: Folder) -> Response:
     if not folders:
         folders = [folder]
 
-    def rel_path(path: str, content: Document) -> str:
-        return f"{path}/{content.title}"
-
-    def zip_folder(zipfile: ZipFile, folder: Folder, path: str = "") -> ZipFile:
-        for doc in folder.documents:
-            doc_path = rel_path(path, doc)
-            zipfile.writestr(doc_path, doc.content or b"")
-
-        for subfolder in folder.filtered_subfolders:
-            zip_folder(zipfile, subfolder, rel_path(path, subfolder))
-        return zipfile
-
-    # if using upstream send file: just create a temps file.
-    # if app is streaming itself: use NamedTemporaryFile so that file is removed
-    # on close()
-    # temp_factory = (
-    #     tempfile.mktemp if current_app.use_x_sendfile else tempfile.NamedTemporaryFile
-    # )
-    temp_factory = tempfile.NamedTemporaryFile
-    zip_fn = temp_factory(prefix=f"tmp-{current_app.name}-", suffix=".zip")
-    with ZipFile(zip_fn, "w") as zipfile:
-        for doc in docs:
-            zipfile.writestr(doc.title, doc.content or b"")
-        for subfolder in folders:
-            zip_folder(zipfile, subfolder, subfolder.title)
-
-    if not isinstance(zip_fn, str):
-        zip_fn.seek(0, os.SEEK_END)
-        size = zip_fn.tell()
-        zip_fn.seek(0)
-    else:
-        size = os.path.getsize(zip_fn)
+    entries = [(doc.title, doc) for doc in docs]
+    for subfolder in folders:
+        entries.extend(readable_documents(subfolder, subfolder.title))
 
-    resp = send_file(
-        zip_fn,
-        mimetype="application/zip",
-        as_attachment=True,
-        download_name=quote(folder.title.encode("utf8") + b".zip"),
-    )
-    resp.headers.add("Content-Length", str(size))
+    # checking the blob itself would be a call to the blob store backend
+    files = [
+        (
+            path,
+            doc.content_blob if doc._content_id is not None else None,
+            doc.content_type,
+            doc.content_length,
+        )
+        for path, doc in entries
+    ]
+
+    filename = f"{folder.title}.zip"
+    # blobs are read while streaming: keep the request context (and the
+    # database session) until the end
+    resp = Response(stream_with_context(zip_stream(files)), mimetype="application/zip")
+    resp.headers.set("Content-Disposition", "attachment", filename=filename)
     return resp
 
 
+def readable_documents(folder: Folder, path: str) -> list[tuple[str, Document]]:
+    """Documents of `folder` subtree, with their path in the subtree, skipping
+    subfolders current user can't read.
+
+    The subtree is loaded with 2 queries and permissions are checked for all
+    subfolders at once.
+    """
+    if folder._has_materialized_path():
+        subfolders = folder.query_descendants(Folder).all()
+        documents = (
+            folder.query_descendants(Document)
+            .options(sa.orm.joinedload(Document.content_blob))
+            .all()
+        )
+    else:
+        subfolders, documents = [], []
+        to_visit = [folder]
+        while to_visit:
+            current = to_visit.pop()
+            documents.extend(current.documents)
+            subfolders.extend(current.subfolders)
+            to_visit.extend(current.subfolders)
+
+    allowed = security.has_permission_batch(
+        current_user, READ, subfolders, inherit=True
+    )
+    children: dict[int, list[Folder]] = {}
+    for subfolder, ok in zip(subfolders, allowed, strict=True):
+        if ok:
+            children.setdefault(subfolder._parent_id, []).append(subfolder)
+
+    folder_documents: dict[int, list[Document]] = {}
+    for doc in documents:
+        folder_documents.setdefault(doc._parent_id, []).append(doc)
+
+    result = []
+    to_visit = [(folder, path)]
+    while to_visit:
+        current, current_path = to_visit.pop()
+        result.extend(
+            (f"{current_path}/{doc.title}", doc)
+            for doc in folder_documents.get(current.id, ())
+        )
+        to_visit.extend(
+            (subfolder, f"{current_path}/{subfolder.title}")
+            for subfolder in children.get(current.id, ())
+        )
+    return result
+
+
 def delete_multiple(folder):
     check_write_access(folder)
 
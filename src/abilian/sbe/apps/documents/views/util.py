@@ -107,7 +107,7 @@ def create_document(folder: Folder, fs: FileStorage) -> Document:
     name = get_new_filename(folder, name)
     doc = folder.create_document(title=name)
     content_type = fs.content_type or ""
-    doc.set_content(fs.read(), content_type)
+    doc.set_content(fs, content_type)
 
     if original_name != name:
         # set message after document has been successfully created!
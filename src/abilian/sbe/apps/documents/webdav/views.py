@@ -15,6 +15,7 @@ from werkzeug.wrappers import Response
 from abilian.core.extensions import db
 from abilian.sbe.apps.documents import repository
 from abilian.services import get_service
+from abilian.web.views.files import send_blob
 
 from .constants import (
     DAV_PROPS,
@@ -121,12 +122,12 @@ def get(path):
 
     obj = get_object(path)
 
-    file_name = obj.file_name.encode("utf8")
-    headers = {
-        "Content-Type": obj.content_type,
-        "Content-Disposition": f"attachment;filename={file_name}",
-    }
-    return obj.content, HTTP_OK, headers
+    return send_blob(
+        obj.content_blob,
+        mimetype=obj.content_type,
+        filename=obj.file_name,
+        as_attachment=True,
+    )
 
 
 @route("/<path:path>", methods=["MKCOL"])
@@ -167,7 +168,7 @@ def put(path):
             return "", HTTP_CONFLICT, {}
         obj = parent_folder.create_document(name=name)
 
-    obj.content = request.data
+    obj.content = request.stream
     obj.content_type = request.content_type
 
     db.session.commit()
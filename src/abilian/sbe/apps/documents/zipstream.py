@@ -0,0 +1,131 @@
+# Copyright (c) 2012-2024, Abilian SAS
+
+"""Generate ZIP archives as a stream of chunks.
+
+The archive is produced while it is sent: nothing is written to disk, and
+file contents are read by chunks.
+"""
+
+from __future__ import annotations
+
+import io
+import time
+from pathlib import Path
+from typing import IO, TYPE_CHECKING
+from zipfile import ZIP_DEFLATED, ZIP_STORED, ZipFile, ZipInfo
+
+if TYPE_CHECKING:
+    from collections.abc import Iterable, Iterator
+
+    from abilian.core.models.blob import Blob
+
+__all__ = ["ZipEntry", "is_compressed", "zip_stream"]
+
+#: (name in archive, file path, :class:`Blob` or `None` for an empty file,
+#: content type, size in bytes if known)
+ZipEntry = tuple[str, "Path | Blob | None", str, "int | None"]
+
+CHUNK_SIZE = 64 * 1024
+
+#: content types that are already compressed: they are stored as is.
+COMPRESSED_TYPES = frozenset(
+    {
+        "application/gzip",
+        "application/pdf",
+        "application/vnd.rar",
+        "application/x-7z-compressed",
+        "application/x-bzip2",
+        "application/x-gzip",
+        "application/x-rar-compressed",
+        "application/x-xz",
+        "application/zip",
+        "image/gif",
+        "image/jpeg",
+        "image/png",
+        "image/webp",
+    }
+)
+
+#: content type prefixes of compressed formats (media, office documents
+#: which are zip files)
+COMPRESSED_PREFIXES = (
+    "audio/",
+    "video/",
+    "application/vnd.oasis.opendocument.",
+    "application/vnd.openxmlformats-officedocument.",
+)
+
+
+def is_compressed(content_type: str) -> bool:
+    content_type = (content_type or "").split(";")[0].strip().lower()
+    return content_type in COMPRESSED_TYPES or content_type.startswith(
+        COMPRESSED_PREFIXES
+    )
+
+
+def _open_source(source: Path | Blob, size: int | None) -> tuple[int, IO[bytes]]:
+    """Return size and a binary stream of an entry content.
+
+    `size` is looked up only if unknown: it is a remote call for blobs stored
+    in object storage.
+    """
+    if isinstance(source, Path):
+        return source.stat().st_size, source.open("rb")
+    if size is None:
+        size = source.size
+    return size, source.open()
+
+
+class _ChunkBuffer(io.RawIOBase):
+    """Unseekable output for :class:`ZipFile`, emptied after each chunk."""
+
+    def __init__(self) -> None:
+        super().__init__()
+        self._chunks: list[bytes] = []
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def take(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def zip_stream(entries: Iterable[ZipEntry]) -> Iterator[bytes]:
+    """Yield the content of a ZIP archive made of `entries`.
+
+    Files in compressed formats are stored, other ones are deflated.
+    """
+    buffer = _ChunkBuffer()
+    date_time = time.localtime()[:6]
+
+    with ZipFile(buffer, "w", allowZip64=True) as zipfile:
+        for name, source, content_type, known_size in entries:
+            info = ZipInfo(name, date_time=date_time)
+            info.compress_type = (
+                ZIP_STORED if is_compressed(content_type) else ZIP_DEFLATED
+            )
+            if source is None:
+                size, src = 0, None
+            else:
+                size, src = _open_source(source, known_size)
+            # known size lets zipfile choose whether zip64 is needed
+            info.file_size = size
+
+            with zipfile.open(info, "w") as dest:
+                if src is not None:
+                    with src:
+                        while chunk := src.read(CHUNK_SIZE):
+                            dest.write(chunk)
+                            if data := buffer.take():
+                                yield data
+
+            if data := buffer.take():
+                yield data
+
+    yield buffer.take()
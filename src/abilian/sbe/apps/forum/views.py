@@ -80,13 +80,11 @@ def get_viewed_posts(entities):
         return None
 
     views = viewtracker.get_views(entities=entities, user=current_user)
-    all_hits = viewtracker.get_hits(views=views)
     nb_viewed_posts = {}
     for view in views:
-        related_hits = [hit for hit in all_hits if hit.view_id == view.id]
         entity = view.entity
         if entity in entities:
-            cutoff = related_hits[-1].viewed_at
+            cutoff = view.last_viewed_at
             nb_viewed_posts[entity] = len(
                 [post for post in entity.posts if post.created_at > cutoff]
             )
@@ -107,18 +105,11 @@ def get_viewed_times(entities):
             if view.user != view.entity.creator and view.user in g.community.members
         ]
 
-        all_hits = viewtracker.get_hits(views=views)
-        views_id = [view.view_id for view in all_hits]
-
-        viewed_times = Counter(views_id)
-        entity_viewed_times = {}
+        entity_viewed_times = Counter()
         for view in views:
-            if view.entity not in entity_viewed_times:
-                entity_viewed_times[view.entity] = viewed_times[view.id]
-            else:
-                entity_viewed_times[view.entity] += viewed_times[view.id]
+            entity_viewed_times[view.entity] += view.hit_count
 
-        return entity_viewed_times
+        return dict(entity_viewed_times)
     return None
 
 
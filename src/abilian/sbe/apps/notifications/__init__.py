@@ -16,6 +16,9 @@ TOKEN_SERIALIZER_NAME = "unsubscribe_sbe"  # noqa: S105
 def register_plugin(app: Application) -> None:
     cfg = app.config.setdefault("ABILIAN_SBE", {})
     cfg.setdefault("DAILY_SOCIAL_DIGEST_SUBJECT", "Des nouvelles de vos communautés")
+    # messages sent over one SMTP connection, and concurrent connections
+    cfg.setdefault("DAILY_SOCIAL_DIGEST_BATCH_SIZE", 50)
+    cfg.setdefault("DAILY_SOCIAL_DIGEST_WORKERS", 4)
 
     # TODO: Slightly confusing. Reorg?
     # from .tasks.social import DEFAULT_DIGEST_SCHEDULE, DIGEST_TASK_NAME
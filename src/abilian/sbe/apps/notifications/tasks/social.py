@@ -2,7 +2,10 @@
 
 from __future__ import annotations
 
+import copy
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
 from datetime import datetime, timedelta
+from itertools import islice
 from typing import TYPE_CHECKING
 
 import html2text
@@ -10,10 +13,12 @@ from flask import current_app
 from flask_mail import Message
 from loguru import logger
 from sqlalchemy import and_, or_
+from sqlalchemy.orm import selectinload
 from validate_email import validate_email
 
 from abilian.core.dramatiq.scheduler import crontab
 from abilian.core.dramatiq.singleton import dramatiq
+from abilian.core.extensions import db
 from abilian.core.models.subjects import User
 from abilian.core.util import md5
 from abilian.i18n import render_template_i18n
@@ -22,12 +27,14 @@ from abilian.sbe.apps.documents.repository import content_repository
 from abilian.sbe.apps.forum.models import Post, Thread
 from abilian.sbe.apps.notifications import TOKEN_SERIALIZER_NAME
 from abilian.sbe.apps.wiki.models import WikiPage
-from abilian.services import get_service
 from abilian.services.activity import ActivityEntry
 from abilian.services.auth.views import get_serializer
+from abilian.services.preferences.models import UserPreference
 from abilian.web import url_for
 
 if TYPE_CHECKING:
+    from collections.abc import Iterable, Iterator
+
     from abilian.core.entities import Entity
     from abilian.sbe.apps.communities.models import Community
 
@@ -45,21 +52,162 @@ def send_daily_social_digest_task() -> None:
 
 
 def send_daily_social_digest() -> None:
-    for user in User.query.filter(User.can_login == True).all():
-        preferences = get_service("preferences")
-        prefs = preferences.get_preferences(user)
+    """Send the daily digest to all users who asked for it.
 
-        if not prefs.get("sbe:notifications:daily", False):
-            continue
+    Activities of each community are loaded and digested once, then filtered
+    for each member. Messages are sent in batches of
+    `DAILY_SOCIAL_DIGEST_BATCH_SIZE`, each over its own SMTP connection, by
+    `DAILY_SOCIAL_DIGEST_WORKERS` concurrent workers.
+    """
+    users = get_digest_recipients()
+    communities = {
+        membership.community
+        for user in users
+        for membership in user.communautes_membership
+        if membership.community
+    }
+    happened_after = datetime.utcnow() - timedelta(days=1)
+    digests = load_community_digests(communities, happened_after)
 
-        # Defensive programming.
-        if not validate_email(user.email):
-            continue
+    send_messages(iter_messages(users, digests))
 
+
+def iter_messages(
+    users: Iterable[User], digests: dict[int, CommunityDigest]
+) -> Iterator[Message]:
+    for user in users:
         try:
-            send_daily_social_digest_to(user)
-        except BaseException:
-            logger.opt(exception=True).exception("Error sending daily social digest")
+            message = make_message(user, digests)
+        except Exception:
+            logger.opt(exception=True).exception("Error making daily social digest")
+            continue
+        if message:
+            yield message
+
+
+def get_digest_recipients() -> list[User]:
+    """Users who can log in and have subscribed to the daily digest."""
+    subscribed = (
+        db.session.query(UserPreference.user_id, UserPreference.value)
+        .filter(UserPreference.key == "sbe:notifications:daily")
+        .all()
+    )
+    user_ids = [user_id for user_id, value in subscribed if value]
+    if not user_ids:
+        return []
+
+    users = (
+        User.query.filter(User.can_login == True, User.id.in_(user_ids))
+        .options(selectinload(User.communautes_membership))
+        .order_by(User.id)
+        .all()
+    )
+    # Defensive programming.
+    return [user for user in users if validate_email(user.email)]
+
+
+def load_community_digests(
+    communities: Iterable[Community], happened_after: datetime
+) -> dict[int, CommunityDigest]:
+    """Digests of the activities in `communities` since `happened_after`,
+    by community id.
+
+    Digests are not filtered for a user: see :meth:`CommunityDigest.for_user`.
+    """
+    by_id = {community.id: community for community in communities}
+    if not by_id:
+        return {}
+
+    object_type = next(iter(by_id.values())).object_type
+    community_ids = list(by_id)
+    AE = ActivityEntry
+    activities = (
+        AE.query.order_by(AE.happened_at.asc())
+        .filter(
+            and_(
+                AE.happened_at > happened_after,
+                or_(
+                    and_(
+                        AE.target_type == object_type,
+                        AE.target_id.in_(community_ids),
+                    ),
+                    and_(
+                        AE.object_type == object_type,
+                        AE.object_id.in_(community_ids),
+                    ),
+                ),
+            )
+        )
+        .all()
+    )
+
+    digests = {
+        community_id: CommunityDigest(community)
+        for community_id, community in by_id.items()
+    }
+    for activity in activities:
+        if activity.target_type == object_type and activity.target_id in digests:
+            digests[activity.target_id].update_from_activity(activity)
+        if activity.object_type == object_type and activity.object_id in digests:
+            digests[activity.object_id].update_from_activity(activity)
+
+    return {
+        community_id: digest
+        for community_id, digest in digests.items()
+        if not digest.is_empty()
+    }
+
+
+def send_messages(messages: Iterable[Message]) -> int:
+    """Send `messages` in batches, concurrently.
+
+    Messages are rendered lazily, while previous batches are being sent:
+    only a few batches are held in memory at a time.
+
+    Return the number of messages sent.
+    """
+    app = current_app._get_current_object()
+    mail = app.extensions["mail"]
+    sbe_config = app.config["ABILIAN_SBE"]
+    batch_size = sbe_config["DAILY_SOCIAL_DIGEST_BATCH_SIZE"]
+    workers = sbe_config["DAILY_SOCIAL_DIGEST_WORKERS"]
+
+    def send_batch(batch: list[Message]) -> int:
+        sent = 0
+        with app.app_context():
+            # an unreachable mail server must not stop the other batches
+            try:
+                with mail.connect() as connection:
+                    for message in batch:
+                        try:
+                            connection.send(message)
+                        except Exception:
+                            logger.opt(exception=True).exception(
+                                "Error sending daily social digest"
+                            )
+                        else:
+                            sent += 1
+            except Exception:
+                logger.opt(exception=True).exception(
+                    "Error connecting to the mail server: {count} daily social "
+                    "digests not sent",
+                    count=len(batch) - sent,
+                )
+        return sent
+
+    sent = 0
+    pending: set[Future] = set()
+    messages = iter(messages)
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        while batch := list(islice(messages, batch_size)):
+            if len(pending) >= 2 * workers:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                sent += sum(future.result() for future in done)
+            pending.add(executor.submit(send_batch, batch))
+
+        sent += sum(future.result() for future in pending)
+
+    return sent
 
 
 def send_daily_social_digest_to(user: User) -> int:
@@ -76,15 +224,21 @@ def send_daily_social_digest_to(user: User) -> int:
     return 0
 
 
-def make_message(user: User) -> Message | None:
+def make_message(
+    user: User, digests: dict[int, CommunityDigest] | None = None
+) -> Message | None:
+    """Make the daily digest message for `user`.
+
+    :param digests: digests of communities by id, as returned by
+        :func:`load_community_digests`. They are loaded for the communities
+        of `user` if not provided.
+    """
     config = current_app.config
     sender = config.get("BULK_MAIL_SENDER", config["MAIL_SENDER"])
     sbe_config = config["ABILIAN_SBE"]
     subject = sbe_config["DAILY_SOCIAL_DIGEST_SUBJECT"]
 
     recipient = user.email
-    digests = []
-    happened_after = datetime.utcnow() - timedelta(days=1)
     list_id = '"{} daily digest" <daily.digest.{}>'.format(
         config["SITE_NAME"], config.get("SERVER_NAME", "example.com")
     )
@@ -96,45 +250,26 @@ def make_message(user: User) -> Message | None:
         "Precedence": "bulk",
     }
 
-    for membership in user.communautes_membership:
-        community = membership.community
-        if not community:
-            # TODO: should not happen but it does. Fix root cause instead.
+    # TODO: communities should not be None but they can be. Fix root cause.
+    communities = [
+        membership.community
+        for membership in user.communautes_membership
+        if membership.community
+    ]
+    if digests is None:
+        happened_after = datetime.utcnow() - timedelta(days=1)
+        digests = load_community_digests(communities, happened_after)
+
+    user_digests = []
+    for community in communities:
+        shared_digest = digests.get(community.id)
+        if shared_digest is None:
             continue
-        # create an empty digest
-        digest = CommunityDigest(community)
-        AE = ActivityEntry
-        activities = (
-            AE.query.order_by(AE.happened_at.asc())
-            .filter(
-                and_(
-                    AE.happened_at > happened_after,
-                    or_(
-                        and_(
-                            AE.target_type == community.object_type,
-                            AE.target_id == community.id,
-                        ),
-                        and_(
-                            AE.object_type == community.object_type,
-                            AE.object_id == community.id,
-                        ),
-                    ),
-                )
-            )
-            .all()
-        )
-
-        # fill the internal digest lists with infos
-        # seen_entities, new_members, new_documents, updated_documents ...
-        for activity in activities:
-            digest.update_from_activity(activity, user)
-        # if activities:
-        #   import ipdb; ipdb.set_trace()
-        # save the current digest in the master digests list
+        digest = shared_digest.for_user(user)
         if not digest.is_empty():
-            digests.append(digest)
+            user_digests.append(digest)
 
-    if not digests:
+    if not user_digests:
         return None
 
     token = generate_unsubscribe_token(user)
@@ -150,7 +285,7 @@ def make_message(user: User) -> Message | None:
     msg = Message(
         subject, sender=sender, recipients=[recipient], extra_headers=extra_headers
     )
-    ctx = {"digests": digests, "token": token, "unsubscribe_url": unsubscribe_url}
+    ctx = {"digests": user_digests, "token": token, "unsubscribe_url": unsubscribe_url}
     msg.html = render_template_i18n("notifications/daily-social-digest.html", **ctx)
     msg.body = html2text.html2text(msg.html)
     return msg
@@ -189,7 +324,27 @@ class CommunityDigest:
             and not self.updated_wiki_pages
         )
 
-    def update_from_activity(self, activity, user) -> None:
+    def for_user(self, user: User) -> CommunityDigest:
+        """Copy of this digest without the documents `user` can't access."""
+        digest = copy.copy(self)
+        digest.new_documents = [
+            doc
+            for doc in self.new_documents
+            if content_repository.has_access(user, doc)
+        ]
+        digest.updated_documents = [
+            doc
+            for doc in self.updated_documents
+            if content_repository.has_access(user, doc)
+        ]
+        return digest
+
+    def update_from_activity(self, activity, user: User | None = None) -> None:
+        """Add `activity` to the digest.
+
+        If `user` is not set, documents are not filtered for access: use
+        :meth:`for_user` to filter them later.
+        """
         actor = activity.actor
         obj = activity.object
 
@@ -216,7 +371,7 @@ class CommunityDigest:
 
         self.seen_entities.add(obj.id)
 
-        if isinstance(obj, Document) and content_repository.has_access(user, obj):
+        if isinstance(obj, Document) and self._has_access(user, obj):
             self.new_documents.append(obj)
         elif isinstance(obj, WikiPage):
             self.new_wiki_pages.append(obj)
@@ -258,5 +413,9 @@ class CommunityDigest:
         self.seen_entities.add(obj.id)
 
         # all objects here need to be accounted only once
-        if isinstance(obj, Document) and content_repository.has_access(user, obj):
+        if isinstance(obj, Document) and self._has_access(user, obj):
             self.updated_documents.append(obj)
+
+    @staticmethod
+    def _has_access(user: User | None, document: Document) -> bool:
+        return user is None or content_repository.has_access(user, document)
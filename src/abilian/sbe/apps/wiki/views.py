@@ -5,14 +5,12 @@ from __future__ import annotations
 import difflib
 from pathlib import Path
 from typing import TYPE_CHECKING, Any
-from urllib.parse import quote
 
 import sqlalchemy as sa
 from flask import (
     current_app,
     flash,
     g,
-    make_response,
     redirect,
     render_template,
     request,
@@ -38,6 +36,7 @@ from abilian.web.nav import BreadcrumbItem
 from abilian.web.util import url_for
 from abilian.web.views import ObjectCreate, ObjectEdit, ObjectView, default_view
 from abilian.web.views.base import Redirect
+from abilian.web.views.files import send_blob
 
 from .forms import WikiPageForm
 from .models import WikiPage, WikiPageAttachment, WikiPageRevision
@@ -403,13 +402,12 @@ def attachment_download() -> Response:
     assert attachment is not None
     assert attachment.wikipage is page
 
-    response = make_response(attachment.content)
-    response.headers["content-length"] = attachment.content_length
-    response.headers["content-type"] = attachment.content_type
-    filename = quote(attachment.name.encode("utf8"))
-    content_disposition = f'attachment;filename="{filename}"'
-    response.headers["content-disposition"] = content_disposition
-    return response
+    return send_blob(
+        attachment.content_blob,
+        mimetype=attachment.content_type,
+        filename=attachment.name,
+        as_attachment=True,
+    )
 
 
 @route("/attachments", methods=["POST"])
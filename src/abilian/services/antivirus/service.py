@@ -85,8 +85,8 @@ class AntiVirusService(Service):
         content = file_or_stream
         if isinstance(file_or_stream, Blob):
             try:
-                file_or_stream = bytes(file_or_stream.file)
-            except TypeError as e:
+                content = file_or_stream.open()
+            except KeyError as e:
                 self.logger.warning("Error during content scan: {error}", error=str(e))
                 return None
 
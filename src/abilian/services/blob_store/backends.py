@@ -0,0 +1,308 @@
+# Copyright (c) 2012-2024, Abilian SAS
+
+"""Storage backends of the blob store.
+
+A backend stores files by key, a relative path using `/` as separator (i.e
+`ab/cd/abcdef...`). :class:`LocalBackend` stores them in one or several
+local directories, :class:`S3Backend` in a bucket of an S3-compatible
+object storage.
+
+Content is always read and written as streams: callers never assume that
+a file exists on the local file system, except through
+:meth:`BlobBackend.local_path` which only local backends implement.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import os
+import shutil
+from pathlib import Path
+from typing import IO, TYPE_CHECKING, Any
+
+if TYPE_CHECKING:
+    from collections.abc import Iterator, Sequence
+
+__all__ = ["BlobBackend", "LocalBackend", "S3Backend"]
+
+
+class BlobBackend:
+    """Interface of blob store backends.
+
+    Methods raise :class:`KeyError` when no file is stored for a key.
+    """
+
+    def open(self, key: str) -> IO[bytes]:
+        """Return a binary stream on the file stored with `key`."""
+        raise NotImplementedError
+
+    def put(self, key: str, path: Path) -> None:
+        """Store the local file `path` with `key`, replacing any existing one.
+
+        `path` is consumed: it is moved or removed once stored.
+        """
+        raise NotImplementedError
+
+    def delete(self, key: str) -> None:
+        raise NotImplementedError
+
+    def exists(self, key: str) -> bool:
+        raise NotImplementedError
+
+    def size(self, key: str) -> int:
+        """Return size in bytes of file stored with `key`."""
+        raise NotImplementedError
+
+    def touch(self, key: str) -> None:
+        """Update modification time of file stored with `key`."""
+        raise NotImplementedError
+
+    def mtime(self, key: str) -> float:
+        """Return modification time (as a timestamp) of file stored with
+        `key`."""
+        raise NotImplementedError
+
+    def iter_files(self, prefix: str) -> Iterator[tuple[str, int, float]]:
+        """Yield key, size and modification time (as a timestamp) of files
+        whose key starts with `prefix`."""
+        raise NotImplementedError
+
+    def local_path(self, key: str) -> Path | None:
+        """Return the path of the file stored with `key` on the local file
+        system, or `None` if it doesn't exist or is not stored locally."""
+        return None
+
+
+class LocalBackend(BlobBackend):
+    """Files stored in local directories.
+
+    With several directories (i.e on distinct disks), files are spread
+    between them according to a hash of their key. Files are looked up in
+    the other directories too, so directories can be added to an existing
+    store without moving files.
+
+    :param:roots: directories of the store. The first one also holds
+        temporary files.
+    """
+
+    def __init__(self, roots: Sequence[Path]) -> None:
+        if not roots:
+            msg = "At least one directory is required"
+            raise ValueError(msg)
+        self.roots = [Path(root) for root in roots]
+
+    @property
+    def root(self) -> Path:
+        return self.roots[0]
+
+    def shard_path(self, key: str) -> Path:
+        """Return the path where file with `key` is written."""
+        if len(self.roots) == 1:
+            index = 0
+        else:
+            digest = hashlib.sha1(key.encode()).digest()  # noqa: S324
+            index = int.from_bytes(digest[:4], "big") % len(self.roots)
+
+        root = self.roots[index]
+        path = root / key
+        assert root in path.parents
+        return path
+
+    def _find(self, key: str) -> Path:
+        path = self.shard_path(key)
+        if path.exists():
+            return path
+
+        for root in self.roots:
+            path = root / key
+            if path.exists():
+                return path
+
+        raise KeyError(key)
+
+    def open(self, key: str) -> IO[bytes]:
+        return self._find(key).open("rb")
+
+    def put(self, key: str, path: Path) -> None:
+        dest = self.shard_path(key)
+        if not dest.parent.exists():
+            dest.parent.mkdir(0o775, parents=True, exist_ok=True)
+
+        # remove copies left in other directories
+        for root in self.roots:
+            other = root / key
+            if other != dest:
+                other.unlink(missing_ok=True)
+
+        try:
+            path.replace(dest)
+        except OSError:
+            # not on the same file system: copy, then rename in place
+            tmp_path = dest.with_name(f".{dest.name}.{os.getpid()}.part")
+            try:
+                shutil.copyfile(path, tmp_path)
+                tmp_path.replace(dest)
+            except BaseException:
+                tmp_path.unlink(missing_ok=True)
+                raise
+            path.unlink()
+
+    def delete(self, key: str) -> None:
+        self._find(key).unlink()
+
+    def exists(self, key: str) -> bool:
+        try:
+            self._find(key)
+        except KeyError:
+            return False
+        return True
+
+    def size(self, key: str) -> int:
+        return self._find(key).stat().st_size
+
+    def touch(self, key: str) -> None:
+        os.utime(self._find(key))
+
+    def mtime(self, key: str) -> float:
+        return self._find(key).stat().st_mtime
+
+    def iter_files(self, prefix: str) -> Iterator[tuple[str, int, float]]:
+        for root in self.roots:
+            top = root / prefix
+            if not top.exists():
+                continue
+            for path in top.rglob("*"):
+                if path.name.startswith(".") or not path.is_file():
+                    continue
+                stat = path.stat()
+                yield path.relative_to(root).as_posix(), stat.st_size, stat.st_mtime
+
+    def local_path(self, key: str) -> Path | None:
+        try:
+            return self._find(key)
+        except KeyError:
+            return None
+
+
+#: system metadata of objects, replaced along with user metadata on copy
+_COPIED_HEADERS = (
+    "CacheControl",
+    "ContentDisposition",
+    "ContentEncoding",
+    "ContentLanguage",
+    "ContentType",
+)
+
+
+def _is_not_found(error: Exception) -> bool:
+    response = getattr(error, "response", None) or {}
+    code = response.get("Error", {}).get("Code")
+    return code in {"404", "NoSuchKey", "NotFound"}
+
+
+class S3Backend(BlobBackend):
+    """Files stored in a bucket of an S3-compatible object storage.
+
+    :param:client: a `boto3` S3 client, or any object with the same API
+        (see :meth:`from_config`).
+    :param:bucket: name of the bucket.
+    :param:prefix: prefix of keys in the bucket, to share a bucket between
+        applications.
+    """
+
+    def __init__(self, client: Any, bucket: str, prefix: str = "") -> None:
+        self.client = client
+        self.bucket = bucket
+        self.prefix = prefix.strip("/") + "/" if prefix.strip("/") else ""
+
+    @classmethod
+    def from_config(cls, config: dict[str, Any]) -> S3Backend:
+        """Create backend from `BLOB_STORE_S3_*` application settings.
+
+        `boto3` must be installed.
+        """
+        import boto3
+
+        client = boto3.client(
+            "s3",
+            endpoint_url=config.get("BLOB_STORE_S3_ENDPOINT_URL"),
+            region_name=config.get("BLOB_STORE_S3_REGION"),
+            aws_access_key_id=config.get("BLOB_STORE_S3_ACCESS_KEY"),
+            aws_secret_access_key=config.get("BLOB_STORE_S3_SECRET_KEY"),
+        )
+        return cls(
+            client,
+            config["BLOB_STORE_S3_BUCKET"],
+            config.get("BLOB_STORE_S3_PREFIX", ""),
+        )
+
+    def _key(self, key: str) -> str:
+        return self.prefix + key
+
+    def _head(self, key: str) -> dict[str, Any]:
+        try:
+            return self.client.head_object(Bucket=self.bucket, Key=self._key(key))
+        except Exception as e:
+            if _is_not_found(e):
+                raise KeyError(key) from e
+            raise
+
+    def open(self, key: str) -> IO[bytes]:
+        try:
+            response = self.client.get_object(Bucket=self.bucket, Key=self._key(key))
+        except Exception as e:
+            if _is_not_found(e):
+                raise KeyError(key) from e
+            raise
+        return response["Body"]
+
+    def put(self, key: str, path: Path) -> None:
+        with path.open("rb") as file:
+            self.client.upload_fileobj(file, self.bucket, self._key(key))
+        path.unlink()
+
+    def delete(self, key: str) -> None:
+        self._head(key)
+        self.client.delete_object(Bucket=self.bucket, Key=self._key(key))
+
+    def exists(self, key: str) -> bool:
+        try:
+            self._head(key)
+        except KeyError:
+            return False
+        return True
+
+    def size(self, key: str) -> int:
+        return self._head(key)["ContentLength"]
+
+    def touch(self, key: str) -> None:
+        # objects are immutable: copying an object onto itself updates its
+        # modification time. Such a copy must replace the metadata: the
+        # current one is passed, or it would be erased.
+        head = self._head(key)
+        headers = {name: head[name] for name in _COPIED_HEADERS if head.get(name)}
+        full_key = self._key(key)
+        try:
+            self.client.copy_object(
+                Bucket=self.bucket,
+                Key=full_key,
+                CopySource={"Bucket": self.bucket, "Key": full_key},
+                MetadataDirective="REPLACE",
+                Metadata=head.get("Metadata", {}),
+                **headers,
+            )
+        except Exception as e:
+            if _is_not_found(e):
+                raise KeyError(key) from e
+            raise
+
+    def mtime(self, key: str) -> float:
+        return self._head(key)["LastModified"].timestamp()
+
+    def iter_files(self, prefix: str) -> Iterator[tuple[str, int, float]]:
+        paginator = self.client.get_paginator("list_objects_v2")
+        pages = paginator.paginate(Bucket=self.bucket, Prefix=self._key(prefix))
+        for page in pages:
+            for item in page.get("Contents", ()):
+                key = item["Key"][len(self.prefix) :]
+                yield key, item["Size"], item["LastModified"].timestamp()
@@ -3,14 +3,17 @@
 from __future__ import annotations
 
 import contextlib
+import hashlib
 import shutil
+import time
 import typing
 import weakref
 from pathlib import Path
-from typing import IO, Any
-from uuid import UUID, uuid1
+from typing import IO, Any, NamedTuple
+from uuid import UUID, uuid1, uuid4
 
 import sqlalchemy as sa
+from filelock import FileLock
 from flask import g
 
 # import sqlalchemy.event
@@ -20,7 +23,11 @@ from sqlalchemy.orm.session import Session, SessionTransaction
 from abilian.core.extensions import db
 from abilian.services import Service, ServiceState
 
+from .backends import BlobBackend, LocalBackend, S3Backend
+
 if typing.TYPE_CHECKING:
+    from collections.abc import Collection, Iterator
+
     from sqlalchemy.engine.base import Connection
     from sqlalchemy.orm.unitofwork import UOWTransaction
 
@@ -30,6 +37,26 @@ if typing.TYPE_CHECKING:
 
 _NULL_MARK = object()
 
+#: size of chunks read when copying a stream into the store
+CHUNK_SIZE = 64 * 1024
+
+#: directory of content-addressed files, relative to the blob store top
+#: directory
+CAS_DIR = "cas"
+
+#: lock file, relative to the blob store top directory, serializing reuse and
+#: garbage collection of content-addressed files between processes of a host
+GC_LOCK = ".gc.lock"
+
+
+class StoredContent(NamedTuple):
+    """md5 and sha256 hexdigests, and size in bytes of content written to the
+    store."""
+
+    md5: str
+    size: int
+    sha256: str
+
 
 def _assert_uuid(uuid: Any) -> None:
     if not isinstance(uuid, UUID):
@@ -37,13 +64,71 @@ def _assert_uuid(uuid: Any) -> None:
         raise TypeError(msg, uuid)
 
 
+def _iter_chunks(content: IO | bytes | str, encoding: str | None) -> Iterator[bytes]:
+    encoding = encoding or "utf-8"
+    if not hasattr(content, "read"):
+        yield content.encode(encoding) if isinstance(content, str) else content
+        return
+
+    while chunk := content.read(CHUNK_SIZE):
+        yield chunk.encode(encoding) if isinstance(chunk, str) else chunk
+
+
+def write_file(
+    dest: Path, content: IO | bytes | str, encoding: str | None = "utf-8"
+) -> StoredContent:
+    """Write `content` to `dest`.
+
+    Streams are read by chunks, and digests and size are computed while
+    copying.
+    Content is written to a temporary file renamed to `dest` when complete,
+    thus `dest` is never seen partially written.
+
+    :param:content: string, bytes, or any object with a `read()` method
+    :param:encoding: encoding to use when content is Unicode
+    """
+    if not dest.parent.exists():
+        dest.parent.mkdir(0o775, parents=True, exist_ok=True)
+
+    digest = hashlib.md5()  # noqa: S324
+    strong_digest = hashlib.sha256()
+    size = 0
+    tmp_path = dest.with_name(f".{dest.name}.{uuid4().hex}.part")
+    try:
+        with tmp_path.open("xb") as file:
+            for chunk in _iter_chunks(content, encoding):
+                digest.update(chunk)
+                strong_digest.update(chunk)
+                size += len(chunk)
+                file.write(chunk)
+        tmp_path.replace(dest)
+    except BaseException:
+        tmp_path.unlink(missing_ok=True)
+        raise
+
+    return StoredContent(digest.hexdigest(), size, strong_digest.hexdigest())
+
+
 class BlobStoreServiceState(ServiceState):
     #: :class:`Path` path to application repository
     path: Path | None = None
+    #: where files are actually stored
+    backend: BlobBackend
+    #: store new content once per sha256 (`BLOB_STORE_CONTENT_ADDRESSED`)
+    content_addressed: bool = False
 
 
 class BlobStoreService(Service):
-    """Service for storage of binary objects referenced in database."""
+    """Service for storage of binary objects referenced in database.
+
+    Files are stored by a :class:`~.backends.BlobBackend`, chosen with
+    `BLOB_STORE_BACKEND`:
+
+    * `"local"` (default): in the `files` directory of the application data
+      directory, and the directories listed in `BLOB_STORE_DIRS` if any.
+    * `"s3"`: in an S3-compatible object storage, configured with the
+      `BLOB_STORE_S3_*` settings.
+    """
 
     name = "blob_store"
     AppStateClass = BlobStoreServiceState
@@ -57,6 +142,32 @@ class BlobStoreService(Service):
 
         with app.app_context():
             self.app_state.path = path.resolve()
+            self.app_state.content_addressed = app.config.get(
+                "BLOB_STORE_CONTENT_ADDRESSED", False
+            )
+            self.app_state.backend = self._make_backend(app, self.app_state.path)
+
+    @staticmethod
+    def _make_backend(app: Application, path: Path) -> BlobBackend:
+        kind = app.config.get("BLOB_STORE_BACKEND", "local")
+        if kind == "local":
+            extra_dirs = [Path(d) for d in app.config.get("BLOB_STORE_DIRS", ())]
+            return LocalBackend([path, *extra_dirs])
+        if kind == "s3":
+            return S3Backend.from_config(app.config)
+
+        msg = f"Unknown blob store backend: {kind!r}"
+        raise ValueError(msg)
+
+    @property
+    def backend(self) -> BlobBackend:
+        return self.app_state.backend
+
+    @property
+    def content_addressed(self) -> bool:
+        """True if new content is stored by sha256, shared between blobs
+        with the same content."""
+        return self.app_state.content_addressed
 
     # data management: paths and accessors
     def rel_path(self, uuid: UUID) -> Path:
@@ -83,42 +194,157 @@ class BlobStoreService(Service):
         assert top in dest.parents
         return dest
 
-    def get(self, uuid: UUID, default: Path | None = None) -> Path | None:
+    def hash_key(self, content_hash: str) -> str:
+        """Return backend key of content-addressed file with given sha256
+        hexdigest."""
+        if len(content_hash) != 64 or not content_hash.isalnum():
+            msg = "Not a sha256 hexdigest"
+            raise ValueError(msg, content_hash)
+
+        return f"{CAS_DIR}/{content_hash[0:2]}/{content_hash[2:4]}/{content_hash}"
+
+    def hash_path(self, content_hash: str) -> Path:
+        """Return absolute :class:`Path` object for content-addressed file
+        with given sha256 hexdigest."""
+        return self.app_state.path / self.hash_key(content_hash)
+
+    def _key(self, uuid: UUID, content_hash: str | None = None) -> str:
+        _assert_uuid(uuid)
+        if content_hash:
+            return self.hash_key(content_hash)
+        return self.rel_path(uuid).as_posix()
+
+    def get(
+        self, uuid: UUID, default: Path | None = None, content_hash: str | None = None
+    ) -> Path | None:
         """Return absolute :class:`Path` object for given uuid, if this uuid
-        exists in blob store, or `default` if it doesn't.
+        exists in blob store and is stored on the local file system, or
+        `default` if it doesn't.
+
+        Prefer :meth:`open`, which works with all backends.
 
         :param:uuid: :class:`UUID` instance
+        :param:content_hash: if set, content is looked up by this sha256
+            instead of the uuid.
         """
-        _assert_uuid(uuid)
-
-        path = self.abs_path(uuid)
-        if not path.exists():
+        path = self.backend.local_path(self._key(uuid, content_hash))
+        if path is None:
             return default
         return path
 
-    def set(self, uuid: UUID, content: Any, encoding: str | None = "utf-8") -> None:
+    def open(self, uuid: UUID, content_hash: str | None = None) -> IO[bytes]:
+        """Return a binary stream on content stored with given uuid.
+
+        :raises:KeyError if file does not exists
+        """
+        return self.backend.open(self._key(uuid, content_hash))
+
+    def exists(self, uuid: UUID, content_hash: str | None = None) -> bool:
+        return self.backend.exists(self._key(uuid, content_hash))
+
+    def size(self, uuid: UUID, content_hash: str | None = None) -> int:
+        """Return size in bytes of content stored with given uuid.
+
+        :raises:KeyError if file does not exists
+        """
+        return self.backend.size(self._key(uuid, content_hash))
+
+    def set(
+        self, uuid: UUID, content: Any, encoding: str | None = "utf-8"
+    ) -> StoredContent:
         """Store binary content with uuid as key.
 
         :param:uuid: :class:`UUID` instance
         :param:content: string, bytes, or any object with a `read()` method
         :param:encoding: encoding to use when content is Unicode
         """
-        _assert_uuid(uuid)
-
-        dest = self.abs_path(uuid)
-        if not dest.parent.exists():
-            dest.parent.mkdir(0o775, parents=True)
-
-        if hasattr(content, "read"):
-            content = content.read()
+        key = self._key(uuid)
+        tmp_path = self.app_state.path / ".tmp" / uuid4().hex
+        try:
+            stored = write_file(tmp_path, content, encoding)
+            self.backend.put(key, tmp_path)
+        finally:
+            tmp_path.unlink(missing_ok=True)
+        return stored
+
+    def store_file(
+        self, uuid: UUID, path: Path, content_hash: str | None = None
+    ) -> None:
+        """Move file at `path` into the store, with uuid as key.
 
-        mode = "tw"
-        if not isinstance(content, str):
-            mode = "bw"
-            encoding = None
+        :param:uuid: :class:`UUID` instance
+        :param:content_hash: sha256 of the file, to store it by content. If a
+            file with the same content is already present it is reused.
+        """
+        key = self._key(uuid, content_hash)
+        if content_hash:
+            self._discard_uuid_file(uuid)
+            with self._gc_lock():
+                try:
+                    # refresh mtime: protects it from a concurrent garbage
+                    # collection
+                    self.backend.touch(key)
+                except KeyError:
+                    pass
+                else:
+                    path.unlink()
+                    return
+
+        self.backend.put(key, path)
+
+    def _gc_lock(self) -> FileLock:
+        return FileLock(self.app_state.path / GC_LOCK)
+
+    def _discard_uuid_file(self, uuid: UUID) -> None:
+        """Remove content stored by uuid, replaced by content stored by
+        hash."""
+        with contextlib.suppress(KeyError):
+            self.backend.delete(self._key(uuid))
+
+    def collect_garbage(
+        self, referenced: Collection[str], min_age: float = 3600, dry_run=False
+    ) -> tuple[int, int]:
+        """Delete content-addressed files not in `referenced`.
+
+        :param:referenced: sha256 of content still used by blobs.
+        :param:min_age: files modified less than `min_age` seconds ago are
+            kept: they may belong to a transaction not yet committed.
+        :returns: number and total size of deleted files.
+
+        Files reused by :meth:`store_file` while the collection runs are
+        kept: their modification time is checked again before deletion,
+        under the lock taken by :meth:`store_file`. This lock is a local file:
+        files are only deleted with the local backend. Other backends may be
+        shared by many hosts, which the lock wouldn't protect.
+
+        :raises:RuntimeError if files would be deleted from a non-local
+            backend.
+        """
+        if not dry_run and not isinstance(self.backend, LocalBackend):
+            msg = (
+                "Garbage collection is only supported with the local backend: "
+                "content reused on another host could be deleted"
+            )
+            raise RuntimeError(msg)
 
-        with dest.open(mode, encoding=encoding) as file:
-            file.write(content)
+        deadline = time.time() - min_age
+        count = size = 0
+        for key, file_size, mtime in self.backend.iter_files(f"{CAS_DIR}/"):
+            content_hash = key.rsplit("/", 1)[-1]
+            if content_hash in referenced or mtime > deadline:
+                continue
+            if not dry_run:
+                with self._gc_lock():
+                    try:
+                        if self.backend.mtime(key) > deadline:
+                            continue
+                        self.backend.delete(key)
+                    except KeyError:
+                        continue
+            count += 1
+            size += file_size
+
+        return count, size
 
     def delete(self, uuid: UUID) -> None:
         """Delete file with given uuid.
@@ -126,14 +352,11 @@ class BlobStoreService(Service):
         :param:uuid: :class:`UUID` instance
         :raises:KeyError if file does not exists
         """
-        _assert_uuid(uuid)
-
-        dest = self.abs_path(uuid)
-        if not dest.exists():
+        try:
+            self.backend.delete(self._key(uuid))
+        except KeyError:
             msg = "No file can be found for this uuid"
-            raise KeyError(msg, uuid)
-
-        dest.unlink()
+            raise KeyError(msg, uuid) from None
 
     def __getitem__(self, uuid: UUID) -> Path:
         _assert_uuid(uuid)
@@ -325,7 +548,11 @@ class SessionBlobStoreService(Service):
 
     # Blob store interface
     def get(
-        self, session: Session | Blob, uuid: UUID, default: Path | None = None
+        self,
+        session: Session | Blob,
+        uuid: UUID,
+        default: Path | None = None,
+        content_hash: str | None = None,
     ) -> Path | None:
         # assert isinstance(session, Session)
         _assert_uuid(uuid)
@@ -340,31 +567,82 @@ class SessionBlobStoreService(Service):
             return default
 
         if val is _NULL_MARK:
-            val = blob_store.get(uuid, default)
+            val = blob_store.get(uuid, default, content_hash=content_hash)
 
         return val
 
+    def _transaction_value(self, session: Session | Blob, uuid: UUID) -> Any:
+        """Return temporary path of content set in current transaction, or
+        `_NULL_MARK` if content is in the blob store.
+
+        :raises:KeyError if there is no transaction or content has been
+            deleted in it
+        """
+        _assert_uuid(uuid)
+        session = self._session_for(session)
+        transaction = self.app_state.get_transaction(session)
+        if transaction is None:
+            raise KeyError(uuid)
+        return transaction.get(uuid)
+
+    def open(
+        self, session: Session | Blob, uuid: UUID, content_hash: str | None = None
+    ) -> IO[bytes]:
+        """Return a binary stream on content, as seen by the current
+        transaction.
+
+        :raises:KeyError if there is no such content
+        """
+        val = self._transaction_value(session, uuid)
+        if val is _NULL_MARK:
+            return blob_store.open(uuid, content_hash=content_hash)
+        return val.open("rb")
+
+    def exists(
+        self, session: Session | Blob, uuid: UUID, content_hash: str | None = None
+    ) -> bool:
+        try:
+            val = self._transaction_value(session, uuid)
+        except KeyError:
+            return False
+        if val is _NULL_MARK:
+            return blob_store.exists(uuid, content_hash=content_hash)
+        return True
+
+    def size(
+        self, session: Session | Blob, uuid: UUID, content_hash: str | None = None
+    ) -> int:
+        """:raises:KeyError if there is no such content"""
+        val = self._transaction_value(session, uuid)
+        if val is _NULL_MARK:
+            return blob_store.size(uuid, content_hash=content_hash)
+        return val.stat().st_size
+
     def set(
         self,
         session: Session | Blob,
         uuid: UUID,
         content: IO | bytes | str,
         encoding: str = "utf-8",
-    ) -> None:
+    ) -> StoredContent:
         _assert_uuid(uuid)
         session = self._session_for(session)
         transaction = self.app_state.get_transaction(session)
         if transaction is None:
             msg = "transaction is None in blob store service"
             raise RuntimeError(msg)
-        transaction.set(uuid, content, encoding)
+        return transaction.set(
+            uuid, content, encoding, content_addressed=blob_store.content_addressed
+        )
 
-    def delete(self, session: Session | Blob, uuid: UUID) -> None:
+    def delete(
+        self, session: Session | Blob, uuid: UUID, content_hash: str | None = None
+    ) -> None:
         _assert_uuid(uuid)
 
         session = self._session_for(session)
         transaction = self.app_state.get_transaction(session)
-        if self.get(session, uuid) is not None:
+        if self.exists(session, uuid, content_hash=content_hash):
             transaction.delete(uuid)
 
     # session event handlers
@@ -432,6 +710,8 @@ class BlobStoreTransaction:
         self._parent = parent
         self._deleted: set[UUID] = set()
         self._set: set[UUID] = set()
+        #: sha256 of content to store by content, by uuid
+        self._hashes: dict[UUID, str] = {}
         self._cleared: bool = False
 
     @property
@@ -453,6 +733,7 @@ class BlobStoreTransaction:
         del self.tmp_folder
         del self._deleted
         del self._set
+        del self._hashes
         self._cleared = True
 
     def begin(self) -> None:
@@ -489,7 +770,9 @@ class BlobStoreTransaction:
                 blob_store.delete(uuid)
 
         for uuid in self._set:
-            blob_store.set(uuid, self.uuid_path(uuid).open("rb"))
+            blob_store.store_file(
+                uuid, self.uuid_path(uuid), content_hash=self._hashes.get(uuid)
+            )
 
     def uuid_path(self, uuid: UUID) -> Path:
         return self.tmp_folder / str(uuid)
@@ -503,6 +786,12 @@ class BlobStoreTransaction:
         parent._set |= self._set
         parent._set -= self._deleted
 
+        for uuid in self._set:
+            if uuid in self._hashes:
+                parent._hashes[uuid] = self._hashes[uuid]
+            else:
+                parent._hashes.pop(uuid, None)
+
         if self._set:
             parent.begin()  # ensure p.path exists
 
@@ -524,21 +813,16 @@ class BlobStoreTransaction:
         uuid: UUID,
         content: IO | bytes | str,
         encoding: str | None = "utf-8",
-    ) -> None:
+        content_addressed: bool = False,
+    ) -> StoredContent:
         self.begin()
         self._add_to(uuid, self._set, self._deleted)
-
-        if hasattr(content, "read"):
-            content = content.read()
-
-        if isinstance(content, bytes):
-            mode = "wb"
-            encoding = None
+        stored = write_file(self.uuid_path(uuid), content, encoding)
+        if content_addressed:
+            self._hashes[uuid] = stored.sha256
         else:
-            mode = "wt"
-        dest = self.uuid_path(uuid)
-        with dest.open(mode, encoding=encoding) as file:
-            file.write(content)
+            self._hashes.pop(uuid, None)
+        return stored
 
     def get(self, uuid: UUID) -> Any:
         if uuid in self._deleted:
@@ -1,24 +1,190 @@
 # Copyright (c) 2012-2024, Abilian SAS
 
+"""Cache of conversion results, on the file system.
+
+Results are stored in `<cache_dir>/<type>/<digest>.blob`. An index (a SQLite
+database in the cache directory, shared by all processes) records the size,
+last access time and number of accesses of each entry, and triggers keep the
+total size in a one-row table. When the total size exceeds the budget, least
+recently (or least frequently) used entries are evicted.
+
+To keep reads cheap, the access time of an entry is updated at most once per
+`touch_interval` seconds: `hits` counts these updates.
+"""
+
 from __future__ import annotations
 
-from typing import TYPE_CHECKING
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from pathlib import Path
+from typing import IO, TYPE_CHECKING, Any
 
 if TYPE_CHECKING:
-    from pathlib import Path
+    from collections.abc import Iterator
 
 CacheKey = tuple[str, str]
 
+#: default size budget of the cache, in bytes
+DEFAULT_MAX_SIZE = 2 * 1024**3
+
+INDEX_NAME = "index.sqlite"
+
+#: default minimum delay, in seconds, between updates of the access time of an
+#: entry
+DEFAULT_TOUCH_INTERVAL = 60
+
+#: eviction orders
+EVICTION_ORDERS = {
+    "lru": "last_access",
+    "lfu": "hits, last_access",
+}
+
 
 class Cache:
+    """Conversion cache.
+
+    :param max_size: size budget in bytes, `None` for an unbounded cache.
+    :param policy: `"lru"` to evict least recently used entries first,
+        `"lfu"` to evict least frequently used ones first.
+    :param touch_interval: minimum delay in seconds between updates of the
+        access time of an entry.
+    """
+
     cache_dir: Path
 
+    def __init__(
+        self,
+        max_size: int | None = DEFAULT_MAX_SIZE,
+        policy="lru",
+        touch_interval: float = DEFAULT_TOUCH_INTERVAL,
+    ) -> None:
+        if policy not in EVICTION_ORDERS:
+            msg = f"Unknown eviction policy: {policy!r}"
+            raise ValueError(msg)
+        self.max_size = max_size
+        self.policy = policy
+        self.touch_interval = touch_interval
+        self._local = threading.local()
+        self._generation = 0
+
     def _path(self, key: CacheKey) -> Path:
         """File path for `key`:"""
         type = key[0]
         uuid = key[1]
         return self.cache_dir / type / f"{uuid}.blob"
 
+    @staticmethod
+    def _index_key(key: CacheKey) -> str:
+        return f"{key[0]}/{key[1]}"
+
+    # index
+    def _index(self) -> sqlite3.Connection:
+        """Return connection to the index, for the current thread."""
+        state = (self.cache_dir, self._generation)
+        connection = getattr(self._local, "connection", None)
+        if connection is not None and self._local.state == state:
+            return connection
+
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        path = self.cache_dir / INDEX_NAME
+        is_new = not path.exists()
+        connection = sqlite3.connect(path, timeout=30, isolation_level=None)
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute(
+            "CREATE TABLE IF NOT EXISTS entries ("
+            " key TEXT PRIMARY KEY,"
+            " size INTEGER NOT NULL,"
+            " last_access REAL NOT NULL,"
+            " hits INTEGER NOT NULL DEFAULT 0)"
+        )
+        connection.execute(
+            "CREATE INDEX IF NOT EXISTS entries_last_access ON entries (last_access)"
+        )
+        self._create_totals(connection)
+        self._local.connection = connection
+        self._local.state = state
+        if is_new:
+            self.rebuild_index()
+        return connection
+
+    @staticmethod
+    def _create_totals(connection: sqlite3.Connection) -> None:
+        """Create the table holding the total size of entries, kept up to date
+        by triggers."""
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS totals ("
+                " id INTEGER PRIMARY KEY CHECK (id = 0),"
+                " size INTEGER NOT NULL)"
+            )
+            connection.execute(
+                "INSERT OR IGNORE INTO totals (id, size) "
+                "SELECT 0, COALESCE(SUM(size), 0) FROM entries"
+            )
+            connection.execute(
+                "CREATE TRIGGER IF NOT EXISTS entries_insert AFTER INSERT ON entries "
+                "BEGIN UPDATE totals SET size = size + new.size; END"
+            )
+            connection.execute(
+                "CREATE TRIGGER IF NOT EXISTS entries_delete AFTER DELETE ON entries "
+                "BEGIN UPDATE totals SET size = size - old.size; END"
+            )
+            connection.execute(
+                "CREATE TRIGGER IF NOT EXISTS entries_resize "
+                "AFTER UPDATE OF size ON entries "
+                "BEGIN UPDATE totals SET size = size - old.size + new.size; END"
+            )
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+        connection.execute("COMMIT")
+
+    def _touch(self, key: CacheKey) -> None:
+        index = self._index()
+        index_key = self._index_key(key)
+        now = time.time()
+        # a read is cheaper than a write, which locks the index
+        row = index.execute(
+            "SELECT last_access FROM entries WHERE key = ?", (index_key,)
+        ).fetchone()
+        if row is not None and now - row[0] < self.touch_interval:
+            return
+        index.execute(
+            "UPDATE entries SET last_access = ?, hits = hits + 1 WHERE key = ?",
+            (now, index_key),
+        )
+
+    def _forget(self, key: CacheKey) -> None:
+        self._index().execute(
+            "DELETE FROM entries WHERE key = ?", (self._index_key(key),)
+        )
+
+    def _iter_files(self) -> Iterator[tuple[CacheKey, Path]]:
+        for path in self.cache_dir.glob("*/*.blob"):
+            yield (path.parent.name, path.stem), path
+
+    def rebuild_index(self) -> None:
+        """Index the files present in the cache directory, i.e written before
+        the index existed."""
+        index = self._index()
+        now = time.time()
+        rows = []
+        for key, path in self._iter_files():
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            rows.append((self._index_key(key), stat.st_size, min(stat.st_mtime, now)))
+        index.executemany(
+            "INSERT OR IGNORE INTO entries (key, size, last_access) VALUES (?, ?, ?)",
+            rows,
+        )
+
+    # mapping API
     def __contains__(self, key: CacheKey) -> bool:
         return self._path(key).exists()
 
@@ -29,29 +195,135 @@ class Cache:
 
     __getitem__ = get
 
+    def open(self, key: CacheKey) -> IO[bytes] | None:
+        """Return a binary stream on the entry for `key`, or `None`."""
+        try:
+            stream = self._path(key).open("rb")
+        except FileNotFoundError:
+            # i.e removed by hand: its size must not count in the budget
+            self._forget(key)
+            return None
+        self._touch(key)
+        return stream
+
     def get_bytes(self, key: CacheKey) -> bytes | None:
-        if key in self:
-            path = self._path(key)
-            return path.read_bytes()
-        return None
+        stream = self.open(key)
+        if stream is None:
+            return None
+        with stream:
+            return stream.read()
 
     def get_text(self, key: CacheKey) -> str | None:
-        if key in self:
-            path = self._path(key)
-            return path.read_text("utf8")
-        return None
+        value = self.get_bytes(key)
+        return value.decode("utf8") if value is not None else None
 
     def set(self, key: CacheKey, value: str | bytes) -> None:
-        path = self._path(key)
-        path.parent.mkdir(parents=True, exist_ok=True)
         if key[0] == "txt":
             assert isinstance(value, str)
-            path.write_text(value, "utf8")
+            value = value.encode("utf8")
         else:
             assert isinstance(value, bytes)
-            path.write_bytes(value)
+
+        # write to a temporary file first, so that other processes never read
+        # a partially written entry
+        path = self._path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp_name = tempfile.mkstemp(dir=path.parent, prefix=".")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(value)
+            Path(tmp_name).replace(path)
+        except BaseException:
+            Path(tmp_name).unlink(missing_ok=True)
+            raise
+
+        self._index().execute(
+            "INSERT INTO entries (key, size, last_access, hits) VALUES (?, ?, ?, 0) "
+            "ON CONFLICT (key) DO UPDATE SET "
+            "size = excluded.size, last_access = excluded.last_access, hits = 0",
+            (self._index_key(key), len(value), time.time()),
+        )
+        if self.max_size is not None and self.total_size() > self.max_size:
+            # never evict the new entry: it has not been used yet
+            self.prune(keep=key)
 
     __setitem__ = set
 
+    def delete(self, key: CacheKey) -> None:
+        self._path(key).unlink(missing_ok=True)
+        self._forget(key)
+
+    __delitem__ = delete
+
+    def total_size(self) -> int:
+        row = self._index().execute("SELECT size FROM totals").fetchone()
+        return row[0]
+
+    def prune(
+        self, max_size: int | None = None, keep: CacheKey | None = None
+    ) -> tuple[int, int]:
+        """Evict entries until the cache is within `max_size` (default: the
+        cache budget). Entry `keep` is not evicted.
+
+        :returns: number and total size of evicted entries.
+        """
+        if max_size is None:
+            max_size = self.max_size
+        if max_size is None:
+            return 0, 0
+
+        excess = self.total_size() - max_size
+        if excess <= 0:
+            return 0, 0
+
+        order = EVICTION_ORDERS[self.policy]
+        rows = self._index().execute(
+            f"SELECT key, size FROM entries ORDER BY {order}"  # noqa: S608
+        )
+        count = evicted = 0
+        victims = []
+        kept = self._index_key(keep) if keep else None
+        for index_key, size in rows:
+            if evicted >= excess:
+                break
+            if index_key == kept:
+                continue
+            victims.append(index_key)
+            count += 1
+            evicted += size
+
+        for index_key in victims:
+            type_, digest = index_key.split("/", 1)
+            self.delete((type_, digest))
+
+        return count, evicted
+
     def clear(self) -> None:
-        pass
+        """Remove all entries."""
+        for key, _path in list(self._iter_files()):
+            self.delete(key)
+        self._index().execute("DELETE FROM entries")
+        self._close()
+
+    def _close(self) -> None:
+        connection = getattr(self._local, "connection", None)
+        if connection is not None:
+            connection.close()
+            self._local.connection = None
+        # connections of other threads are reopened on next use
+        self._generation += 1
+
+    def stats(self) -> dict[str, Any]:
+        """Number and size of entries, by type (`pdf`, `txt`, `img:0:500`...)."""
+        rows = self._index().execute(
+            "SELECT substr(key, 1, instr(key, '/') - 1) AS type, COUNT(*), SUM(size) "
+            "FROM entries GROUP BY type ORDER BY type"
+        )
+        by_type = {type_: {"entries": n, "bytes": size} for type_, n, size in rows}
+        return {
+            "entries": sum(t["entries"] for t in by_type.values()),
+            "bytes": sum(t["bytes"] for t in by_type.values()),
+            "max_size": self.max_size,
+            "policy": self.policy,
+            "types": by_type,
+        }
@@ -21,10 +21,8 @@ from xmlrpc.client import ServerProxy
 from loguru import logger
 from magic import Magic
 
-from abilian.services.image import resize
-
 from .exceptions import ConversionError
-from .handler_lock import acquire_lock
+from .pool import get_pool
 from .util import get_tmp_dir, make_temp_file
 
 if TYPE_CHECKING:
@@ -113,16 +111,16 @@ class Handler(ABC):
 class PdfToTextHandler(Handler):
     accepts_mime_types = ["application/pdf", "application/x-pdf"]
     produces_mime_types = ["text/plain"]
+    run_timeout = 60
 
-    @acquire_lock("PdfToTextHandler")
     def convert(self, blob: bytes, **kw: Any) -> str:
-        with make_temp_file(blob) as in_fn, make_temp_file() as out_fn:
+        with (
+            get_pool("PdfToTextHandler").slot() as slot,
+            make_temp_file(blob) as in_fn,
+            make_temp_file() as out_fn,
+        ):
             pdftotext = poppler_bin_util("pdftotext") or "pdftotext"
-            try:
-                subprocess.check_call([pdftotext, in_fn, out_fn])
-            except Exception as e:
-                msg = "pdftotext failed"
-                raise ConversionError(msg) from e
+            slot.run([pdftotext, in_fn, out_fn], timeout=self.run_timeout)
 
             converted = open(out_fn, "rb").read()
             try:
@@ -216,44 +214,57 @@ class AbiwordPDFHandler(Handler):
 class ImageMagickHandler(Handler):
     accepts_mime_types = ["image/.*"]
     produces_mime_types = ["application/pdf"]
+    run_timeout = 60
 
-    @acquire_lock("ImageMagickHandler")
     def convert(self, blob: bytes, **kw) -> bytes:
-        with make_temp_file(blob) as in_fn, make_temp_file() as out_fn:
-            try:
-                subprocess.check_call(["convert", in_fn, f"pdf:{out_fn}"])
-                converted = open(out_fn, "rb").read()
-                return converted
-            except Exception as e:
-                msg = "convert failed"
-                raise ConversionError(msg) from e
+        with (
+            get_pool("ImageMagickHandler").slot() as slot,
+            make_temp_file(blob) as in_fn,
+            make_temp_file() as out_fn,
+        ):
+            slot.run(["convert", in_fn, f"pdf:{out_fn}"], timeout=self.run_timeout)
+            return Path(out_fn).read_bytes()
 
 
 class PdfToPpmHandler(Handler):
     accepts_mime_types = ["application/pdf", "application/x-pdf"]
     produces_mime_types = ["image/jpeg"]
+    run_timeout = 60
 
-    @acquire_lock("PdfToPpmHandler")
-    def convert(self, blob: bytes, size: int = 500, **kw) -> list[bytes]:
-        """Size is the maximum horizontal size."""
-        file_list: list[str] = []
-        with make_temp_file(blob) as in_fn, make_temp_file() as out_fn:
+    def convert(
+        self,
+        blob: bytes,
+        size: int = 500,
+        first: int | None = None,
+        last: int | None = None,
+        **kw,
+    ) -> list[bytes]:
+        """Render pages `first` to `last` (0-based, included; by default all
+        pages), scaled to fit in a `size` x `size` box.
+
+        Pages are rendered directly at the requested size.
+        """
+        with (
+            get_pool("PdfToPpmHandler").slot() as slot,
+            make_temp_file(blob) as in_fn,
+            make_temp_file() as out_fn,
+        ):
             pdftoppm = poppler_bin_util("pdftoppm") or "pdftoppm"
+            cmd = [pdftoppm, "-jpeg", "-scale-to", str(size)]
+            if first is not None:
+                cmd += ["-f", str(first + 1)]
+            if last is not None:
+                cmd += ["-l", str(last + 1)]
             try:
-                subprocess.check_call([pdftoppm, "-jpeg", in_fn, out_fn])
+                slot.run([*cmd, in_fn, out_fn], timeout=self.run_timeout)
                 file_list = sorted(glob.glob(f"{out_fn}-*.jpg"))
-
-                converted_images = []
-                for fn in file_list:
-                    converted = resize(open(fn, "rb").read(), size, size)
-                    converted_images.append(converted)
-            except Exception as e:
+                return [Path(fn).read_bytes() for fn in file_list]
+            except OSError as e:
                 msg = "pdftoppm failed"
                 raise ConversionError(msg) from e
-            else:
-                return converted_images
             finally:
-                for fn in file_list:
+                # also pages written before a failure
+                for fn in glob.glob(f"{out_fn}-*.jpg"):
                     with contextlib.suppress(OSError):
                         os.remove(fn)
 
@@ -405,7 +416,6 @@ class LibreOfficePdfHandler(Handler):
     produces_mime_types = ["application/pdf"]
     run_timeout = 60
     soffice = "soffice"
-    _process: subprocess.Popen
 
     def init_app(self, app: Flask) -> None:
         soffice = app.config.get("SOFFICE_LOCATION")
@@ -436,65 +446,41 @@ class LibreOfficePdfHandler(Handler):
 
         self.soffice = soffice
 
-    @acquire_lock("LibreOfficePdfHandler")
     def convert(self, blob: bytes, **kw: Any) -> bytes:
-        """Convert using soffice converter."""
-        timeout = self.run_timeout
-        with make_temp_file(blob, tmp_dir=self.tmp_dir) as in_fn:
+        """Convert using soffice converter.
+
+        Conversions run concurrently in the slots of the
+        `LibreOfficePdfHandler` pool, each slot with its own LibreOffice
+        user profile.
+        """
+        with (
+            get_pool("LibreOfficePdfHandler").slot() as slot,
+            make_temp_file(blob, tmp_dir=self.tmp_dir) as in_fn,
+        ):
+            profile_dir = slot.work_dir / "profile"
+            out_dir = slot.work_dir / "out"
+            out_dir.mkdir(exist_ok=True)
             cmd = [
                 self.soffice,
+                f"-env:UserInstallation={profile_dir.as_uri()}",
                 "--headless",
+                "--norestore",
                 "--convert-to",
                 "pdf",
                 "--outdir",
-                str(self.tmp_dir),
+                str(out_dir),
                 str(in_fn),
             ]
+            slot.run(cmd, timeout=self.run_timeout, cwd=self.tmp_dir)
 
-            def run_soffice() -> None:
-                try:
-                    self._process = subprocess.Popen(
-                        cmd, close_fds=True, cwd=str(self.tmp_dir)
-                    )
-                    self._process.communicate()
-                except subprocess.CalledProcessError as e:
-                    logger.debug("CalledProcessError for soffice")
-                    logger.debug("returncode:{returncode}", returncode=e.returncode)
-                    logger.debug("e.cmd:{cmd}", cmd=e.cmd)
-                    logger.debug("stdout:{stdout}", stdout=e.stdout)
-                    logger.debug("stderr:{stderr}", stderr=e.stderr)
-                    raise ConversionError from e
-                except Exception as e:
-                    logger.opt(exception=True).error(
-                        "soffice error: {error}", error=str(e)
-                    )
-                    raise ConversionError from e
-
-            run_thread = threading.Thread(target=run_soffice)
-            run_thread.start()
-            run_thread.join(timeout)
+            out_fn = out_dir / f"{Path(in_fn).stem}.pdf"
             try:
-                if run_thread.is_alive():
-                    # timeout reached
-                    self._process.terminate()
-                    if self._process.poll() is not None:
-                        try:
-                            self._process.kill()
-                        except OSError:
-                            logger.warning(
-                                "Failed to kill process {process}",
-                                process=self._process,
-                            )
-
-                    msg = f"Conversion timeout ({timeout})"
-                    raise ConversionError(msg)
-
-                out_fn = f"{os.path.splitext(in_fn)[0]}.pdf"
-                converted = open(out_fn, "rb").read()
-                return converted
+                return out_fn.read_bytes()
+            except OSError as e:
+                msg = "soffice produced no PDF"
+                raise ConversionError(msg) from e
             finally:
-                if hasattr(self, "_process"):
-                    del self._process
+                out_fn.unlink(missing_ok=True)
 
 
 class CloudoooPdfHandler(Handler):
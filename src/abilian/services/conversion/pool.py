@@ -0,0 +1,288 @@
+# Copyright (c) 2012-2024, Abilian SAS
+
+"""Pools of conversion slots.
+
+External converters (LibreOffice, poppler, ImageMagick) are run in a bounded
+number of slots per handler, so that several documents are converted at the
+same time without overloading the host.
+
+Slots are shared by all processes of a host through lock files in the
+conversion lock directory (see
+:func:`~.handler_lock.init_conversion_lock_dir`); before it is set, they are
+only shared between threads of the current process.
+
+Each slot has its own work directory, i.e for a LibreOffice user profile:
+LibreOffice instances can't share a profile, and reusing it saves the
+profile initialization on each start.
+"""
+
+from __future__ import annotations
+
+import contextlib
+import functools
+import os
+import shutil
+import signal
+import subprocess
+import threading
+import time
+from contextlib import contextmanager
+from typing import TYPE_CHECKING, Any
+
+from filelock import FileLock, Timeout
+from loguru import logger
+
+from .exceptions import ConversionError
+from .handler_lock import LOCK_DIR, LOCK_EXPIRE
+from .util import get_tmp_dir
+
+if TYPE_CHECKING:
+    from collections.abc import Callable, Iterator, Sequence
+    from pathlib import Path
+
+__all__ = [
+    "ConversionPool",
+    "ConversionSlot",
+    "configure_pools",
+    "get_pool",
+    "pool_stats",
+    "pooled",
+]
+
+#: default number of slots per pool (`CONVERSION_POOL_SIZE`)
+DEFAULT_POOL_SIZE = min(4, os.cpu_count() or 1)
+
+#: delay between attempts to get a slot held by another process
+POLL_INTERVAL = 0.1
+
+_POOLS: dict[str, ConversionPool] = {}
+
+
+class ConversionSlot:
+    """A slot of a pool, held while running a conversion."""
+
+    def __init__(self, pool: ConversionPool, index: int) -> None:
+        self.pool = pool
+        self.index = index
+
+    @property
+    def work_dir(self) -> Path:
+        """Directory kept between the conversions run in this slot."""
+        work_dir = self.pool.work_dir or get_tmp_dir() / "slots"
+        path = work_dir / f"{self.pool.name}-{self.index}"
+        path.mkdir(parents=True, exist_ok=True)
+        return path
+
+    def reset(self) -> None:
+        """Remove the work directory, i.e after a crash or a timeout left it in
+        an unknown state."""
+        shutil.rmtree(self.work_dir, ignore_errors=True)
+        with self.pool._lock:
+            self.pool.restarts += 1
+
+    def run(self, cmd: Sequence[str], timeout: float, cwd: Path | None = None) -> None:
+        """Run `cmd`, killing it and all its children after `timeout`
+        seconds.
+
+        :raises ConversionError: if the command fails or times out.
+        """
+        try:
+            process = subprocess.Popen(
+                cmd,
+                cwd=cwd,
+                close_fds=True,
+                start_new_session=True,
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.PIPE,
+            )
+        except OSError as e:
+            msg = f"Can't run {cmd[0]}"
+            raise ConversionError(msg) from e
+
+        try:
+            _out, err = process.communicate(timeout=timeout)
+        except subprocess.TimeoutExpired:
+            with contextlib.suppress(ProcessLookupError):
+                os.killpg(process.pid, signal.SIGKILL)
+            process.wait()
+            with self.pool._lock:
+                self.pool.timeouts += 1
+            self.reset()
+            msg = f"Conversion timeout ({timeout})"
+            raise ConversionError(msg) from None
+
+        if process.returncode:
+            logger.debug(
+                "{cmd} failed: {returncode} {stderr}",
+                cmd=cmd[0],
+                returncode=process.returncode,
+                stderr=err,
+            )
+            if process.returncode < 0:
+                # killed by a signal: the work directory may be corrupted
+                self.reset()
+            msg = f"{cmd[0]} failed ({process.returncode})"
+            raise ConversionError(msg)
+
+
+class ConversionPool:
+    """A bounded number of slots to run conversions concurrently.
+
+    :param name: identifies the pool, and its lock files on the host.
+    :param size: number of slots, `DEFAULT_POOL_SIZE` if not set.
+    """
+
+    #: parent of slot work directories, set by :func:`configure_pools`
+    work_dir: Path | None = None
+
+    def __init__(self, name: str, size: int | None = None) -> None:
+        self.name = name
+        self.size = size or DEFAULT_POOL_SIZE
+        self._lock = threading.Lock()
+        self._busy: set[int] = set()
+        self._file_locks: dict[int, FileLock] = {}
+        self.waiting = 0
+        self.running = 0
+        self.completed = 0
+        self.failed = 0
+        self.timeouts = 0
+        self.restarts = 0
+        self.total_time = 0.0
+        self.total_wait = 0.0
+        self.max_time = 0.0
+
+    def _file_lock(self, index: int) -> FileLock | None:
+        if not LOCK_DIR:
+            return None
+        lock = self._file_locks.get(index)
+        if lock is None:
+            lock = FileLock(LOCK_DIR[0] / f"{self.name}-{index}.lock")
+            self._file_locks[index] = lock
+        return lock
+
+    def _try_acquire(self) -> ConversionSlot | None:
+        for index in range(self.size):
+            with self._lock:
+                if index in self._busy:
+                    continue
+                self._busy.add(index)
+
+            lock = self._file_lock(index)
+            if lock is None:
+                return ConversionSlot(self, index)
+            try:
+                lock.acquire(timeout=0)
+            except Timeout:
+                # used by another process
+                with self._lock:
+                    self._busy.discard(index)
+                continue
+            return ConversionSlot(self, index)
+
+        return None
+
+    def _release(self, slot: ConversionSlot) -> None:
+        lock = self._file_lock(slot.index)
+        if lock is not None:
+            lock.release()
+        with self._lock:
+            self._busy.discard(slot.index)
+
+    def _acquire(self, timeout: float) -> ConversionSlot:
+        deadline = time.monotonic() + timeout
+        while (slot := self._try_acquire()) is None:
+            if time.monotonic() > deadline:
+                msg = f"No free conversion slot in pool {self.name}"
+                raise ConversionError(msg)
+            time.sleep(POLL_INTERVAL)
+        return slot
+
+    @contextmanager
+    def slot(self, timeout: float = LOCK_EXPIRE) -> Iterator[ConversionSlot]:
+        """Wait for a free slot, and hold it until the end of the `with`
+        block.
+
+        :raises ConversionError: if no slot is free after `timeout` seconds.
+        """
+        queued = time.monotonic()
+        with self._lock:
+            self.waiting += 1
+        try:
+            slot = self._acquire(timeout)
+        finally:
+            with self._lock:
+                self.waiting -= 1
+
+        started = time.monotonic()
+        with self._lock:
+            self.running += 1
+            self.total_wait += started - queued
+        try:
+            yield slot
+        except BaseException:
+            with self._lock:
+                self.failed += 1
+            raise
+        else:
+            with self._lock:
+                self.completed += 1
+        finally:
+            elapsed = time.monotonic() - started
+            with self._lock:
+                self.running -= 1
+                self.total_time += elapsed
+                self.max_time = max(self.max_time, elapsed)
+            self._release(slot)
+
+    def stats(self) -> dict[str, Any]:
+        """Queue length and latency metrics of this process."""
+        done = self.completed + self.failed
+        return {
+            "size": self.size,
+            "waiting": self.waiting,
+            "running": self.running,
+            "completed": self.completed,
+            "failed": self.failed,
+            "timeouts": self.timeouts,
+            "restarts": self.restarts,
+            "avg_time": self.total_time / done if done else 0.0,
+            "max_time": self.max_time,
+            "avg_wait": self.total_wait / done if done else 0.0,
+        }
+
+
+def get_pool(name: str) -> ConversionPool:
+    """Return the pool named `name`, created on first use."""
+    pool = _POOLS.get(name)
+    if pool is None:
+        pool = _POOLS.setdefault(name, ConversionPool(name))
+    return pool
+
+
+def configure_pools(size: int | None = None, work_dir: Path | None = None) -> None:
+    """Set size and work directory of all pools, current and future."""
+    global DEFAULT_POOL_SIZE  # noqa: PLW0603
+    if size is not None:
+        DEFAULT_POOL_SIZE = size
+    ConversionPool.work_dir = work_dir
+    for pool in _POOLS.values():
+        if size is not None:
+            pool.size = size
+
+
+def pool_stats() -> dict[str, dict[str, Any]]:
+    return {name: pool.stats() for name, pool in sorted(_POOLS.items())}
+
+
+def pooled(name: str) -> Callable:
+    """Run the decorated function in a slot of pool `name`."""
+
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with get_pool(name).slot():
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
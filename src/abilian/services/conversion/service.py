@@ -17,16 +17,19 @@ import shutil
 import subprocess
 from io import BytesIO
 from pathlib import Path
-from typing import TYPE_CHECKING
+from typing import IO, TYPE_CHECKING, Any
 
 from loguru import logger
 from PIL import Image
 from PIL.ExifTags import TAGS
 
-from .cache import Cache
-from .exceptions import HandlerNotFoundError
+from abilian.services.image import cache as resize_cache
+
+from .cache import DEFAULT_MAX_SIZE, DEFAULT_TOUCH_INTERVAL, Cache
+from .exceptions import ConversionError, HandlerNotFoundError
 from .handler_lock import init_conversion_lock_dir
 from .handlers import Handler, poppler_bin_util
+from .pool import configure_pools, pool_stats
 from .util import make_temp_file
 
 if TYPE_CHECKING:
@@ -34,6 +37,9 @@ if TYPE_CHECKING:
 
 TMP_DIR = "tmp"
 CACHE_DIR = "cache"
+#: subdirectory of the tmp directory for work directories of conversion slots
+SLOTS_DIR = "slots"
+PDF_TYPES = ("application/pdf", "application/x-pdf")
 
 
 class Converter:
@@ -46,11 +52,22 @@ class Converter:
         self.cache = Cache()
 
     def init_app(self, app: Flask) -> None:
+        self.cache.max_size = app.config.get(
+            "CONVERSION_CACHE_MAX_SIZE", DEFAULT_MAX_SIZE
+        )
+        self.cache.policy = app.config.get("CONVERSION_CACHE_POLICY", "lru")
+        self.cache.touch_interval = app.config.get(
+            "CONVERSION_CACHE_TOUCH_INTERVAL", DEFAULT_TOUCH_INTERVAL
+        )
         self.init_work_dirs(
             cache_dir=Path(app.instance_path, CACHE_DIR),
             tmp_dir=Path(app.instance_path, TMP_DIR),
         )
         init_conversion_lock_dir(app.instance_path)
+        configure_pools(
+            size=app.config.get("CONVERSION_POOL_SIZE"),
+            work_dir=self.tmp_dir / SLOTS_DIR,
+        )
         app.extensions["conversion"] = self
 
         for handler in self.handlers:
@@ -60,6 +77,7 @@ class Converter:
         self.tmp_dir = tmp_dir
         self.cache_dir = cache_dir
         self.cache.cache_dir = self.cache_dir
+        resize_cache.store = self.cache
 
         if not self.tmp_dir.exists():
             self.tmp_dir.mkdir()
@@ -68,6 +86,7 @@ class Converter:
 
     def clear(self) -> None:
         self.cache.clear()
+        resize_cache.clear()
         for d in (self.tmp_dir, self.cache_dir):
             shutil.rmtree(bytes(d))
             d.mkdir()
@@ -75,6 +94,10 @@ class Converter:
     def register_handler(self, handler: Handler) -> None:
         self.handlers.append(handler)
 
+    def stats(self) -> dict[str, dict[str, Any]]:
+        """Queue length and latency of conversions, by handler pool."""
+        return pool_stats()
+
     # TODO: refactor, pass a "File" or "Document" or "Blob" object
     def to_pdf(self, digest: str, blob: bytes, mime_type: str) -> bytes:
         cache_key = ("pdf", digest)
@@ -91,6 +114,14 @@ class Converter:
         msg = f"No handler found to convert from {mime_type} to PDF"
         raise HandlerNotFoundError(msg)
 
+    def open_pdf(self, digest: str, blob: bytes, mime_type: str) -> IO[bytes]:
+        """Like :meth:`to_pdf`, but return a stream: a cached PDF is not
+        loaded in memory."""
+        stream = self.cache.open(("pdf", digest))
+        if stream is None:
+            stream = BytesIO(self.to_pdf(digest, blob, mime_type))
+        return stream
+
     def to_text(self, digest: str, blob: bytes, mime_type: str) -> str:
         """Convert a file to plain text.
 
@@ -131,20 +162,40 @@ class Converter:
 
     def get_image(self, digest, blob, mime_type, index, size=500):
         """Return an image for the given content, only if it already exists in
-        the image cache."""
+        the image cache, or if the PDF it's rendered from is available (then
+        only the requested page is rendered)."""
         # Special case, for now (XXX).
         if mime_type.startswith("image/"):
             return ""
 
         cache_key = (f"img:{index}:{size}", digest)
-        return self.cache.get(cache_key)
+        image = self.cache.get(cache_key)
+        if image is None and (mime_type in PDF_TYPES or ("pdf", digest) in self.cache):
+            image = self.to_image(digest, blob, mime_type, index, size)
+        return image
+
+    def page_count(self, digest: str, blob: bytes, mime_type: str) -> int:
+        """Return the number of pages of the PDF version of a file."""
+        cache_key = ("pages", digest)
+        count = self.cache.get_bytes(cache_key)
+        if count:
+            return int(count)
+
+        pdf = blob if mime_type in PDF_TYPES else self.to_pdf(digest, blob, mime_type)
+        try:
+            count = int(self._pdf_info(pdf).get(b"Pages", b"1"))
+        except ValueError:
+            count = 1
+        self.cache[cache_key] = str(count).encode()
+        return count
 
     def to_image(
         self, digest: str, blob: bytes, mime_type: str, index: int, size: int = 500
     ) -> bytes:
-        """Convert a file to a list of images.
+        """Convert page `index` of a file to an image of maximum width and
+        height `size`.
 
-        Returns image at the given index.
+        Pages are rendered one at a time, when requested.
         """
         # Special case, for now (XXX).
         if mime_type.startswith("image/"):
@@ -155,30 +206,45 @@ class Converter:
         if converted:
             return converted
 
-        # Direct conversion possible
-        for handler in self.handlers:
-            if handler.accept(mime_type, "image/jpeg"):
-                converted_images = handler.convert(blob, size=size)
-                for i in range(len(converted_images)):
-                    converted = converted_images[i]
-                    cache_key = (f"img:{i}:{size}", digest)
-                    self.cache[cache_key] = converted
-                return converted_images[index]
+        # Direct conversion possible, else use PDF as a pivot format
+        source, source_type = blob, mime_type
+        if not any(h.accept(mime_type, "image/jpeg") for h in self.handlers):
+            source = self.to_pdf(digest, blob, mime_type)
+            source_type = "application/pdf"
 
-        # Use PDF as a pivot format
-        pdf = self.to_pdf(digest, blob, mime_type)
         for handler in self.handlers:
-            if handler.accept("application/pdf", "image/jpeg"):
-                converted_images = handler.convert(pdf, size=size)
-                for i in range(len(converted_images)):
-                    converted = converted_images[i]
-                    cache_key = (f"img:{i}:{size}", digest)
-                    self.cache[cache_key] = converted
-                return converted_images[index]
+            if handler.accept(source_type, "image/jpeg"):
+                if index >= self.page_count(digest, source, source_type):
+                    msg = f"No page {index} in document"
+                    raise ConversionError(msg)
+                converted = handler.convert(source, size=size, first=index, last=index)
+                if not converted:
+                    msg = f"Page {index} could not be rendered"
+                    raise ConversionError(msg)
+                self.cache[cache_key] = converted[0]
+                return converted[0]
 
         msg = f"No handler found to convert from {mime_type} to image"
         raise HandlerNotFoundError(msg)
 
+    @staticmethod
+    def _pdf_info(pdf: bytes) -> dict[bytes, bytes]:
+        """Return the information displayed by `pdfinfo` about a PDF."""
+        with make_temp_file(pdf) as in_fn:
+            pdfinfo = poppler_bin_util("pdfinfo") or "pdfinfo"
+            try:
+                output = subprocess.check_output([pdfinfo, in_fn])
+            except OSError:  # pragma: no cover
+                logger.error("Conversion failed, probably pdfinfo is not installed")
+                raise
+
+        info = {}
+        for line in output.split(b"\n"):
+            if b":" in line:
+                key, value = line.strip().split(b":", 1)
+                info[key] = value.strip()
+        return info
+
     def get_metadata(self, digest, content, mime_type):
         """Get a dictionary representing the metadata embedded in the given
         content."""
@@ -200,19 +266,8 @@ class Converter:
         if mime_type != "application/pdf":
             content = self.to_pdf(digest, content, mime_type)
 
-        with make_temp_file(content) as in_fn:
-            pdfinfo = poppler_bin_util("pdfinfo") or "pdfinfo"
-            try:
-                output = subprocess.check_output([pdfinfo, in_fn])
-            except OSError:  # pragma: no cover
-                logger.error("Conversion failed, probably pdfinfo is not installed")
-                raise
-
         ret = {}
-        for line in output.split(b"\n"):
-            if b":" in line:
-                key, value = line.strip().split(b":", 1)
-                key = str(key)
-                ret[f"PDF:{key}"] = str(value.strip(), errors="replace")
+        for key, value in self._pdf_info(content).items():
+            ret[f"PDF:{key.decode(errors='replace')}"] = str(value, errors="replace")
 
         return ret
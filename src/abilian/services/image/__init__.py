@@ -11,7 +11,19 @@ from typing import Any
 
 from PIL import Image
 
-__all__ = ["CROP", "FIT", "RESIZE_MODES", "SCALE", "get_format", "resize"]
+from abilian.core.models.blob import Blob
+
+from .cache import ResizeCache
+
+__all__ = [
+    "CROP",
+    "FIT",
+    "RESIZE_MODES",
+    "SCALE",
+    "cached_resize",
+    "get_format",
+    "resize",
+]
 
 # resize modes
 
@@ -28,8 +40,8 @@ CROP = "crop"
 
 RESIZE_MODES = frozenset({SCALE, FIT, CROP})
 
-# TODO: cache to file
-cache: dict[Any, bytes] = {}
+#: resized images. Its file tier is set up by the conversion service.
+cache = ResizeCache()
 
 
 def open_image(img: BytesIO | bytes) -> Image.Image:
@@ -60,14 +72,40 @@ def get_save_format(fmt: str) -> str:
     return "JPEG"
 
 
-def resize(orig: Any, width: int, height: int, mode: str = FIT) -> bytes:
-    if isinstance(orig, bytes):
+def cached_resize(key: str, width: int, height: int, mode: str = FIT) -> bytes | None:
+    """Return the cached result of :func:`resize` for content `key`, or
+    `None`."""
+    return cache.get((key, mode, width, height))
+
+
+def resize(
+    orig: Any, width: int, height: int, mode: str = FIT, key: str | None = None
+) -> bytes:
+    """Resize image `orig` (bytes, file-like or :class:`Blob`).
+
+    :param key: identifies the content of `orig`, i.e a blob uuid and md5.
+        If absent, the md5 of the image is computed.
+    """
+    blob = None
+    if isinstance(orig, Blob):
+        # content is read only on cache miss
+        blob = orig
+        if key is None and blob.meta.get("md5"):
+            key = f"{blob.uuid}:{blob.meta['md5']}"
+    elif isinstance(orig, bytes):
         orig = BytesIO(orig)
 
-    digest = hashlib.md5(orig.read()).digest()  # noqa: S324
-    cache_key = (digest, mode, width, height)
-    if cache_key in cache:
-        return cache[cache_key]
+    if key is None:
+        if blob is not None:
+            orig, blob = BytesIO(blob.value), None
+        key = hashlib.md5(orig.read()).hexdigest()  # noqa: S324
+
+    converted = cached_resize(key, width, height, mode)
+    if converted is not None:
+        return converted
+
+    if blob is not None:
+        orig = BytesIO(blob.value)
 
     orig.seek(0)
     image = open_image(orig)
@@ -94,7 +132,7 @@ def resize(orig: Any, width: int, height: int, mode: str = FIT) -> bytes:
     output = BytesIO()
     image.save(output, get_save_format(image_format))
     converted = output.getvalue()
-    cache[cache_key] = converted
+    cache.set((key, mode, width, height), converted)
     return converted
 
 
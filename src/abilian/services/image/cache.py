@@ -0,0 +1,102 @@
+# Copyright (c) 2012-2024, Abilian SAS
+
+"""Cache for resized images.
+
+Recently used images are kept in memory, within a size limit. When a store
+is set (the conversion service sets its own cache), all resized images are
+also stored on disk, so that they survive restarts and are shared between
+processes. They are then evicted with the other conversion results, within the
+size budget of the store.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import TYPE_CHECKING, Any
+
+if TYPE_CHECKING:
+    from collections.abc import Hashable
+
+    from abilian.services.conversion.cache import Cache, CacheKey
+
+__all__ = ["ResizeCache"]
+
+#: default maximum size of images kept in memory
+DEFAULT_MAX_BYTES = 32 * 1024 * 1024
+
+#: entry type of resized images in the store
+STORE_TYPE = "resize"
+
+
+class ResizeCache:
+    #: file tier, shared with conversion results
+    store: Cache | None = None
+
+    def __init__(self, max_bytes: int = DEFAULT_MAX_BYTES) -> None:
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._entries: OrderedDict[Hashable, bytes] = OrderedDict()
+        self._size = 0
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @staticmethod
+    def _store_key(key: Hashable) -> CacheKey:
+        digest = hashlib.sha1(repr(key).encode()).hexdigest()  # noqa: S324
+        return STORE_TYPE, digest
+
+    def get(self, key: Hashable) -> bytes | None:
+        with self._lock:
+            value = self._entries.get(key)
+            if value is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return value
+
+        if self.store is not None:
+            value = self.store.get_bytes(self._store_key(key))
+            if value is not None:
+                self._remember(key, value)
+                self.hits += 1
+                return value
+
+        self.misses += 1
+        return None
+
+    def set(self, key: Hashable, value: bytes) -> None:
+        self._remember(key, value)
+        if self.store is not None:
+            self.store.set(self._store_key(key), value)
+
+    def _remember(self, key: Hashable, value: bytes) -> None:
+        if len(value) > self.max_bytes:
+            return
+
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._size -= len(previous)
+            self._entries[key] = value
+            self._size += len(value)
+            while self._size > self.max_bytes:
+                _key, evicted = self._entries.popitem(last=False)
+                self._size -= len(evicted)
+
+    def clear(self) -> None:
+        """Clear the memory tier. Files are removed with the store."""
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "entries": len(self._entries),
+            "bytes": self._size,
+        }
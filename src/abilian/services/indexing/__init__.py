@@ -4,7 +4,8 @@
 
 from __future__ import annotations
 
+from .batch import batch_cache, indexing_batch
 from .schema import indexable_role
 from .service import service
 
-__all__ = ["indexable_role", "service"]
+__all__ = ["batch_cache", "indexable_role", "indexing_batch", "service"]
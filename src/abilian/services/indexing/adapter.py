@@ -16,6 +16,9 @@ from abilian.core.extensions import db
 from .schema import accent_folder
 
 if TYPE_CHECKING:
+    from collections.abc import Iterable
+
+    from sqlalchemy.orm import RelationshipProperty
     from sqlalchemy.orm.session import Session
 
     from abilian.core.entities import Entity
@@ -53,6 +56,20 @@ class SchemaAdapter(ABC):
         """
         raise NotImplementedError
 
+    def retrieve_many(self, pks: Iterable, **data) -> dict:
+        """Returns a dict of primary key -> object instance for the given
+        identifiers.
+
+        Identifiers without a matching object are missing from the result.
+        Subclasses should override this to retrieve all objects at once.
+        """
+        result = {}
+        for pk in pks:
+            obj = self.retrieve(pk, **data)
+            if obj is not None:
+                result[pk] = obj
+        return result
+
     @abstractmethod
     def get_document(self, obj) -> Never:
         raise NotImplementedError
@@ -84,6 +101,10 @@ class SAAdapter(SchemaAdapter):
 
     doc_attrs: dict[str, Any]
 
+    #: paths of relationships traversed by `doc_attrs`, eager-loaded by
+    #: :meth:`retrieve_many`
+    eager_load_paths: list[tuple[RelationshipProperty, ...]]
+
     def __init__(self, model_class: type[Model], schema: Schema) -> None:
         """
         :param:model_class: a sqlalchemy model class
@@ -95,8 +116,10 @@ class SAAdapter(SchemaAdapter):
         self.indexable = getattr(model_class, "__indexable__", False)
         self.index_to = self.get_index_to(model_class)
         self.doc_attrs = {}
+        self.eager_load_paths = []
         if self.indexable:
             self._build_doc_attrs(model_class, schema)
+            self._build_eager_load_paths(model_class)
 
     @staticmethod
     def can_adapt(obj_cls: Any) -> bool:
@@ -174,11 +197,58 @@ class SAAdapter(SchemaAdapter):
             # )
             schema.add(field_name, field_def)
 
+    def _build_eager_load_paths(self, model_class: type[Model]) -> None:
+        """Find relationships traversed by attributes in `doc_attrs`, i.e
+        `creator` or `community.slug`."""
+        paths = set()
+        for attrs in self.doc_attrs.values():
+            for attr_name in attrs:
+                mapper = sa.inspect(model_class)
+                path = []
+                for part in attr_name.split("."):
+                    relationship = mapper.relationships.get(part)
+                    if relationship is None or relationship.lazy == "dynamic":
+                        break
+                    path.append(relationship)
+                    paths.add(tuple(path))
+                    mapper = relationship.mapper
+
+        self.eager_load_paths = sorted(paths, key=lambda path: [r.key for r in path])
+
+    def eager_load_options(self) -> list[Any]:
+        options = []
+        for path in self.eager_load_paths:
+            option = sa.orm.selectinload(path[0].class_attribute)
+            for relationship in path[1:]:
+                option = option.selectinload(relationship.class_attribute)
+            options.append(option)
+        return options
+
     def retrieve(self, pk: int, _session: Session | None = None, **data: Any) -> Entity:
         if _session is None:
             _session = db.session()
         return _session.query(self.model_class).get(pk)
 
+    def retrieve_many(
+        self, pks: Iterable[int], _session: Session | None = None, **data: Any
+    ) -> dict[int, Entity]:
+        """Retrieve all objects with one query, eager-loading relationships
+        needed to build their documents."""
+        pks = set(pks)
+        if not pks:
+            return {}
+
+        if _session is None:
+            _session = db.session()
+
+        pk_column = sa.inspect(self.model_class).primary_key[0]
+        query = (
+            _session.query(self.model_class)
+            .options(*self.eager_load_options())
+            .filter(pk_column.in_(pks))
+        )
+        return {sa.inspect(obj).identity[0]: obj for obj in query}
+
     def get_document(self, obj: Model) -> dict[str, Any]:
         result: dict[str, Any] = {}
         if not self.indexable:
@@ -0,0 +1,50 @@
+# Copyright (c) 2012-2024, Abilian SAS
+
+"""Values shared between documents built in the same indexing batch.
+
+Indexable attributes may be costly to compute and identical for many
+objects, i.e the security of objects in the same folder. Inside
+:func:`indexing_batch`, :func:`batch_cache` returns a dict that lives until
+the end of the batch, where such values can be memoized.
+"""
+
+from __future__ import annotations
+
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import TYPE_CHECKING, Any
+
+if TYPE_CHECKING:
+    from collections.abc import Iterator
+
+__all__ = ["batch_cache", "indexing_batch"]
+
+_batch_caches: ContextVar[dict[str, dict[Any, Any]] | None] = ContextVar(
+    "indexing_batch_caches", default=None
+)
+
+
+@contextmanager
+def indexing_batch() -> Iterator[None]:
+    """Start an indexing batch.
+
+    Nested batches share the caches of the outermost one.
+    """
+    if _batch_caches.get() is not None:
+        yield
+        return
+
+    token = _batch_caches.set({})
+    try:
+        yield
+    finally:
+        _batch_caches.reset(token)
+
+
+def batch_cache(name: str) -> dict[Any, Any] | None:
+    """Return the cache named `name` for the current batch, or `None` outside
+    of an indexing batch."""
+    caches = _batch_caches.get()
+    if caches is None:
+        return None
+    return caches.setdefault(name, {})
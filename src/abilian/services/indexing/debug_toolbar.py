@@ -78,7 +78,7 @@ class IndexedTermsDebugPanel(DebugPanel):
             context["current_indexed"] = indexed
             context["current_keys"] = sorted(set(doc) | set(indexed))
 
-        with index.searcher() as search:
+        with index_service.searcher() as search:
             document = search.document(object_key=obj.object_key)
 
         sorted_keys = sorted(document) if document is not None else None
@@ -0,0 +1,124 @@
+# Copyright (c) 2012-2024, Abilian SAS
+
+"""Caches for search filters and facet counts.
+
+Search filters (security, object types) are the same for all searches made
+by users with the same roles. They are computed once as sets of document
+numbers, valid as long as the index generation doesn't change.
+
+Facet counts (number of hits by object type) of a query are the same on all
+pages of its results, and when filtering on object types: they are kept for
+the current index generation too.
+"""
+
+from __future__ import annotations
+
+import threading
+from collections import OrderedDict
+from typing import TYPE_CHECKING
+
+from whoosh.idsets import BitSet
+
+if TYPE_CHECKING:
+    from collections.abc import Callable, Hashable
+
+    from whoosh.query import Query
+    from whoosh.searching import Searcher
+
+__all__ = ["FacetCountCache", "SearchFilterCache"]
+
+
+class SearchFilterCache:
+    """LRU cache of filter doc id sets, keyed by an arbitrary key (i.e the
+    role signature of a user) and invalidated when the index generation
+    changes."""
+
+    def __init__(self, max_size: int = 256) -> None:
+        self.max_size = max_size
+        self._lock = threading.Lock()
+        self._entries: OrderedDict[Hashable, tuple[int | None, BitSet]] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(
+        self, searcher: Searcher, key: Hashable, query_factory: Callable[[], Query]
+    ) -> BitSet:
+        """Return the set of document numbers matching `query_factory()` in
+        `searcher`.
+
+        The query is only built and run if there is no entry for `key` and
+        the generation of the index read by `searcher`.
+        """
+        generation = searcher.reader().generation()
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == generation:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+
+        docs = BitSet(
+            searcher.docs_for_query(query_factory()), size=searcher.doc_count_all()
+        )
+
+        with self._lock:
+            self._entries[key] = (generation, docs)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+        return docs
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+
+class FacetCountCache:
+    """LRU cache of facet counts, keyed by an arbitrary key (i.e the query and
+    the role signature of a user) and invalidated when the index generation
+    changes."""
+
+    def __init__(self, max_size: int = 1024) -> None:
+        self.max_size = max_size
+        self._lock = threading.Lock()
+        self._entries: OrderedDict[Hashable, tuple[int | None, dict[str, int]]] = (
+            OrderedDict()
+        )
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, searcher: Searcher, key: Hashable) -> dict[str, int] | None:
+        """Return counts for `key` in the generation of the index read by
+        `searcher`, or `None`."""
+        generation = searcher.reader().generation()
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == generation:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+            return None
+
+    def set(self, searcher: Searcher, key: Hashable, counts: dict[str, int]) -> None:
+        generation = searcher.reader().generation()
+
+        with self._lock:
+            self._entries[key] = (generation, counts)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
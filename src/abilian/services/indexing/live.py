@@ -0,0 +1,190 @@
+# Copyright (c) 2012-2024, Abilian SAS
+
+"""Typeahead ("live") search.
+
+Live search runs on each keystroke of the global search box, so it avoids
+the costs of a full search:
+
+* the query is a conjunction of terms of the `name_prefix` edge-ngram field,
+  built without a query parser;
+* the searcher is shared by all requests (see :mod:`.searchers`);
+* results are cached for recent (prefix, role signature, filters);
+* only the best hits are collected: at most `limit` by object type;
+* the search is interrupted after `SEARCH_LIVE_TIME_LIMIT` seconds, and the
+  results collected so far are returned.
+"""
+
+from __future__ import annotations
+
+import threading
+from collections import OrderedDict
+from typing import TYPE_CHECKING, Any
+
+from whoosh import query as wq
+from whoosh.collectors import TimeLimit, TimeLimitCollector
+
+from .schema import accent_folder
+
+if TYPE_CHECKING:
+    from collections.abc import Hashable, Sequence
+
+    from whoosh.collectors import Collector
+    from whoosh.idsets import BitSet
+    from whoosh.searching import Searcher
+
+__all__ = ["LiveSearch"]
+
+#: longest indexed edge-ngram (see :data:`.schema.edge_ngram`)
+MAX_NGRAM_SIZE = 6
+#: shortest indexed edge-ngram
+MIN_NGRAM_SIZE = 2
+
+#: default for `SEARCH_LIVE_TIME_LIMIT`, in seconds
+DEFAULT_TIME_LIMIT = 0.05
+
+#: results by object type: stored fields of hits
+LiveResults = dict[str, list[dict[str, Any]]]
+
+
+class _TimeLimitFilterCollector(TimeLimitCollector):
+    """Collector interrupted after `timelimit` seconds, which only collects
+    `allowed` documents.
+
+    :class:`TimeLimitCollector` collects the matches of its child itself: the
+    filter of a :class:`FilterCollector` child would be bypassed.
+    """
+
+    def __init__(self, child: Collector, allowed: BitSet, timelimit: float) -> None:
+        # alarm signals can only be handled in the main thread
+        super().__init__(child, timelimit, use_alarm=False)
+        self.allowed = allowed
+
+    def collect_matches(self) -> None:
+        child = self.child
+        allowed = self.allowed
+        offset = child.offset
+        for sub_docnum in child.matches():
+            if self.timedout:
+                raise TimeLimit
+            if offset + sub_docnum in allowed:
+                child.collect(sub_docnum)
+
+
+def prefix_query(q: str) -> wq.Query | None:
+    """Query matching documents with a name containing words starting with
+    each word of `q`, or `None` if `q` has no word long enough."""
+    words = [token.text for token in accent_folder(q)]
+    words = [word for word in words if len(word) >= MIN_NGRAM_SIZE]
+    if not words:
+        return None
+
+    terms = []
+    for word in words:
+        terms.append(wq.Term("name_prefix", word[:MAX_NGRAM_SIZE]))
+        if len(word) > MAX_NGRAM_SIZE:
+            # longer than indexed ngrams: check the whole word
+            terms.append(wq.Prefix("name", word))
+    return wq.And(terms) if len(terms) > 1 else terms[0]
+
+
+class LiveSearch:
+    """Typeahead search engine, shared by all requests of an application.
+
+    :param cache_size: number of cached results.
+    """
+
+    def __init__(self, cache_size: int = 512) -> None:
+        self.cache_size = cache_size
+        self._lock = threading.Lock()
+        self._cache: OrderedDict[Hashable, tuple[int | None, LiveResults]] = (
+            OrderedDict()
+        )
+        self.hits = 0
+        self.misses = 0
+        self.timeouts = 0
+
+    def search(
+        self,
+        searcher: Searcher,
+        q: str,
+        allowed: BitSet,
+        *,
+        filters: Sequence[wq.Query] = (),
+        cache_key: Hashable = None,
+        limit: int = 5,
+        types: int | None = None,
+        time_limit: float | None = None,
+    ) -> LiveResults:
+        """Return up to `limit` hits by object type for `q`.
+
+        :param allowed: documents the user can see, of the searched types.
+        :param filters: other filter queries (i.e from registered search
+            filters).
+        :param cache_key: identifies `allowed` and `filters`, i.e the role
+            signature of the user.
+        :param types: number of searched object types. The best
+            `limit * types` hits are collected, which lets the collector
+            skip documents that can't make it.
+        """
+        query = prefix_query(q)
+        if query is None or not allowed:
+            # whoosh ignores empty filters
+            return {}
+
+        generation = searcher.reader().generation()
+        key = (cache_key, tuple(filters), query, limit)
+        with self._lock:
+            entry = self._cache.get(key)
+            if entry is not None and entry[0] == generation:
+                self._cache.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+
+        if filters:
+            query = wq.And([*filters, query])
+
+        collector = searcher.collector(
+            limit=limit * types if types else None,
+            filter=None if time_limit else allowed,
+            collapse="object_type",
+            collapse_limit=limit,
+        )
+        timed_out = False
+        if time_limit:
+            collector = _TimeLimitFilterCollector(collector, allowed, time_limit)
+        try:
+            searcher.search_with_collector(query, collector)
+        except TimeLimit:
+            timed_out = True
+            self.timeouts += 1
+        results = collector.results()
+
+        by_type: LiveResults = {}
+        for hit in results:
+            fields = hit.fields()
+            hits = by_type.setdefault(fields.get("object_type"), [])
+            if len(hits) < limit:
+                hits.append(fields)
+
+        if not timed_out:
+            # incomplete results are not cached
+            with self._lock:
+                self._cache[key] = (generation, by_type)
+                self._cache.move_to_end(key)
+                while len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+
+        return by_type
+
+    def clear(self) -> None:
+        with self._lock:
+            self._cache.clear()
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "entries": len(self._cache),
+            "hits": self.hits,
+            "misses": self.misses,
+            "timeouts": self.timeouts,
+        }
@@ -0,0 +1,185 @@
+# Copyright (c) 2012-2024, Abilian SAS
+
+"""Searchers shared by all requests of a process.
+
+Opening a searcher reads the table of contents of the index and opens the
+files of all its segments. The pool keeps one searcher per index, and only
+replaces it when a new generation of the index has been committed. Checking
+for a new generation reads the storage too: it is done at most once per
+`check_interval` seconds, or on next use after :meth:`SearcherPool.expire`.
+
+Searchers are reference counted: requests using a replaced searcher keep
+their snapshot of the index, and the searcher is closed when the last of them
+releases it.
+
+A new searcher is opened rather than refreshed with
+:meth:`whoosh.searching.Searcher.refresh`: the refreshed searcher reuses the
+segment readers of the previous one, and closes the others, which are still
+used by the requests holding the previous searcher.
+"""
+
+from __future__ import annotations
+
+import threading
+import time
+import weakref
+from contextlib import contextmanager
+from typing import TYPE_CHECKING, Any
+
+if TYPE_CHECKING:
+    from collections.abc import Iterator
+
+    from whoosh.index import Index
+    from whoosh.searching import Searcher
+
+__all__ = ["SearcherPool"]
+
+#: default for `SEARCH_CHECK_INTERVAL`, in seconds
+DEFAULT_CHECK_INTERVAL = 1.0
+
+
+class _PooledSearcher:
+    __slots__ = ("checked_at", "index", "refs", "retired", "searcher")
+
+    def __init__(self, index: Index, searcher: Searcher) -> None:
+        self.index = index
+        self.searcher = searcher
+        self.refs = 0
+        self.retired = False
+        #: `time.monotonic()` of the last check of the index generation
+        self.checked_at = time.monotonic()
+
+
+class SearcherPool:
+    """One searcher per index, shared by all threads of a process.
+
+    :param check_interval: minimum delay in seconds between checks for a new
+        generation of an index.
+    """
+
+    def __init__(self, check_interval: float = DEFAULT_CHECK_INTERVAL) -> None:
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        #: current searcher, by index name
+        self._current: dict[str, _PooledSearcher] = {}
+        #: all open searchers, current and retired, by `id()` of searcher
+        self._open: dict[int, _PooledSearcher] = {}
+        self.opened = 0
+        self.closed = 0
+
+    def acquire(self, name: str, index: Index) -> Searcher:
+        """Return the current searcher on `index`, reopened if a new generation
+        has been committed.
+
+        It must be given back with :meth:`release`.
+        """
+        now = time.monotonic()
+        with self._lock:
+            entry = self._current.get(name)
+            if entry is not None and entry.index is not index:
+                # index has been recreated
+                entry = None
+            if entry is not None and now - entry.checked_at < self.check_interval:
+                entry.refs += 1
+                return entry.searcher
+
+        # checking the generation reads the storage: not under the lock
+        if entry is not None and entry.searcher.up_to_date():
+            with self._lock:
+                if self._current.get(name) is entry:
+                    entry.checked_at = now
+                    entry.refs += 1
+                    return entry.searcher
+
+        searcher = index.searcher()
+        entry = _PooledSearcher(index, searcher)
+        entry.refs = 1
+        with self._lock:
+            previous = self._current.get(name)
+            self._current[name] = entry
+            self._open[id(searcher)] = entry
+            self.opened += 1
+            to_close = self._retire(previous)
+
+        if to_close is not None:
+            to_close.close()
+        return searcher
+
+    def expire(self, name: str) -> None:
+        """Check for a new generation of index `name` on next use, i.e after a
+        commit by this process."""
+        with self._lock:
+            entry = self._current.get(name)
+            if entry is not None:
+                entry.checked_at = -float("inf")
+
+    def release(self, searcher: Searcher) -> None:
+        """Give back a searcher returned by :meth:`acquire`."""
+        with self._lock:
+            entry = self._open.get(id(searcher))
+            if entry is None or entry.searcher is not searcher:
+                return
+            entry.refs -= 1
+            if not entry.retired or entry.refs > 0:
+                return
+            del self._open[id(searcher)]
+            self.closed += 1
+
+        searcher.close()
+
+    @contextmanager
+    def searcher(self, name: str, index: Index) -> Iterator[Searcher]:
+        """Hold the current searcher on `index` until the end of the `with`
+        block."""
+        searcher = self.acquire(name, index)
+        try:
+            yield searcher
+        finally:
+            self.release(searcher)
+
+    def keep(self, searcher: Searcher, obj: Any) -> None:
+        """Hold `searcher` until `obj` is garbage collected.
+
+        i.e search results, which read stored fields from the searcher when
+        they are used.
+        """
+        with self._lock:
+            entry = self._open[id(searcher)]
+            entry.refs += 1
+        weakref.finalize(obj, self.release, searcher)
+
+    def clear(self) -> None:
+        """Retire all searchers: they are closed once released."""
+        with self._lock:
+            to_close = [self._retire(entry) for entry in self._current.values()]
+            self._current.clear()
+
+        for searcher in to_close:
+            if searcher is not None:
+                searcher.close()
+
+    def _retire(self, entry: _PooledSearcher | None) -> Searcher | None:
+        """Mark `entry` as replaced; must be called with the lock held.
+
+        Returns its searcher if it must be closed now.
+        """
+        if entry is None:
+            return None
+        entry.retired = True
+        if entry.refs > 0:
+            return None
+        del self._open[id(entry.searcher)]
+        self.closed += 1
+        return entry.searcher
+
+    def stats(self) -> dict[str, Any]:
+        """Open readers metrics of this process."""
+        with self._lock:
+            entries = list(self._open.values())
+        return {
+            "open": len(entries),
+            "retired": sum(1 for entry in entries if entry.retired),
+            "in_use": sum(entry.refs for entry in entries),
+            "opened": self.opened,
+            "closed": self.closed,
+        }
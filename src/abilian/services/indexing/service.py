@@ -15,10 +15,12 @@ Based on Flask-whooshalchemy by Karl Gyllstrom.
 from __future__ import annotations
 
 import contextlib
+import math
 import os
+from contextlib import contextmanager
 from inspect import isclass
 from pathlib import Path
-from typing import TYPE_CHECKING, Any, Never
+from typing import TYPE_CHECKING, Any, NamedTuple, Never
 
 import sqlalchemy as sa
 from flask import Flask, appcontext_pushed, current_app, g
@@ -30,6 +32,8 @@ from whoosh import query as wq
 from whoosh.filedb.filestore import FileStorage, RamStorage
 from whoosh.index import FileIndex, Index
 from whoosh.qparser import DisMaxParser
+from whoosh.searching import ResultsPage
+from whoosh.sorting import Count, FieldFacet
 from whoosh.writing import CLEAR, AsyncWriter
 
 from abilian.core import signals
@@ -39,21 +43,40 @@ from abilian.core.extensions import db
 from abilian.core.models.subjects import Group, User
 from abilian.core.util import fqcn as base_fqcn, friendly_fqcn
 from abilian.services import Service, ServiceState
+from abilian.services.base import ServiceNotRegisteredError
 from abilian.services.security import ANONYMOUS, AUTHENTICATED, Role, security
 
 from .adapter import SAAdapter
+from .batch import indexing_batch
+from .filter_cache import FacetCountCache, SearchFilterCache
+from .live import DEFAULT_TIME_LIMIT, LiveResults, LiveSearch
 from .schema import DefaultSearchSchema, indexable_role
+from .searchers import DEFAULT_CHECK_INTERVAL, SearcherPool
+from .update_queue import IndexUpdateQueue
 
 if TYPE_CHECKING:
-    from collections.abc import Collection
+    from collections.abc import Collection, Iterator
 
     from sqlalchemy.orm.unitofwork import UOWTransaction
+    from whoosh.idsets import BitSet
+    from whoosh.searching import Searcher
 
     from abilian.app import Application
     from abilian.core.models import Model
 
 PENDING_INDEXATION_ATTR = "abilian_pending_indexation"
 
+COUNT_OBJECT_TYPE_FACET = FieldFacet("object_type", maptype=Count)
+
+
+class SearchPage(NamedTuple):
+    """A page of search results, returned by
+    :meth:`WhooshIndexService.search_page`."""
+
+    results: ResultsPage
+    #: number of results by object type, for all object types
+    counts: dict[str, int]
+
 
 def url_for_hit(hit, default="#"):
     """Helper for building URLs from results."""
@@ -84,6 +107,11 @@ class IndexServiceState(ServiceState):
         self.search_filter_funcs = []
         self.value_provider_funcs = []
         self.url_for_hit = url_for_hit
+        self.update_queue: IndexUpdateQueue | None = None
+        self.filter_cache = SearchFilterCache()
+        self.facet_cache = FacetCountCache()
+        self.live_search = LiveSearch()
+        self.searchers = SearcherPool()
 
     @property
     def to_update(self) -> list[tuple[str, Entity]]:
@@ -136,6 +164,19 @@ class WhooshIndexService(IndexService):
             whoosh_base.mkdir(parents=True)
 
         state.whoosh_base = str(whoosh_base.resolve())
+        state.searchers.check_interval = app.config.get(
+            "SEARCH_CHECK_INTERVAL", DEFAULT_CHECK_INTERVAL
+        )
+
+        # if enabled, updates from many transactions are coalesced and sent as
+        # one message, written with one writer commit.
+        max_delay = app.config.get("INDEXING_QUEUE_MAX_DELAY", 0)
+        if max_delay > 0:
+            state.update_queue = IndexUpdateQueue(
+                send=_send_index_update,
+                max_size=app.config.get("INDEXING_QUEUE_MAX_SIZE", 1000),
+                max_delay=max_delay,
+            )
 
         if not self._listening:
             event.listen(Session, "after_flush", self.after_flush)
@@ -144,12 +185,19 @@ class WhooshIndexService(IndexService):
 
         appcontext_pushed.connect(self.clear_update_queue, app)
         signals.register_js_api.connect(self._do_register_js_api)
+        signals.security_changed.connect(self._clear_filter_cache)
 
     def _do_register_js_api(self, sender: Application) -> None:
         app = sender
         js_api = app.js_api.setdefault("search", {})
         js_api["object_types"] = self.searchable_object_types()
 
+    def _clear_filter_cache(self, sender: Any, **kwargs: Any) -> None:
+        with contextlib.suppress(RuntimeError, ServiceNotRegisteredError):
+            self.app_state.filter_cache.clear()
+            self.app_state.facet_cache.clear()
+            self.app_state.live_search.clear()
+
     def register_search_filter(self, func) -> None:
         """Register a function that returns a query used for filtering search
         results. This query is And'ed with other filters.
@@ -199,6 +247,13 @@ class WhooshIndexService(IndexService):
 
             state.indexes[name] = index
 
+        # cached doc ids are only valid for the indexes they were read from,
+        # and generations of a recreated index start over
+        state.searchers.clear()
+        state.filter_cache.clear()
+        state.facet_cache.clear()
+        state.live_search.clear()
+
     def clear(self) -> None:
         """Remove all content from indexes, and unregister all classes.
 
@@ -213,6 +268,7 @@ class WhooshIndexService(IndexService):
             writer.commit(merge=True, optimize=True, mergetype=CLEAR)
 
         state.indexes.clear()
+        state.searchers.clear()
         state.indexed_classes.clear()
         state.indexed_fqcn.clear()
         self.clear_update_queue()
@@ -223,6 +279,21 @@ class WhooshIndexService(IndexService):
     def index(self, name: str = "default") -> Index:
         return self.app_state.indexes[name]
 
+    @contextmanager
+    def searcher(self, index_name: str = "default") -> Iterator[Searcher]:
+        """Hold the shared searcher on index `index_name` until the end of the
+        `with` block."""
+        index = self.app_state.indexes[index_name]
+        with self.app_state.searchers.searcher(index_name, index) as searcher:
+            yield searcher
+
+    def stats(self) -> dict[str, dict[str, Any]]:
+        """Open searchers and live search cache metrics of this process."""
+        return {
+            "searchers": self.app_state.searchers.stats(),
+            "live_search": self.app_state.live_search.stats(),
+        }
+
     @property
     def default_search_fields(self) -> dict[str, float]:
         """Return default field names and boosts to be used for searching.
@@ -236,43 +307,32 @@ class WhooshIndexService(IndexService):
 
     def searchable_object_types(self) -> list:
         """List of (object_types, friendly name) present in the index."""
-        try:
-            idx = self.index()
-        except KeyError:
+        if "default" not in self.app_state.indexes:
             # index does not exists: service never started, may happens during
             # tests
             return []
 
-        with idx.reader() as r:
-            indexed = sorted(set(r.field_terms("object_type")))
+        with self.searcher() as searcher:
+            indexed = sorted(set(searcher.reader().field_terms("object_type")))
         app_indexed = self.app_state.indexed_fqcn
 
         return [(name, friendly_fqcn(name)) for name in indexed if name in app_indexed]
 
-    def search(
+    def _prepare_search(
         self,
         q: str,
-        index_name: str = "default",
-        fields: dict[str, float] | None = None,
-        Models: Collection[type[Model]] = (),
-        object_types: Collection[str] = (),
-        prefix: bool = True,
-        facet_by_type: bool = False,
-        **search_args,
-    ):
-        """Interface to search indexes.
-
-        :param q: unparsed search string.
-        :param index_name: name of index to use for search.
-        :param fields: optionnal mapping of field names -> boost factor?
-        :param Models: list of Model classes to limit search on.
-        :param object_types: same as `Models`, but directly the model string.
-        :param prefix: enable or disable search by prefix
-        :param facet_by_type: if set, returns a dict of object_type: results with a
-             max of `limit` matches for each type.
-        :param search_args: any valid parameter for
-            :meth:`whoosh.searching.Search.search`. This includes `limit`,
-            `groupedby` and `sortedby`
+        index_name: str,
+        *,
+        fields: dict[str, float] | None,
+        Models: Collection[type[Model]],
+        object_types: Collection[str],
+        prefix: bool,
+        filter: wq.Query | None = None,
+    ) -> tuple[Index, wq.Query, frozenset[str] | None, set[str]]:
+        """Parse `q` and apply search filters.
+
+        :returns: index, query, role signature of current user (`None` for
+            managers, who see all documents) and object types to search.
         """
         index = self.app_state.indexes[index_name]
         if not fields:
@@ -290,23 +350,7 @@ class WhooshIndexService(IndexService):
         parser = DisMaxParser(fields, index.schema)
         query = parser.parse(q)
 
-        filters = search_args.setdefault("filter", None)
-        filters = [filters] if filters is not None else []
-        del search_args["filter"]
-
-        if not hasattr(g, "is_manager") or not g.is_manager:
-            # security access filter
-            user = current_user
-            roles = {indexable_role(user)}
-            if not user.is_anonymous:
-                roles.add(indexable_role(ANONYMOUS))
-                roles.add(indexable_role(AUTHENTICATED))
-                roles |= {indexable_role(r) for r in security.get_roles(user)}
-
-            filter_q = wq.Or(
-                [wq.Term("allowed_roles_and_users", role) for role in roles]
-            )
-            filters.append(filter_q)
+        role_signature = self._role_signature()
 
         object_types_set = set(object_types)
         for m in Models:
@@ -322,19 +366,111 @@ class WhooshIndexService(IndexService):
             # cleaned from index
             object_types_set = self.app_state.indexed_fqcn
 
-        # limit object_type
-        filter_q = wq.Or([wq.Term("object_type", t) for t in object_types_set])
-        filters.append(filter_q)
+        filters = self._search_filters(filter)
+        if filters:
+            filter_q = wq.And(filters) if len(filters) > 1 else filters[0]
+            # search_args['filter'] = filter_q
+            query = filter_q & query
 
+        return index, query, role_signature, object_types_set
+
+    @staticmethod
+    def _role_signature() -> frozenset[str] | None:
+        """Roles of current user, as indexed in `allowed_roles_and_users`, or
+        `None` for managers, who see all documents."""
+        if hasattr(g, "is_manager") and g.is_manager:
+            return None
+
+        # security access filter
+        user = current_user
+        roles = {indexable_role(user)}
+        if not user.is_anonymous:
+            roles.add(indexable_role(ANONYMOUS))
+            roles.add(indexable_role(AUTHENTICATED))
+            roles |= {indexable_role(r) for r in security.get_roles(user)}
+        return frozenset(roles)
+
+    def _search_filters(self, filter: wq.Query | None = None) -> list[wq.Query]:
+        """`filter` and queries of registered search filters."""
+        filters = [filter] if filter is not None else []
         for func in self.app_state.search_filter_funcs:
             filter_q = func()
             if filter_q is not None:
                 filters.append(filter_q)
+        return filters
 
-        if filters:
-            filter_q = wq.And(filters) if len(filters) > 1 else filters[0]
-            # search_args['filter'] = filter_q
-            query = filter_q & query
+    def _security_and_types_filter(
+        self,
+        searcher: Searcher,
+        index_name: str,
+        role_signature: frozenset[str] | None,
+        object_types: Collection[str],
+    ) -> BitSet:
+        """Documents of `object_types` that can be read with roles
+        `role_signature`.
+
+        They are the same for all users with the same roles: they are cached
+        as doc id sets for the current index generation.
+        """
+
+        def security_and_types_filter() -> wq.Query:
+            # limit object_type
+            filter_q = wq.Or([wq.Term("object_type", t) for t in object_types])
+            if role_signature is not None:
+                roles_q = wq.Or(
+                    [
+                        wq.Term("allowed_roles_and_users", role)
+                        for role in role_signature
+                    ]
+                )
+                filter_q = roles_q & filter_q
+            return filter_q
+
+        cache_key = (index_name, role_signature, frozenset(object_types))
+        return self.app_state.filter_cache.get(
+            searcher, cache_key, security_and_types_filter
+        )
+
+    @staticmethod
+    def _filtered(query: wq.Query, allowed: BitSet) -> wq.Query:
+        """`query`, or a query matching nothing if no document is `allowed`:
+        whoosh ignores empty filters."""
+        return query if allowed else wq.NullQuery
+
+    def search(
+        self,
+        q: str,
+        index_name: str = "default",
+        fields: dict[str, float] | None = None,
+        Models: Collection[type[Model]] = (),
+        object_types: Collection[str] = (),
+        prefix: bool = True,
+        facet_by_type: bool = False,
+        **search_args,
+    ):
+        """Interface to search indexes.
+
+        :param q: unparsed search string.
+        :param index_name: name of index to use for search.
+        :param fields: optionnal mapping of field names -> boost factor?
+        :param Models: list of Model classes to limit search on.
+        :param object_types: same as `Models`, but directly the model string.
+        :param prefix: enable or disable search by prefix
+        :param facet_by_type: if set, returns a dict of object_type: results with a
+             max of `limit` matches for each type.
+        :param search_args: any valid parameter for
+            :meth:`whoosh.searching.Search.search`. This includes `limit`,
+            `groupedby` and `sortedby`
+        """
+        index, query, role_signature, object_types_set = self._prepare_search(
+            q,
+            index_name,
+            fields=fields,
+            Models=Models,
+            object_types=object_types,
+            prefix=prefix,
+            filter=search_args.pop("filter", None),
+        )
 
         if facet_by_type:
             if not object_types_set:
@@ -347,10 +483,16 @@ class WhooshIndexService(IndexService):
             search_args["collapse_limit"] = collapse_limit
             search_args["limit"] = collapse_limit * max(len(object_types_set), 1)
 
-        with index.searcher(closereader=False) as searcher:
-            # 'closereader' is needed, else results cannot by used outside 'with'
-            # statement
-            results = searcher.search(query, **search_args)
+        searchers = self.app_state.searchers
+        with searchers.searcher(index_name, index) as searcher:
+            search_args["filter"] = self._security_and_types_filter(
+                searcher, index_name, role_signature, object_types_set
+            )
+            results = searcher.search(
+                self._filtered(query, search_args["filter"]), **search_args
+            )
+            # results are used after the `with` block
+            searchers.keep(searcher, results)
 
             if facet_by_type:
                 positions = {
@@ -366,6 +508,107 @@ class WhooshIndexService(IndexService):
 
             return results
 
+    def search_page(
+        self,
+        q: str,
+        page: int = 1,
+        pagelen: int = 20,
+        *,
+        index_name: str = "default",
+        fields: dict[str, float] | None = None,
+        object_types: Collection[str] = (),
+        prefix: bool = True,
+    ) -> SearchPage:
+        """Return a page of the results of `q`, with the number of results of
+        each object type.
+
+        Results are limited to `object_types` if set, while counts are for
+        all object types. Counts are cached for the query, the roles of the
+        user and the index generation: they are only computed for the first
+        page requested, in the same pass as the results when no object type
+        is selected.
+
+        :param page: page number, starting at 1. Pages after the last one
+            return the last page.
+        """
+        index, query, role_signature, all_types = self._prepare_search(
+            q, index_name, fields=fields, Models=(), object_types=(), prefix=prefix
+        )
+        selected_types = set(object_types) & all_types if object_types else all_types
+        facet_cache = self.app_state.facet_cache
+        facet_key = (index_name, query, role_signature)
+
+        searchers = self.app_state.searchers
+        with searchers.searcher(index_name, index) as searcher:
+            all_types_filter = self._security_and_types_filter(
+                searcher, index_name, role_signature, all_types
+            )
+            counts = facet_cache.get(searcher, facet_key)
+            if counts is not None:
+                # no need to look further than the last page
+                total = sum(counts[t] for t in selected_types if t in counts)
+                page = max(min(page, math.ceil(total / pagelen)), 1)
+
+            search_args: dict[str, Any] = {"limit": page * pagelen}
+            if selected_types == all_types:
+                search_args["filter"] = all_types_filter
+                if counts is None:
+                    search_args["groupedby"] = COUNT_OBJECT_TYPE_FACET
+            else:
+                search_args["filter"] = self._security_and_types_filter(
+                    searcher, index_name, role_signature, selected_types
+                )
+                if counts is None:
+                    # counts ignore the object types filter: they need a
+                    # separate, unscored pass
+                    counts = searcher.search(
+                        self._filtered(query, all_types_filter),
+                        filter=all_types_filter,
+                        groupedby=COUNT_OBJECT_TYPE_FACET,
+                        scored=False,
+                        limit=1,
+                    ).groups("object_type")
+                    facet_cache.set(searcher, facet_key, counts)
+
+            results = searcher.search(
+                self._filtered(query, search_args["filter"]), **search_args
+            )
+            if counts is None:
+                counts = results.groups("object_type")
+                facet_cache.set(searcher, facet_key, counts)
+
+            # results are used after the `with` block
+            searchers.keep(searcher, results)
+
+            return SearchPage(ResultsPage(results, page, pagelen), dict(counts))
+
+    def live_search(
+        self, q: str, index_name: str = "default", limit: int = 5
+    ) -> LiveResults:
+        """Typeahead search: documents with names containing words starting
+        with the words of `q`.
+
+        :returns: stored fields of up to `limit` documents, by object type.
+        """
+        role_signature = self._role_signature()
+        object_types = self.app_state.indexed_fqcn
+        with self.searcher(index_name) as searcher:
+            allowed = self._security_and_types_filter(
+                searcher, index_name, role_signature, object_types
+            )
+            return self.app_state.live_search.search(
+                searcher,
+                q,
+                allowed,
+                filters=self._search_filters(),
+                cache_key=(index_name, role_signature),
+                limit=limit,
+                types=len(object_types),
+                time_limit=current_app.config.get(
+                    "SEARCH_LIVE_TIME_LIMIT", DEFAULT_TIME_LIMIT
+                ),
+            )
+
     def search_for_class(self, query, cls, index="default", **search_args):
         return self.search(query, Models=(fqcn(cls),), index=index, **search_args)
 
@@ -454,9 +697,12 @@ class WhooshIndexService(IndexService):
             logger.debug("after_commit() items={items}", items=items)
             if os.environ.get("TESTING_DIRECT_FUNCTION_CALL"):
                 index_update(index="default", items=items)
+            elif state.update_queue is not None:
+                # production call: queued, then sent to async dramatiq actor
+                state.update_queue.put("default", items)
             else:
-                # productioncall: async dramatiq actor
-                index_update.send(index="default", items=items)
+                # production call: sent to async dramatiq actor
+                _send_index_update("default", items)
 
         self.clear_update_queue()
 
@@ -499,7 +745,7 @@ class WhooshIndexService(IndexService):
         index = self.app_state.indexes[index_name]
         indexed = set()
 
-        with index.writer() as writer:
+        with index.writer() as writer, indexing_batch():
             for obj in objects:
                 document = self.get_document(obj)
                 if not document:
@@ -523,10 +769,16 @@ class WhooshIndexService(IndexService):
                     raise
                 indexed.add(object_key)
 
+        self.app_state.searchers.expire(index_name)
+
 
 service = WhooshIndexService()
 
 
+def _send_index_update(index: str, items: list[tuple[str, str, int, dict]]) -> None:
+    index_update.send(index=index, items=items)
+
+
 @dramatiq.actor
 def index_update(index: str, items: list[tuple[str, str, int, dict]]) -> None:
     """
@@ -543,49 +795,61 @@ def index_update(index: str, items: list[tuple[str, str, int, dict]]) -> None:
     # session = safe_session()
     session = Session(bind=db.session.get_bind(None, None))
     updated = set()
-    writer = AsyncWriter(index)
-    try:
-        for op, cls_name, pk, data in items:
-            if pk is None:
-                continue
 
-            # always delete. Whoosh manual says that 'update' is actually delete + add
-            # operation
-            object_key = f"{cls_name}:{pk}"
-            writer.delete_by_term("object_key", object_key)
+    # load all objects of a class with one query, instead of one query (and
+    # lazy loads) per object
+    to_retrieve: dict[str, set[int]] = {}
+    for op, cls_name, pk, _data in items:
+        if pk is not None and op in ("new", "changed") and cls_name in adapted:
+            to_retrieve.setdefault(cls_name, set()).add(pk)
 
-            adapter = adapted.get(cls_name)
-            if not adapter:
-                # FIXME: log to sentry?
-                continue
+    retrieved = {
+        cls_name: adapted[cls_name].retrieve_many(pks, _session=session)
+        for cls_name, pks in to_retrieve.items()
+    }
 
-            if object_key in updated:
-                # don't add twice the same document in same transaction. The writer will
-                # not delete previous records, ending in duplicate records for same
-                # document.
-                continue
+    writer = AsyncWriter(index)
+    try:
+        with indexing_batch():
+            for op, cls_name, pk, _data in items:
+                if pk is None:
+                    continue
 
-            if op in ("new", "changed"):
-                with session.begin(nested=True):
-                    obj = adapter.retrieve(pk, _session=session, **data)
+                # always delete. Whoosh manual says that 'update' is actually
+                # delete + add operation
+                object_key = f"{cls_name}:{pk}"
+                writer.delete_by_term("object_key", object_key)
 
-                if obj is None:
-                    # deleted after task queued, but before task run
+                adapter = adapted.get(cls_name)
+                if not adapter:
+                    # FIXME: log to sentry?
                     continue
 
-                document = service.get_document(obj, adapter)
-                try:
-                    writer.add_document(**document)
-                except ValueError:
-                    # logger is here to give us more infos in order to catch a weird bug
-                    # that happens regularly on CI but is not reliably
-                    # reproductible.
-                    logger.opt(exception=True).error(
-                        "writer.add_document({document})",
-                        document=repr(document),
-                    )
-                    raise
-                updated.add(object_key)
+                if object_key in updated:
+                    # don't add twice the same document in same transaction. The
+                    # writer will not delete previous records, ending in duplicate
+                    # records for same document.
+                    continue
+
+                if op in ("new", "changed"):
+                    obj = retrieved[cls_name].get(pk)
+                    if obj is None:
+                        # deleted after task queued, but before task run
+                        continue
+
+                    document = service.get_document(obj, adapter)
+                    try:
+                        writer.add_document(**document)
+                    except ValueError:
+                        # logger is here to give us more infos in order to catch a
+                        # weird bug that happens regularly on CI but is not reliably
+                        # reproductible.
+                        logger.opt(exception=True).error(
+                            "writer.add_document({document})",
+                            document=repr(document),
+                        )
+                        raise
+                    updated.add(object_key)
     except Exception:
         writer.cancel()
         raise
@@ -599,6 +863,8 @@ def index_update(index: str, items: list[tuple[str, str, int, dict]]) -> None:
         # async thread: wait for its termination
         writer.join()
 
+    service.app_state.searchers.expire(index_name)
+
 
 class TestingStorage(RamStorage):
     """RamStorage whoses temp_storage method returns another TestingStorage
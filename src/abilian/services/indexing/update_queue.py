@@ -0,0 +1,180 @@
+# Copyright (c) 2012-2024, Abilian SAS
+
+"""Coalescing queue for index updates.
+
+Index updates from many transactions are collected and sent as a single
+:func:`index_update` message, so that the index receives one writer
+commit per window instead of one per transaction.
+
+Pending updates of all queues are sent when the process exits. A forked
+child process starts with empty queues: pending updates are sent by the
+parent.
+"""
+
+from __future__ import annotations
+
+import atexit
+import os
+import threading
+import time
+import weakref
+from typing import TYPE_CHECKING, Any
+
+from loguru import logger
+
+if TYPE_CHECKING:
+    from collections.abc import Callable, Iterable
+
+#: (operation, full class name, primary key, data)
+Item = tuple[str, str, int, dict]
+
+__all__ = ["IndexUpdateQueue"]
+
+#: all queues of the process, flushed at exit
+_QUEUES: weakref.WeakSet[IndexUpdateQueue] = weakref.WeakSet()
+
+
+class IndexUpdateQueue:
+    """Collect index updates until `max_size` objects are pending or the oldest
+    one has waited `max_delay` seconds, then send them at once.
+
+    Updates are de-duplicated by object key: only the last operation for an
+    object is kept. If `max_delay` is 0, updates are sent immediately.
+    """
+
+    def __init__(
+        self,
+        send: Callable[[str, list[Item]], Any],
+        max_size: int = 1000,
+        max_delay: float = 2.0,
+    ) -> None:
+        self._send = send
+        self.max_size = max_size
+        self.max_delay = max_delay
+
+        self._lock = threading.Lock()
+        #: index name -> object key -> item
+        self._pending: dict[str, dict[str, Item]] = {}
+        self._oldest: float | None = None
+        self._timer: threading.Timer | None = None
+
+        # metrics
+        self.received_count = 0
+        self.sent_count = 0
+        self.flush_count = 0
+        self.last_flush_latency = 0.0
+        self.max_flush_latency = 0.0
+
+        _QUEUES.add(self)
+
+    @property
+    def depth(self) -> int:
+        """Number of pending objects."""
+        return sum(len(items) for items in self._pending.values())
+
+    def put(self, index: str, items: Iterable[Item]) -> None:
+        with self._lock:
+            pending = self._pending.setdefault(index, {})
+            for item in items:
+                _op, cls_name, pk, _data = item
+                object_key = f"{cls_name}:{pk}"
+                # re-insert, so that order follows the last operation
+                pending.pop(object_key, None)
+                pending[object_key] = item
+                self.received_count += 1
+
+            if self._oldest is None:
+                self._oldest = time.monotonic()
+
+            if self.max_delay <= 0 or self.depth >= self.max_size:
+                batches = self._take()
+            else:
+                batches = None
+                if self._timer is None:
+                    self._timer = threading.Timer(self.max_delay, self.flush)
+                    self._timer.daemon = True
+                    self._timer.start()
+
+        if batches:
+            self._send_batches(*batches)
+
+    def flush(self) -> None:
+        """Send all pending updates now."""
+        with self._lock:
+            batches = self._take()
+        self._send_batches(*batches)
+
+    def metrics(self) -> dict[str, Any]:
+        with self._lock:
+            return {
+                "depth": self.depth,
+                "received": self.received_count,
+                "sent": self.sent_count,
+                "flushes": self.flush_count,
+                "last_flush_latency": self.last_flush_latency,
+                "max_flush_latency": self.max_flush_latency,
+            }
+
+    def _reset_after_fork(self) -> None:
+        # the timer thread and a held lock are not inherited: start over.
+        # Pending updates are sent by the parent process.
+        self._lock = threading.Lock()
+        self._timer = None
+        self._pending = {}
+        self._oldest = None
+
+    def _take(self) -> tuple[dict[str, list[Item]], float]:
+        """Empty the queue; must be called with the lock held.
+
+        Returns the pending items per index, and how long the oldest one
+        has waited.
+        """
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+        latency = 0.0
+        if self._oldest is not None:
+            latency = time.monotonic() - self._oldest
+            self._oldest = None
+
+        batches = {
+            index: list(pending.values())
+            for index, pending in self._pending.items()
+            if pending
+        }
+        self._pending = {}
+        return batches, latency
+
+    def _send_batches(self, batches: dict[str, list[Item]], latency: float) -> None:
+        if not batches:
+            return
+
+        for index, items in batches.items():
+            self._send(index, items)
+            with self._lock:
+                self.sent_count += len(items)
+
+        with self._lock:
+            self.flush_count += 1
+            self.last_flush_latency = latency
+            self.max_flush_latency = max(self.max_flush_latency, latency)
+        logger.debug(
+            "Index update queue flushed: {count} items, {latency:.3f}s latency",
+            count=sum(len(items) for items in batches.values()),
+            latency=latency,
+        )
+
+
+def _flush_all() -> None:
+    for queue in list(_QUEUES):
+        queue.flush()
+
+
+def _reset_all_after_fork() -> None:
+    for queue in list(_QUEUES):
+        queue._reset_after_fork()
+
+
+atexit.register(_flush_all)
+os.register_at_fork(after_in_child=_reset_all_after_fork)
@@ -0,0 +1,109 @@
+# Copyright (c) 2012-2024, Abilian SAS
+
+"""Cache for permission decisions.
+
+The same permission is often checked many times for the same user and
+object while rendering a single page (actions, templates, folder
+listings). Decisions are kept for the duration of the application
+context (i.e the current request), and optionally shared between requests
+for a limited time.
+"""
+
+from __future__ import annotations
+
+import threading
+import time
+from collections import OrderedDict
+from typing import TYPE_CHECKING, Any
+
+from flask import g, has_app_context
+
+if TYPE_CHECKING:
+    from collections.abc import Hashable
+
+__all__ = ["PermissionCache"]
+
+_G_ATTR = "_permission_cache"
+
+
+class PermissionCache:
+    """Two tier cache of permission decisions.
+
+    :param ttl: lifetime in seconds of decisions shared between requests.
+        `0` disables the shared tier: decisions are only kept for the current
+        request.
+    :param max_size: maximum number of decisions in the shared tier.
+    """
+
+    def __init__(self, ttl: float = 0, max_size: int = 10000) -> None:
+        self.ttl = ttl
+        self.max_size = max_size
+        self._lock = threading.Lock()
+        self._shared: OrderedDict[Hashable, tuple[float, bool]] = OrderedDict()
+        self._generation = 0
+        self.hits = 0
+        self.misses = 0
+
+    def _local(self) -> dict[Hashable, bool] | None:
+        """Return the cache of the current application context."""
+        if not has_app_context():
+            return None
+
+        entry = g.get(_G_ATTR)
+        if entry is None or entry[0] is not self or entry[1] != self._generation:
+            entry = (self, self._generation, {})
+            setattr(g, _G_ATTR, entry)
+        return entry[2]
+
+    def get(self, key: Hashable) -> bool | None:
+        """Return the decision cached for `key`, or `None`."""
+        local = self._local()
+        with self._lock:
+            if local is not None and key in local:
+                self.hits += 1
+                return local[key]
+
+            entry = self._shared.get(key) if self.ttl else None
+            if entry is not None:
+                expires, value = entry
+                if expires > time.monotonic():
+                    self._shared.move_to_end(key)
+                    self.hits += 1
+                    if local is not None:
+                        local[key] = value
+                    return value
+                del self._shared[key]
+
+            self.misses += 1
+            return None
+
+    def set(self, key: Hashable, value: bool) -> None:
+        local = self._local()
+        if local is not None:
+            local[key] = value
+
+        if self.ttl:
+            with self._lock:
+                self._shared[key] = (time.monotonic() + self.ttl, value)
+                self._shared.move_to_end(key)
+                while len(self._shared) > self.max_size:
+                    self._shared.popitem(last=False)
+
+    def clear(self) -> None:
+        """Forget all decisions, in all requests."""
+        with self._lock:
+            self._shared.clear()
+            self._generation += 1
+
+    def stats(self) -> dict[str, Any]:
+        with self._lock:
+            hits, misses = self.hits, self.misses
+            shared_size = len(self._shared)
+        total = hits + misses
+        return {
+            "hits": hits,
+            "misses": misses,
+            "hit_ratio": hits / total if total else 0.0,
+            "shared_size": shared_size,
+            "ttl": self.ttl,
+        }
@@ -4,6 +4,7 @@
 
 from __future__ import annotations
 
+import contextlib
 from functools import wraps
 from itertools import chain
 from typing import TYPE_CHECKING, Any
@@ -11,14 +12,17 @@ from typing import TYPE_CHECKING, Any
 import sqlalchemy as sa
 from flask import g
 from flask_login import current_user
-from sqlalchemy import sql
+from sqlalchemy import event, sql
 from sqlalchemy.orm import Session, object_session, subqueryload
 
+from abilian.core import signals
 from abilian.core.entities import Entity
 from abilian.core.extensions import db
 from abilian.core.models.subjects import Group, Principal, User
 from abilian.core.util import unwrap
 from abilian.services import Service, ServiceState
+from abilian.services.base import ServiceNotRegisteredError
+from abilian.services.security.cache import PermissionCache
 from abilian.services.security.models import (
     ADMIN,
     ANONYMOUS,
@@ -44,8 +48,10 @@ from abilian.services.security.models import (
 )
 
 if TYPE_CHECKING:
-    from collections.abc import Callable, Collection
+    from collections.abc import Callable, Collection, Sequence
 
+    from sqlalchemy.engine import Connection
+    from sqlalchemy.orm import Mapper
     from sqlalchemy.sql.selectable import Exists
 
     from abilian.app import Application
@@ -84,6 +90,7 @@ class SecurityServiceState(ServiceState):
     use_cache = True
     #: True if security has changed
     needs_db_flush = False
+    permission_cache: PermissionCache
 
 
 def require_flush(fun: Callable) -> Callable:
@@ -164,14 +171,67 @@ def query_pa_no_flush(
         )
 
 
+#: attributes that change permissions computed on objects or for principals
+SECURITY_ATTRS = ("owner", "creator", "inherit_security", "parent", "groups", "members")
+
+
+#: models whose changes change permissions
+SECURITY_MODELS = (RoleAssignment, PermissionAssignment, SecurityAudit)
+
+
+def _security_attrs_changed(obj: Any) -> bool:
+    attrs = sa.inspect(obj).attrs
+    return any(
+        name in attrs and attrs[name].history.has_changes() for name in SECURITY_ATTRS
+    )
+
+
 class SecurityService(Service):
     name = "security"
     AppStateClass = SecurityServiceState
+    _listening = False
 
     def init_app(self, app: Application) -> None:
         super().init_app(app)
         state = app.extensions[self.name]
         state.use_cache = True
+        state.permission_cache = PermissionCache(
+            ttl=app.config.get("SECURITY_PERMISSION_CACHE_TTL", 0),
+            max_size=app.config.get("SECURITY_PERMISSION_CACHE_SIZE", 10000),
+        )
+
+        if not self._listening:
+            for model in SECURITY_MODELS:
+                for name in ("after_insert", "after_update", "after_delete"):
+                    event.listen(model, name, self._on_security_model_change)
+            for model in (Entity, Principal):
+                event.listen(
+                    model, "after_update", self._on_object_update, propagate=True
+                )
+            # decisions made in a transaction may depend on its changes
+            event.listen(Session, "after_rollback", self._clear_permission_cache)
+            self._listening = True
+
+        signals.security_changed.connect(self._clear_permission_cache)
+
+    def _on_security_model_change(
+        self, mapper: Mapper, connection: Connection, target: Any
+    ) -> None:
+        self._clear_permission_cache(target)
+
+    def _on_object_update(
+        self, mapper: Mapper, connection: Connection, target: Any
+    ) -> None:
+        if _security_attrs_changed(target):
+            self._clear_permission_cache(target)
+
+    def _clear_permission_cache(self, sender: Any, **kwargs: Any) -> None:
+        with contextlib.suppress(RuntimeError, ServiceNotRegisteredError):
+            self.app_state.permission_cache.clear()
+
+    def permission_cache_stats(self) -> dict[str, Any]:
+        """Hit / miss statistics of the permission decision cache."""
+        return self.app_state.permission_cache.stats()
 
     def _needs_flush(self) -> None:
         """Mark next security queries needs DB flush to have up to date
@@ -588,6 +648,7 @@ class SecurityService(Service):
 
         if hasattr(principal, "__roles_cache__"):
             del principal.__roles_cache__
+        signals.security_changed.send(self)
 
     def ungrant_role(
         self, principal: Principal, role: Role | str, object: Model | None = None
@@ -635,6 +696,7 @@ class SecurityService(Service):
         session.add(audit)
         self._needs_flush()
         self._clear_role_cache(principal)
+        signals.security_changed.send(self)
 
     @require_flush
     def get_role_assignements(self, obj: Model) -> list:
@@ -668,7 +730,7 @@ class SecurityService(Service):
         permission: Permission | str,
         obj: Model | None = None,
         inherit: bool = False,
-        roles: None | Role | str | list[Role | str] = None,
+        roles: Role | str | list[Role | str] | None = None,
     ) -> bool:
         """
         :param obj: target object to check permissions.
@@ -685,6 +747,62 @@ class SecurityService(Service):
         if not self.running:
             return True
 
+        # root always have any permission
+        if isinstance(user, User) and user.id == 0:
+            return True
+
+        cache_key = self._permission_cache_key(user, permission, obj, inherit, roles)
+        if cache_key is not None:
+            cached = self.app_state.permission_cache.get(cache_key)
+            if cached is not None:
+                return cached
+
+        result = self._has_permission(user, permission, obj, inherit, roles)
+        if cache_key is not None:
+            self.app_state.permission_cache.set(cache_key, result)
+        return result
+
+    def _permission_cache_key(
+        self,
+        user: User,
+        permission: Permission,
+        obj: Model | None,
+        inherit: bool,
+        roles: Role | str | list[Role | str] | None,
+    ) -> tuple | None:
+        """Key of a permission decision, or `None` if it must not be cached."""
+        if not self.app_state.use_cache:
+            return None
+
+        if user.is_anonymous:
+            user_key = None
+        elif isinstance(user, User) and user.id is not None:
+            user_key = user.id
+        else:
+            return None
+
+        if obj is None:
+            obj_key = None
+        elif isinstance(obj, Entity) and obj.id is not None:
+            obj_key = (obj.object_type, obj.id)
+        else:
+            return None
+
+        if roles is not None:
+            if isinstance(roles, (Role, str)):
+                roles = (roles,)
+            roles = frozenset(str(r) for r in roles)
+
+        return (user_key, str(permission), obj_key, inherit, roles)
+
+    def _has_permission(
+        self,
+        user: User,
+        permission: Permission,
+        obj: Model | None,
+        inherit: bool,
+        roles: Role | str | list[Role | str] | None,
+    ) -> bool:
         session = None
         if obj is not None:
             session = object_session(obj)
@@ -692,10 +810,6 @@ class SecurityService(Service):
         if session is None:
             session = db.session()
 
-        # root always have any permission
-        if isinstance(user, User) and user.id == 0:
-            return True
-
         # valid roles
         # 1: from database
         pa_filter = PermissionAssignment.object == None
@@ -743,6 +857,116 @@ class SecurityService(Service):
             for item in checked_objs
         )
 
+    def has_permission_batch(
+        self,
+        user: User,
+        permission: Permission | str,
+        obj_list: Sequence[Model],
+        inherit: bool = False,
+        roles: Role | str | list[Role | str] | None = None,
+    ) -> list[bool]:
+        """Same as :meth:`has_permission`, for each object of `obj_list`.
+
+        Permission assignments of all objects are fetched with a single query,
+        and parents are visited only once when checking with `inherit`.
+
+        :returns: a list of booleans, in the same order as `obj_list`.
+        """
+        if not isinstance(permission, Permission):
+            assert permission in PERMISSIONS
+            permission = Permission(permission)
+        user = unwrap(user)
+
+        if not self.running or (isinstance(user, User) and user.id == 0):
+            return [True] * len(obj_list)
+
+        cache = self.app_state.permission_cache
+        keys = [
+            self._permission_cache_key(user, permission, obj, inherit, roles)
+            for obj in obj_list
+        ]
+        results = [None if key is None else cache.get(key) for key in keys]
+        missing = [i for i, result in enumerate(results) if result is None]
+        if missing:
+            computed = self._has_permission_batch(
+                user, permission, [obj_list[i] for i in missing], inherit, roles
+            )
+            for i, result in zip(missing, computed, strict=True):
+                results[i] = result
+                if keys[i] is not None:
+                    cache.set(keys[i], result)
+
+        return results
+
+    def _has_permission_batch(
+        self,
+        user: User,
+        permission: Permission,
+        obj_list: Sequence[Model],
+        inherit: bool,
+        roles: Role | str | list[Role | str] | None,
+    ) -> list[bool]:
+        session = object_session(obj_list[0]) or db.session()
+
+        # valid roles, global and per object
+        ids = {obj.id for obj in obj_list if obj.id is not None}
+        pa_filter = PermissionAssignment.object_id == None
+        if ids:
+            pa_filter |= PermissionAssignment.object_id.in_(ids)
+        query = session.query(
+            PermissionAssignment.object_id, PermissionAssignment.role
+        ).filter(pa_filter, PermissionAssignment.permission == permission)
+
+        local_roles: dict[int | None, set[Role]] = {}
+        for object_id, role in query.yield_per(1000):
+            local_roles.setdefault(object_id, set()).add(role)
+
+        global_roles = local_roles.pop(None, set())
+        global_roles |= {ADMIN}
+        global_roles |= DEFAULT_PERMISSION_ROLE.get(permission, set())
+        if roles is not None:
+            if isinstance(roles, (Role, str)):
+                roles = (roles,)
+            global_roles |= {Role(r) for r in roles}
+
+        principals = [user, *list(user.groups)]
+        self._fill_role_cache_batch(principals)
+
+        # inheritance chains share their ancestors: memoize by object
+        chains: dict[int, list[Model]] = {}
+
+        def chain_for(obj: Model) -> list[Model]:
+            key = id(obj)
+            if key not in chains:
+                chain = [obj]
+                if obj.inherit_security and obj.parent is not None:
+                    chain += chain_for(obj.parent)
+                chains[key] = chain
+            return chains[key]
+
+        results = []
+        for obj in obj_list:
+            valid_roles = global_roles
+            if obj.id is not None and obj.id in local_roles:
+                valid_roles = global_roles | local_roles[obj.id]
+
+            if ANONYMOUS in valid_roles or (
+                AUTHENTICATED in valid_roles and not user.is_anonymous
+            ):
+                results.append(True)
+                continue
+
+            checked_objs = [None, *(chain_for(obj) if inherit else [obj])]
+            results.append(
+                any(
+                    self.has_role(principal, valid_roles, item)
+                    for principal in principals
+                    for item in checked_objs
+                )
+            )
+
+        return results
+
     def query_entity_with_permission(
         self,
         permission: Permission,
@@ -882,6 +1106,10 @@ class SecurityService(Service):
 
         # do it in any case: it could have been found in session.deleted
         session.add(pa)
+        # new objects get their default permissions here: they can't have
+        # cached decisions yet
+        if obj is None or obj.id is not None:
+            signals.security_changed.send(self)
 
     def delete_permission(
         self, permission: Permission, role: Role, obj: Model | None = None
@@ -900,6 +1128,7 @@ class SecurityService(Service):
             if obj:
                 # this seems to be required with sqlalchemy > 0.9
                 session.expire(obj, [PERMISSIONS_ATTR])
+            signals.security_changed.send(self)
 
     def filter_with_permission(
         self,
@@ -908,12 +1137,8 @@ class SecurityService(Service):
         obj_list: list[Model],
         inherit=False,
     ):
-        user = unwrap(user)
-        return [
-            obj
-            for obj in obj_list
-            if self.has_permission(user, permission, obj, inherit)
-        ]
+        allowed = self.has_permission_batch(user, permission, obj_list, inherit)
+        return [obj for obj, ok in zip(obj_list, allowed, strict=True) if ok]
 
 
 # Instanciate the service
@@ -5,7 +5,7 @@ from __future__ import annotations
 from datetime import datetime
 
 from sqlalchemy.orm import relationship
-from sqlalchemy.schema import Column, ForeignKey
+from sqlalchemy.schema import Column, ForeignKey, Index
 from sqlalchemy.types import DateTime, Integer
 
 from abilian.core.entities import Entity, db
@@ -29,6 +29,9 @@ def _default_from(column):
 
 class View(db.Model):
     __tablename__ = "view"
+    __table_args__ = (
+        Index("ix_view_entity_user", "entity_id", "user_id", unique=True),
+    )
 
     id = Column(Integer, primary_key=True, autoincrement=True, nullable=False)
 
@@ -41,6 +44,12 @@ class View(db.Model):
     user_id = Column(Integer, ForeignKey(User.id), nullable=False)
     user = relationship(User, foreign_keys=user_id)
 
+    #: number of hits, maintained when hits are recorded
+    hit_count = Column(Integer, default=0, server_default="0", nullable=False)
+
+    #: time of last hit
+    last_viewed_at = Column(DateTime, nullable=True)
+
     hits = relationship("Hit", backref="view", order_by="Hit.viewed_at", lazy="dynamic")
 
 
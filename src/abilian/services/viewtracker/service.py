@@ -1,42 +1,269 @@
 # Copyright (c) 2012-2024, Abilian SAS
 
+"""Record views of entities by users.
+
+Hits are buffered in process, and written in bulk when the buffer is full
+(`VIEWTRACKER_BATCH_SIZE` hits) or old enough
+(`VIEWTRACKER_FLUSH_INTERVAL` seconds, by a timer thread), so that recording
+a hit doesn't query the database in the request path. A forked child process
+starts with an empty buffer: buffered hits are written by the parent. Each :class:`View` maintains the
+number and the time of the last of its hits, so that statistics don't
+have to scan the `hit` table.
+"""
+
 from __future__ import annotations
 
+import atexit
+import os
+import threading
+import time
+import weakref
+from datetime import datetime
+from typing import TYPE_CHECKING, Any
+
+import sqlalchemy as sa
+from flask import current_app
+from loguru import logger
+from sqlalchemy.dialects import postgresql, sqlite
+
 from abilian.core.extensions import db
-from abilian.services import Service
+from abilian.services import Service, ServiceState
 
 from .models import Hit, View
 
+if TYPE_CHECKING:
+    from abilian.app import Application
+
 __all__ = ["viewtracker"]
 
+#: default number of buffered hits that triggers a flush
+DEFAULT_BATCH_SIZE = 100
+#: default maximum age in seconds of buffered hits
+DEFAULT_FLUSH_INTERVAL = 10.0
+
+_UPSERT_DIALECTS = {"postgresql": postgresql.insert, "sqlite": sqlite.insert}
+
+#: states of all apps of the process, by `id()`, reset in forked children
+_STATES: weakref.WeakValueDictionary[int, ViewTrackerState] = (
+    weakref.WeakValueDictionary()
+)
+
+
+class ViewTrackerState(ServiceState):
+    #: buffered hits: (entity id, user id, time of view)
+    pending: list[tuple[int, int, datetime]]
+    #: `time.monotonic()` of the oldest buffered hit
+    pending_since: float = 0.0
+    lock: threading.Lock
+    #: writes buffered hits once they are `VIEWTRACKER_FLUSH_INTERVAL` old
+    timer: threading.Timer | None = None
+
+    def __init__(self, service: ViewTracker, *args: Any, **kwargs: Any) -> None:
+        super().__init__(service, *args, **kwargs)
+        self.pending = []
+        self.lock = threading.Lock()
+        _STATES[id(self)] = self
+
+    def reset_after_fork(self) -> None:
+        # the timer thread and a held lock are not inherited: start over
+        self.lock = threading.Lock()
+        self.timer = None
+        self.pending = []
+
 
 class ViewTracker(Service):
     name = "viewtracker"
+    AppStateClass = ViewTrackerState
 
-    @staticmethod
-    def record_hit(entity, user) -> None:
-        # Using user_id here in case user is a threadload proxy
-        views = View.query.filter(View.entity == entity, View.user_id == user.id)
-        if views.count():
-            view = views.first()
-            hit = Hit(view=view)
-            db.session.add(hit)
+    def init_app(self, app: Application) -> None:
+        super().init_app(app)
+        app_ref = weakref.ref(app)
+
+        def flush_at_exit() -> None:
+            app = app_ref()
+            if app is not None:
+                with app.app_context():
+                    self.flush()
+
+        atexit.register(flush_at_exit)
+
+    def record_hit(self, entity, user) -> None:
+        """Record a view of `entity` by `user`.
+
+        The hit is buffered: it is written to the database later.
+        """
+        state = self.app_state
+        config = current_app.config
+        batch_size = config.get("VIEWTRACKER_BATCH_SIZE", DEFAULT_BATCH_SIZE)
+        interval = config.get("VIEWTRACKER_FLUSH_INTERVAL", DEFAULT_FLUSH_INTERVAL)
+
+        # Using user.id here in case user is a threadload proxy
+        with state.lock:
+            if not state.pending:
+                state.pending_since = time.monotonic()
+            state.pending.append((entity.id, user.id, datetime.utcnow()))
+            is_due = (
+                len(state.pending) >= batch_size
+                or time.monotonic() - state.pending_since >= interval
+            )
+            if not is_due and state.timer is None:
+                app_ref = weakref.ref(current_app._get_current_object())
+                state.timer = threading.Timer(
+                    interval, self._flush_later, args=(app_ref,)
+                )
+                state.timer.daemon = True
+                state.timer.start()
 
+        if is_due:
+            self.flush()
+
+    def _flush_later(self, app_ref: weakref.ref[Application]) -> None:
+        app = app_ref()
+        if app is not None:
+            with app.app_context():
+                self.flush()
+
+    def flush(self) -> None:
+        """Write buffered hits to the database.
+
+        Errors are logged, not raised: if the batch can't be written, hits
+        are written again view by view, and hits of views that still fail are
+        dropped.
+        """
+        state = self.app_state
+        with state.lock:
+            pending, state.pending = state.pending, []
+            if state.timer is not None:
+                state.timer.cancel()
+                state.timer = None
+
+        if not pending:
+            return
+
+        try:
+            self._write_hits(pending)
+        except Exception:
+            logger.opt(exception=True).warning(
+                "Error writing {} hits, retrying view by view", len(pending)
+            )
         else:
-            view = View(entity=entity, user_id=user.id)
-            hit = Hit(view=view)
-            db.session.add(view)
-            db.session.add(hit)
+            return
 
-        # FIXME: not the right place
-        db.session.commit()
+        by_view: dict[tuple[int, int], list[tuple[int, int, datetime]]] = {}
+        for hit in pending:
+            by_view.setdefault(hit[:2], []).append(hit)
+
+        for (entity_id, user_id), hits in by_view.items():
+            try:
+                self._write_hits(hits)
+            except Exception as e:
+                logger.warning(
+                    "Dropping {} hits of entity {} by user {}: {}",
+                    len(hits),
+                    entity_id,
+                    user_id,
+                    e,
+                )
 
     @staticmethod
-    def get_views(entity=None, entities=None, user=None, users=None):
+    def _write_hits(pending: list[tuple[int, int, datetime]]) -> None:
+        # hits count and last hit, by (entity id, user id)
+        counters: dict[tuple[int, int], list] = {}
+        for entity_id, user_id, viewed_at in pending:
+            counter = counters.setdefault((entity_id, user_id), [0, viewed_at])
+            counter[0] += 1
+            counter[1] = max(counter[1], viewed_at)
+
+        view_table = View.__table__
+        entity_ids = {entity_id for entity_id, _user_id in counters}
+        user_ids = {user_id for _entity_id, user_id in counters}
+
+        # own transaction: independent from the request session
+        with db.engine.begin() as connection:
+            insert = _UPSERT_DIALECTS.get(connection.dialect.name)
+            new_views = [
+                {
+                    "entity_id": entity_id,
+                    "_fk_entity_id": entity_id,
+                    "user_id": user_id,
+                    "hit_count": 0,
+                }
+                for entity_id, user_id in counters
+            ]
+            if insert is not None:
+                stmt = insert(view_table).on_conflict_do_nothing(
+                    index_elements=["entity_id", "user_id"]
+                )
+                connection.execute(stmt, new_views)
+            else:
+                query = sa.select([view_table.c.entity_id, view_table.c.user_id]).where(
+                    view_table.c.entity_id.in_(entity_ids)
+                    & view_table.c.user_id.in_(user_ids)
+                )
+                existing = set(connection.execute(query).fetchall())
+                new_views = [
+                    v
+                    for v in new_views
+                    if (v["entity_id"], v["user_id"]) not in existing
+                ]
+                if new_views:
+                    connection.execute(view_table.insert(), new_views)
+
+            last_viewed_at = sa.bindparam("last", type_=sa.DateTime)
+            stmt = (
+                view_table.update()
+                .where(
+                    (view_table.c.entity_id == sa.bindparam("e"))
+                    & (view_table.c.user_id == sa.bindparam("u"))
+                )
+                .values(
+                    hit_count=view_table.c.hit_count + sa.bindparam("n"),
+                    last_viewed_at=sa.case(
+                        (
+                            view_table.c.last_viewed_at > last_viewed_at,
+                            view_table.c.last_viewed_at,
+                        ),
+                        else_=last_viewed_at,
+                    ),
+                )
+            )
+            connection.execute(
+                stmt,
+                [
+                    {"e": entity_id, "u": user_id, "n": n, "last": last}
+                    for (entity_id, user_id), (n, last) in counters.items()
+                ],
+            )
+
+            query = sa.select(
+                [
+                    view_table.c.id,
+                    view_table.c.entity_id,
+                    view_table.c.user_id,
+                ]
+            ).where(
+                view_table.c.entity_id.in_(entity_ids)
+                & view_table.c.user_id.in_(user_ids)
+            )
+            view_ids = {
+                (entity_id, user_id): view_id
+                for view_id, entity_id, user_id in connection.execute(query)
+            }
+            connection.execute(
+                Hit.__table__.insert(),
+                [
+                    {"view_id": view_ids[entity_id, user_id], "viewed_at": viewed_at}
+                    for entity_id, user_id, viewed_at in pending
+                ],
+            )
+
+    def get_views(self, entity=None, entities=None, user=None, users=None):
         assert entity is None or entities is None
         assert entity is not None or entities is not None
         assert user is None or users is None
 
+        self.flush()
+
         if entities is None:
             entities = []
         if entity:
@@ -58,10 +285,11 @@ class ViewTracker(Service):
 
         return query.all()
 
-    @staticmethod
-    def get_hits(views=None, view=None):
+    def get_hits(self, views=None, view=None):
         assert view is not None or views is not None
 
+        self.flush()
+
         if views is None:
             views = []
         if view is not None:
@@ -76,3 +304,11 @@ class ViewTracker(Service):
 
 
 viewtracker = ViewTracker()
+
+
+def _reset_all_after_fork() -> None:
+    for state in list(_STATES.values()):
+        state.reset_after_fork()
+
+
+os.register_at_fork(after_in_child=_reset_all_after_fork)
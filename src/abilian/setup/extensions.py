@@ -28,6 +28,7 @@ from abilian.services import (
     session_blob_store,
     vocabularies_service,
 )
+from abilian.services.viewtracker import viewtracker
 from abilian.web import csrf
 from abilian.web.action import actions
 from abilian.web.admin import Admin
@@ -79,6 +80,7 @@ def init_extensions(app: Flask) -> None:
     conversion_service.init_app(app)
     vocabularies_service.init_app(app)
     antivirus.init_app(app)
+    viewtracker.init_app(app)
 
     # Admin interface
     Admin().init_app(app)
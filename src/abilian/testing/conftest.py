@@ -21,6 +21,7 @@ if TYPE_CHECKING:
     from flask import Flask
     from flask.ctx import AppContext, RequestContext
     from flask.testing import FlaskClient
+    from pytest import TempPathFactory
     from sqlalchemy.orm import Session
 
     from abilian.core.sqlalchemy import SQLAlchemy
@@ -46,13 +47,19 @@ def config() -> Any:
 
 
 @fixture(scope="module")
-def app(config: Any) -> Flask:
+def instance_path(tmp_path_factory: TempPathFactory) -> str:
+    """Instance folder of the test app: blob store, caches, indexes..."""
+    return str(tmp_path_factory.mktemp("instance"))
+
+
+@fixture(scope="module")
+def app(config: Any, instance_path: str) -> Flask:
     # We currently return a fresh app for each test.
     # Using session-scoped app doesn't currently work.
     # Note: the impact on speed is minimal.
     # from abilian.sbe.app import create_app
 
-    return create_app(config=config)
+    return create_app(config=config, instance_path=instance_path)
 
 
 @fixture
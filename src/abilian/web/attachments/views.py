@@ -8,7 +8,7 @@ from typing import TYPE_CHECKING
 
 import sqlalchemy as sa
 import sqlalchemy.orm
-from flask import current_app, send_file
+from flask import current_app
 from werkzeug.exceptions import BadRequest
 from werkzeug.utils import redirect
 
@@ -19,6 +19,7 @@ from abilian.web import nav, url_for
 from abilian.web.access_blueprint import AccessControlBlueprint
 from abilian.web.action import ButtonAction, actions
 from abilian.web.views import BaseObjectView, ObjectCreate, ObjectDelete, ObjectEdit
+from abilian.web.views.files import send_blob
 
 from .forms import AttachmentForm
 
@@ -92,15 +93,9 @@ class AttachmentDownload(BaseAttachmentView, BaseObjectView):
         metadata = blob.meta
         filename = metadata.get("filename", self.obj.name)
         content_type = metadata.get("mimetype")
-        stream = blob.file.open("rb")
-
-        return send_file(
-            stream,
-            as_attachment=True,
-            download_name=filename,
-            mimetype=content_type,
-            cache_timeout=0,
-            add_etags=False,
+
+        return send_blob(
+            blob, mimetype=content_type, filename=filename, as_attachment=True
         )
 
 
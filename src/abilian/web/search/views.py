@@ -85,65 +85,50 @@ def install_hit_to_url():
     return {"url_for_hit": current_app.extensions["indexing"].url_for_hit}
 
 
-_COUNT_OBJECT_TYPE_FACET = whoosh.sorting.FieldFacet(
-    "object_type", maptype=whoosh.sorting.Count
-)
-
-
 @route("")
 def search_main(q="", page=1):
     svc = get_service("indexing")
     q = q.strip()
     page = int(request.args.get("page", page))
-    search_kwargs = {"limit": page * PAGE_SIZE}
     page_url_kw = OrderedDict(q=q)
 
-    search_kwargs["groupedby"] = _COUNT_OBJECT_TYPE_FACET
-    results = svc.search(q, **search_kwargs)
-
     filtered_by_type = sorted(request.args.getlist("object_type"))
     if filtered_by_type:
         page_url_kw["object_type"] = filtered_by_type
 
     page_url = partial(url_for, ".search_main", **page_url_kw)
 
+    # FIXME: sanitize input
+    results, counts = svc.search_page(q, page, PAGE_SIZE, object_types=filtered_by_type)
+
     # get facets groups
     by_object_type = []
-    try:
-        facet_group = results.groups("object_type")
-    except KeyError:
-        pass
-    else:
-        for typename, count in facet_group.items():
-            is_active = typename in filtered_by_type
-            classname = friendly_fqcn(typename)
-            link = page_url(object_type=typename)
-            by_object_type.append((classname, count, link, is_active))
-
-        by_object_type.sort(key=operator.itemgetter(0))
+    for typename, count in counts.items():
+        is_active = typename in filtered_by_type
+        classname = friendly_fqcn(typename)
+        link = page_url(object_type=typename)
+        by_object_type.append((classname, count, link, is_active))
+
+    by_object_type.sort(key=operator.itemgetter(0))
 
     if by_object_type:
         # Insert 'all' to clear all filters
         is_active = len(filtered_by_type) == 0
-        all_types = (_("All"), len(results), page_url(object_type=()), is_active)
+        all_types = (
+            _("All"),
+            sum(counts.values()),
+            page_url(object_type=()),
+            is_active,
+        )
         by_object_type.insert(0, all_types)
 
-    if filtered_by_type:
-        # FIXME: sanitize input
-        results = svc.search(q, object_types=filtered_by_type, **search_kwargs)
-
-    results.formatter = BOOTSTRAP_MARKUP_HIGHLIGHTER
-    results.fragmenter = RESULTS_FRAGMENTER
+    results.results.formatter = BOOTSTRAP_MARKUP_HIGHLIGHTER
+    results.results.fragmenter = RESULTS_FRAGMENTER
 
     # paginate results
-    results_count = len(results)
-
-    # results.pagecount must be ignored when query is filtered: it ignores
-    # filtered_count
-    pagecount = 1 + results_count // PAGE_SIZE
-    page = min(page, pagecount)
-    results = whoosh.searching.ResultsPage(results, page, PAGE_SIZE)
-    page = results.pagenum
+    results_count = results.total
+    pagecount = max(results.pagecount, 1)
+    page = max(results.pagenum, 1)
     first_page = page_url(page=1)
     last_page = page_url(page=pagecount)
     prev_page = page_url(page=page - 1) if page > 1 else None
@@ -180,8 +165,7 @@ class Live(views.JSONView):
             q = ""
         svc = get_service("indexing")
         url_for_hit = svc.app_state.url_for_hit
-        search_kwargs = {"facet_by_type": 5}
-        results = svc.search(q, **search_kwargs)
+        results = svc.live_search(q, limit=MAX_LIVE_RESULTS_PER_CLASS)
         datasets = {}
 
         for typename, docs in results.items():
@@ -5,15 +5,88 @@
 from __future__ import annotations
 
 from datetime import datetime, timedelta
-from typing import Never
+from typing import TYPE_CHECKING, Never
 
-from flask import Response, request, send_file
-from werkzeug.exceptions import BadRequest
+from flask import Response, current_app, request, send_file
+from werkzeug.exceptions import BadRequest, NotFound
 
 from abilian.core.util import utc_dt
+from abilian.services.blob_store import blob_store
 
 from .base import View
 
+if TYPE_CHECKING:
+    from abilian.core.models.blob import Blob
+
+
+def send_blob(
+    blob: Blob | None,
+    mimetype: str | None = None,
+    filename: str | None = None,
+    as_attachment: bool = False,
+    max_age: int | None = None,
+) -> Response:
+    """Return a response with the content of `blob`, streamed from the blob
+    store.
+
+    Content is never loaded in memory. `Range`, `If-Range` and conditional
+    requests are supported, the `ETag` being the md5 of the blob (`Range`
+    only for files stored on the local file system).
+
+    When `USE_X_SENDFILE` is set, the file is sent by the front server with
+    `X-Sendfile`. When `BLOB_X_ACCEL_REDIRECT` is set to an URL prefix mapped
+    to the blob store directory by the front server (i.e nginx), it is sent
+    with `X-Accel-Redirect`.
+    """
+    if blob is None:
+        raise NotFound
+
+    meta = blob.meta
+    if mimetype is None:
+        mimetype = meta.get("mimetype") or "application/octet-stream"
+    etag = meta.get("md5") or True
+
+    path = blob.file
+    if path is None:
+        # not stored on the local file system: stream it from the backend
+        try:
+            stream = blob.open()
+        except KeyError as e:
+            raise NotFound from e
+        return send_file(
+            stream,
+            mimetype=mimetype,
+            as_attachment=as_attachment,
+            download_name=filename,
+            conditional=True,
+            etag=etag if isinstance(etag, str) else False,
+            max_age=max_age,
+        )
+
+    accel_prefix = current_app.config.get("BLOB_X_ACCEL_REDIRECT")
+    top = blob_store.app_state.path
+    if accel_prefix and top in path.parents:
+        response = Response(mimetype=mimetype)
+        rel_path = path.relative_to(top).as_posix()
+        response.headers["X-Accel-Redirect"] = f"{accel_prefix.rstrip('/')}/{rel_path}"
+        if filename:
+            disposition = "attachment" if as_attachment else "inline"
+            response.headers.set("Content-Disposition", disposition, filename=filename)
+        if isinstance(etag, str):
+            response.set_etag(etag)
+        response.cache_control.no_cache = True
+        return response.make_conditional(request)
+
+    return send_file(
+        path,
+        mimetype=mimetype,
+        as_attachment=as_attachment,
+        download_name=filename,
+        conditional=True,
+        etag=etag,
+        max_age=max_age,
+    )
+
 
 class BaseFileDownload(View):
     set_expire = False
@@ -123,9 +196,4 @@ class BaseBlobDownload(BaseFileDownload):
         return self.content_type
 
     def make_response(self, *args, **kwargs):
-        blob = self.blob
-        stream = blob.file.open("rb")
-
-        return send_file(
-            stream, mimetype=self.content_type, cache_timeout=0, add_etags=False
-        )
+        return send_blob(self.blob, mimetype=self.content_type)
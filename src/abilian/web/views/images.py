@@ -7,8 +7,9 @@ from __future__ import annotations
 import colorsys
 import hashlib
 from importlib import resources as rso
+from io import BytesIO
 from pathlib import Path
-from typing import Any
+from typing import IO, Any
 
 import sqlalchemy as sa
 import sqlalchemy.orm
@@ -17,10 +18,17 @@ from werkzeug.exceptions import BadRequest, NotFound
 
 from abilian.core.models.blob import Blob
 from abilian.core.models.subjects import User
-from abilian.services.image import CROP, RESIZE_MODES, get_format, get_size, resize
+from abilian.services.image import (
+    CROP,
+    RESIZE_MODES,
+    cached_resize,
+    get_format,
+    get_size,
+    resize,
+)
 from abilian.web.util import url_for
 
-from .files import BaseFileDownload
+from .files import BaseFileDownload, send_blob
 
 images_bp = Blueprint("images", __name__, url_prefix="/images")
 route = images_bp.route
@@ -61,12 +69,15 @@ class BaseImageView(BaseFileDownload):
         kwargs["mode"] = resize_mode
         return args, kwargs
 
-    def make_response(self, image, size, mode, filename=None, *args, **kwargs):
+    def make_response(
+        self, image, size, mode, filename=None, cache_key=None, *args, **kwargs
+    ):
         """
         :param image: image as bytes
         :param size: requested maximum width/height size
         :param mode: one of 'scale', 'fit' or 'crop'
         :param filename: filename
+        :param cache_key: identifies image content for the resize cache
         """
         try:
             fmt = get_format(image)
@@ -74,6 +85,20 @@ class BaseImageView(BaseFileDownload):
             # not a known image file
             raise NotFound from e
 
+        self.set_format(fmt, filename)
+
+        if size:
+            image = resize(image, size, size, mode=mode, key=cache_key)
+            if mode == CROP:
+                assert get_size(image) == (size, size)
+        else:
+            return self.original_response(image)
+
+        return make_response(image)
+
+    def set_format(self, fmt: str, filename: str | None = None) -> None:
+        """Set content type and filename of the response for an image in
+        format `fmt`."""
         self.content_type = "image/png" if fmt == "PNG" else "image/jpeg"
         ext = f".{fmt.lower()!s}"
 
@@ -83,14 +108,9 @@ class BaseImageView(BaseFileDownload):
             filename += ext
         self.filename = filename
 
-        if size:
-            image = resize(image, size, size, mode=mode)
-            if mode == CROP:
-                assert get_size(image) == (size, size)
-        else:
-            image = image.read()
-
-        return make_response(image)
+    def original_response(self, image):
+        """Response for the image at its original size."""
+        return make_response(image.read())
 
     def get_filename(self, *args, **kwargs):
         return self.filename
@@ -151,12 +171,46 @@ class BlobView(BaseImageView):
         if not blob:
             raise NotFound
 
+        self.blob = blob
         meta = blob.meta
         filename = meta.get("filename", meta.get("md5", str(blob.uuid)))
         kwargs["filename"] = filename
-        kwargs["image"] = blob.file.open("rb")
+        # content is opened in `make_response`, on resize cache miss
+        kwargs["image"] = blob
+        if meta.get("md5"):
+            kwargs["cache_key"] = f"{blob.uuid}:{meta['md5']}"
         return args, kwargs
 
+    def make_response(
+        self, image, size, mode, filename=None, cache_key=None, *args, **kwargs
+    ):
+        if size and cache_key:
+            resized = cached_resize(cache_key, size, size, mode)
+            if resized is not None:
+                self.set_format(get_format(resized), filename)
+                return make_response(resized)
+
+        image = self.open_blob(image)
+        return super().make_response(
+            image, size, mode, filename, cache_key, *args, **kwargs
+        )
+
+    @staticmethod
+    def open_blob(blob: Blob) -> IO[bytes]:
+        try:
+            image = blob.open()
+        except KeyError as e:
+            raise NotFound from e
+        if not image.seekable():
+            # images are decoded with random access: load remote content
+            with image:
+                image = BytesIO(image.read())
+        return image
+
+    def original_response(self, image):
+        image.close()
+        return send_blob(self.blob, mimetype=self.content_type)
+
 
 blob_image = BlobView.as_view("blob_image")
 route("/files/<int:object_id>")(blob_image)
@@ -221,8 +275,11 @@ def user_url_args(user: User, size: int) -> tuple[str, dict[str, Any]]:
     if not user.is_anonymous:
         endpoint = "images.user_photo"
         kwargs["user_id"] = user.id
-        content = user.photo or (user.name + user.email).encode("utf-8")
-        kwargs["md5"] = hashlib.md5(content).hexdigest()  # noqa: S324
+        digest = user.photo_digest
+        if digest is None:
+            content = (user.name + user.email).encode("utf-8")
+            digest = hashlib.md5(content).hexdigest()  # noqa: S324
+        kwargs["md5"] = digest
 
     return endpoint, kwargs
 
@@ -0,0 +1,136 @@
+# Copyright (c) 2012-2024, Abilian SAS
+
+"""Export of tabular data to XLSX files, with bounded memory usage.
+
+Rows are consumed from an iterable (i.e a query with `yield_per`) and written
+to a write-only workbook: openpyxl keeps them in a temporary file, not in
+memory. Columns width is estimated from the first rows only, since it must be
+set before any row is written.
+"""
+
+from __future__ import annotations
+
+import tempfile
+from datetime import date, datetime, time
+from itertools import chain, islice
+from typing import IO, TYPE_CHECKING, Any
+
+import openpyxl
+from flask import send_file
+from openpyxl.cell import WriteOnlyCell
+
+if TYPE_CHECKING:
+    from collections.abc import Iterable, Sequence
+
+    from flask import Response
+
+__all__ = ["XLSX_MIME", "write_xlsx", "xlsx_response"]
+
+XLSX_MIME = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+
+HEADER_FONT = openpyxl.styles.Font(bold=True)
+HEADER_ALIGN = openpyxl.styles.Alignment(
+    horizontal="center", vertical="top", wrapText=True
+)
+
+#: number of rows used to estimate columns width
+WIDTH_SAMPLE_SIZE = 200
+MIN_WIDTH = 3
+MAX_WIDTH = openpyxl.utils.units.BASE_COL_WIDTH * 4
+
+#: files larger than this are spooled to disk
+SPOOL_MAX_SIZE = 8 * 1024**2
+
+_NATIVE_TYPES = (str, int, float, bool, datetime, date, time)
+
+
+def cell_value(value: Any) -> Any:
+    """Convert `value` to a type supported in a cell, i.e models and roles are
+    converted to strings."""
+    if value is None or isinstance(value, _NATIVE_TYPES):
+        return value
+    return str(value)
+
+
+def _width(value: Any) -> int:
+    if value is None:
+        return 0
+    return max(len(line) for line in str(value).split("\n")) + 1
+
+
+def sheet_title(title: str) -> str:
+    title = title.strip()
+    if len(title) > 31:
+        # sheet title cannot exceed 31 char. max length
+        title = f"{title[:30]}…"
+    return title
+
+
+def write_xlsx(
+    file: IO[bytes],
+    title: str,
+    headers: Sequence[str],
+    rows: Iterable[Sequence[Any]],
+    sample_size: int = WIDTH_SAMPLE_SIZE,
+) -> None:
+    """Write a workbook with a single sheet to `file`.
+
+    :param title: sheet title.
+    :param headers: column headers.
+    :param rows: sequences of values, one value per column. Values are
+        converted with :func:`cell_value`.
+    :param sample_size: number of rows used to estimate columns width.
+    """
+    wb = openpyxl.Workbook(write_only=True)
+    ws = wb.create_sheet(title=sheet_title(title))
+
+    rows = (list(map(cell_value, row)) for row in rows)
+    sample = list(islice(rows, sample_size))
+
+    # columns width must be set before the first row is written
+    cols_width = [_width(str(label)) for label in headers]
+    for row in sample:
+        for col, value in enumerate(row):
+            cols_width[col] = max(cols_width[col], _width(value))
+
+    for idx, width in enumerate(cols_width, 1):
+        letter = openpyxl.utils.get_column_letter(idx)
+        ws.column_dimensions[letter].width = min(max(width, MIN_WIDTH), MAX_WIDTH)
+
+    cells = []
+    for label in headers:
+        cell = WriteOnlyCell(ws, value=str(label))
+        cell.font = HEADER_FONT
+        cell.alignment = HEADER_ALIGN
+        cells.append(cell)
+    ws.append(cells)
+
+    for row in chain(sample, rows):
+        ws.append(row)
+
+    wb.save(file)
+
+
+def xlsx_response(
+    filename: str,
+    title: str,
+    headers: Sequence[str],
+    rows: Iterable[Sequence[Any]],
+    **kwargs: Any,
+) -> Response:
+    """Return a response to download a workbook written by
+    :func:`write_xlsx`, as `filename`.
+
+    The workbook is written to a file spooled to disk when large.
+    """
+    file = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_SIZE)
+    try:
+        write_xlsx(file, title, headers, rows, **kwargs)
+    except BaseException:
+        file.close()
+        raise
+
+    file.seek(0)
+    return send_file(
+        file, mimetype=XLSX_MIME, as_attachment=True, download_name=filename
+    )
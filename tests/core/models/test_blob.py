@@ -2,13 +2,17 @@
 
 from __future__ import annotations
 
+import os
 import uuid
-from io import StringIO
+from io import BytesIO, StringIO
 from pathlib import Path
 from typing import TYPE_CHECKING
 
+from pytest import fixture
+
 from abilian.core.models.blob import Blob
 from abilian.services import blob_store, session_blob_store
+from abilian.services.blob_store.backends import LocalBackend
 
 if TYPE_CHECKING:
     from flask import Flask
@@ -63,12 +67,25 @@ def test_mimetype(app: Flask, db: SQLAlchemy) -> None:
     assert blob.meta["mimetype"] == "text/plain"
 
 
-def test_nonzero(app: Flask, db: SQLAlchemy) -> None:
+def test_nonzero(app: Flask, db: SQLAlchemy, monkeypatch) -> None:
     blob = Blob("test md5")
     assert bool(blob)
+    assert bool(Blob(b""))
+
+    # the blob store is not checked for blobs written with `value`
+    def exists(*args, **kwargs):
+        raise AssertionError
+
+    monkeypatch.setattr(session_blob_store, "exists", exists)
+    assert bool(blob)
+    monkeypatch.undo()
+
+    del blob.value
+    assert not bool(blob)
 
-    # change uuid: repository will return None for blob.file
-    blob.uuid = uuid.uuid4()
+    # blobs written before metadata were recorded: repository will return
+    # None for blob.file
+    blob = Blob(uuid=uuid.uuid4())
     assert not bool(blob)
 
 
@@ -147,3 +164,84 @@ def test_value(app: Flask, db: SQLAlchemy) -> None:
 
     session.commit()
     assert blob_store.get(blob.uuid) is None
+
+
+def test_stream_value(app: Flask, db: SQLAlchemy) -> None:
+    content = BytesIO(b"test md5")
+    blob = Blob(content)
+    assert blob.value == b"test md5"
+    assert blob.meta["md5"] == "0e4e3b2681e8931c067a23c583c878d5"
+
+
+@fixture
+def cas_store(app: Flask, tmp_path: Path, monkeypatch) -> Path:
+    """Empty content-addressed store, so that garbage collection only sees
+    the files of the test."""
+    state = blob_store.app_state
+    monkeypatch.setattr(state, "path", tmp_path)
+    monkeypatch.setattr(state, "backend", LocalBackend([tmp_path]))
+    monkeypatch.setattr(state, "content_addressed", True)
+    return tmp_path
+
+
+def test_content_addressed(db: SQLAlchemy, cas_store: Path) -> None:
+    session = db.session
+    blob1 = Blob(b"shared content")
+    blob2 = Blob(b"shared content")
+    assert blob1.content_hash
+    assert blob1.content_hash == blob2.content_hash
+    session.add_all([blob1, blob2])
+    session.commit()
+
+    # content is stored once, by hash
+    path = blob_store.hash_path(blob1.content_hash)
+    assert path.is_relative_to(cas_store)
+    assert blob1.file == path
+    assert blob2.file == path
+    assert blob_store.get(blob1.uuid) is None
+    assert blob2.value == b"shared content"
+
+    # deleting a blob keeps content used by the other one
+    session.delete(blob1)
+    session.commit()
+    assert blob2.value == b"shared content"
+
+    assert blob_store.collect_garbage({blob2.content_hash}, min_age=0) == (0, 0)
+    assert path.exists()
+
+    session.delete(blob2)
+    session.commit()
+    assert blob_store.collect_garbage(set(), min_age=3600) == (0, 0)
+    assert blob_store.collect_garbage(set(), min_age=0, dry_run=True) == (1, 14)
+    assert path.exists()
+    assert blob_store.collect_garbage(set(), min_age=0) == (1, 14)
+    assert not path.exists()
+
+
+def test_collect_garbage_concurrent_reuse(
+    db: SQLAlchemy, cas_store: Path, monkeypatch
+) -> None:
+    blob = Blob(b"reused content")
+    db.session.add(blob)
+    db.session.commit()
+    content_hash = blob.content_hash
+    path = blob_store.hash_path(content_hash)
+    os.utime(path, (0, 0))
+    db.session.delete(blob)
+    db.session.commit()
+
+    # the same content is stored again after the collection has listed files,
+    # before it deletes them
+    backend = blob_store.backend
+    iter_files = backend.iter_files
+
+    def listed_then_reused(prefix):
+        files = list(iter_files(prefix))
+        tmp_path = cas_store / "reused"
+        tmp_path.write_bytes(b"reused content")
+        blob_store.store_file(uuid.uuid4(), tmp_path, content_hash)
+        yield from files
+
+    monkeypatch.setattr(backend, "iter_files", listed_then_reused)
+    assert blob_store.collect_garbage(set(), min_age=60) == (0, 0)
+    assert path.read_bytes() == b"reused content"
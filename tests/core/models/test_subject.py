@@ -2,6 +2,7 @@
 
 from __future__ import annotations
 
+import hashlib
 from typing import TYPE_CHECKING
 
 from abilian.core.models.subjects import Group, User
@@ -34,6 +35,17 @@ def test_user(app: Flask, db: SQLAlchemy) -> None:
     assert not user.is_online
 
 
+def test_photo_digest() -> None:
+    user = User(email="test@test.com")
+    assert user.photo_digest is None
+
+    user.photo = b"photo"
+    assert user.photo_digest == hashlib.md5(b"photo").hexdigest()  # noqa: S324
+
+    user.photo = None
+    assert user.photo_digest is None
+
+
 def test_group(app: Flask, db: SQLAlchemy) -> None:
     group = Group(name="test_group")
     db.session.add(group)
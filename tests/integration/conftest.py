@@ -70,4 +70,4 @@ def instance_path(tmpdir_factory):
 
 @fixture(scope="module")
 def app(instance_path):
-    return create_app(config=TestConfig)
+    return create_app(config=TestConfig, instance_path=instance_path)
@@ -22,8 +22,8 @@ if TYPE_CHECKING:
 
 
 @pytest.fixture
-def app(config: type) -> Iterator[Iterator | Iterator[Flask]]:
-    app = create_app(config)
+def app(config: type, instance_path: str) -> Iterator[Iterator | Iterator[Flask]]:
+    app = create_app(config, instance_path=instance_path)
 
     # We need some incantations here to make babel work in the test
     babel = abilian.i18n.babel
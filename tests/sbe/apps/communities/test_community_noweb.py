@@ -5,11 +5,14 @@ module."""
 
 from __future__ import annotations
 
+from io import BytesIO
 from typing import TYPE_CHECKING
 from unittest import mock
 
+import openpyxl
 import pytest
 import sqlalchemy as sa
+from flask import g
 
 from abilian.core.entities import Entity
 from abilian.core.models.subjects import User
@@ -21,8 +24,15 @@ from abilian.sbe.apps.communities.models import (
     CommunityIdColumn,
     community_content,
 )
+from abilian.sbe.apps.communities.views.views import (
+    _members_page,
+    _threads_count,
+    members_excel_export,
+)
 from abilian.sbe.apps.documents.models import Folder
+from abilian.sbe.apps.forum.models import Thread
 from abilian.services import index_service, security_service
+from abilian.services.activity import ActivityEntry
 from tests.util import login
 
 if TYPE_CHECKING:
@@ -158,6 +168,57 @@ def test_membership(community: Community, db: SQLAlchemy) -> None:
     when_removed.assert_called_once_with(community, membership=membership)
 
 
+def test_membership_last_activity(community: Community, db: SQLAlchemy) -> None:
+    user = User(email="user@example.com")
+    community.set_membership(user, "member")
+    db.session.commit()
+    membership = community.memberships[0]
+    assert membership.last_activity_at is None
+
+    thread = Thread(title="Thread", community=community)
+    entry = ActivityEntry(actor=user, verb="post", object=thread, target=community)
+    db.session.add(entry)
+    db.session.commit()
+
+    db.session.expire(membership)
+    assert membership.last_activity_at == entry.happened_at
+
+
+def test_members_page(app: Application, community: Community, db: SQLAlchemy) -> None:
+    users = [
+        User(email=f"user{i}@example.com", last_name=name, first_name="A")
+        for i, name in enumerate(["Martin", "Bernard", None, "Martin", "Dubois"])
+    ]
+    for user in users:
+        community.set_membership(user, "member")
+    db.session.add(Thread(title="Thread 1", community=community, creator=users[1]))
+    db.session.add(Thread(title="Thread 2", community=community, creator=users[1]))
+    db.session.commit()
+
+    with app.test_request_context():
+        g.community = community
+        pages = []
+        after = None
+        while True:
+            page, after = _members_page(after, size=2)
+            pages.append([user for user, *_columns in page])
+            if after is None:
+                break
+
+        assert pages == [
+            [users[2], users[1]],
+            [users[4], users[0]],
+            [users[3]],
+        ]
+        assert _threads_count(users) == {users[1]: 2}
+
+        response = members_excel_export()
+        response.direct_passthrough = False
+        wb = openpyxl.load_workbook(BytesIO(response.get_data()))
+        names = [row[0] for row in wb.active.iter_rows(min_row=2, values_only=True)]
+        assert names == [str(user) for page in pages for user in page]
+
+
 def test_folder_roles(community: Community, db: SQLAlchemy, app: Application) -> None:
     user = User(email="user@example.com")
     folder = community.folder
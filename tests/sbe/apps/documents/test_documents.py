@@ -12,6 +12,7 @@ from abilian.core.models.subjects import User
 from abilian.sbe.apps.documents.models import Document, Folder
 from abilian.sbe.apps.documents.views.folders import explore_archive
 from abilian.services import index_service, security_service
+from abilian.services.indexing import batch_cache, indexing_batch
 from tests.util import login, redis_available
 
 if TYPE_CHECKING:
@@ -171,3 +172,30 @@ def test_explore_archive() -> None:
         # incorreclty assumes CP437).
         # "folder 1/osx: utf-8: é.txt",
     }
+
+
+def test_allowed_principals_memoized(app: Application, session: Session) -> None:
+    root = Folder(title="root")
+    folder = Folder(title="folder", parent=root)
+    subfolder = Folder(title="subfolder", parent=folder, inherit_security=False)
+    docs = [Document(title=f"doc {i}", parent=subfolder) for i in range(3)]
+    user1 = User(email="user1@example.com")
+    user2 = User(email="user2@example.com")
+    session.add_all([root, user1, user2])
+    session.flush()
+
+    security_service.grant_role(user1, "reader", folder)
+    security_service.grant_role(user2, "reader", folder)
+    security_service.grant_role(user1, "reader", subfolder)
+    session.flush()
+
+    expected = [doc._indexable_roles_and_users for doc in docs]
+    assert f"user:{user1.id}" in expected[0]
+    assert f"user:{user2.id}" not in expected[0]
+
+    with indexing_batch():
+        assert [doc._indexable_roles_and_users for doc in docs] == expected
+        cache = batch_cache("documents:allowed_principals")
+        assert set(cache) == {subfolder.id}
+
+    assert batch_cache("documents:allowed_principals") is None
@@ -129,6 +129,15 @@ def _test_upload(
     content = open_file(title).read()
     assert response.data == content
 
+    # partial and conditional requests
+    etag = response.headers["ETag"]
+    response = client.get(url, headers={"Range": "bytes=0-9"})
+    assert response.status_code == 206
+    assert response.data == content[:10]
+
+    response = client.get(url, headers={"If-None-Match": etag})
+    assert response.status_code == 304
+
     if test_preview:
         url = url_for(
             "documents.document_preview_image",
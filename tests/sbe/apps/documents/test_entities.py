@@ -2,12 +2,19 @@
 
 from __future__ import annotations
 
+from io import BytesIO
 from typing import TYPE_CHECKING
 
 import pytest
 
 from abilian.app import create_app
-from abilian.sbe.apps.documents.models import Document, Folder, icon_for
+from abilian.sbe.apps.documents.models import (
+    Document,
+    Folder,
+    FolderStats,
+    folder_stats,
+    icon_for,
+)
 
 if TYPE_CHECKING:
     from flask import Flask
@@ -16,8 +23,8 @@ if TYPE_CHECKING:
 
 
 @pytest.fixture
-def app(config: type) -> Flask:
-    return create_app(config=config)
+def app(config: type, instance_path: str) -> Flask:
+    return create_app(config=config, instance_path=instance_path)
 
 
 def check_editable(object: Document | Folder) -> None:
@@ -107,6 +114,20 @@ def test_content_length(session: Session) -> None:
     assert doc.content_length == len("tototiti")
 
 
+def test_set_content_from_stream(session: Session) -> None:
+    doc = Document(title="toto.txt")
+    doc.set_content(BytesIO(b"tototiti"), "application/binary")
+    assert doc.content == b"tototiti"
+    assert doc.content_length == 8
+    assert doc.content_digest == doc.content_blob.meta["md5"]
+    assert doc.content_type == "text/plain"
+
+    # same content: blob is kept
+    blob = doc.content_blob
+    doc.set_content(BytesIO(b"tototiti"))
+    assert doc.content_blob is blob
+
+
 def test_document_is_clonable(session: Session) -> None:
     root = Folder(title="/")
     doc = root.create_document(title="toto")
@@ -131,3 +152,99 @@ def test_icon_from_mime_type(app_context: AppContext) -> None:
     icon = icon_for("text/html")
     filename = icon.split("/")[-1]
     assert filename in ("html.png", "htm.png"), icon
+
+
+def test_materialized_paths(session: Session) -> None:
+    root = Folder(title="/")
+    folder1 = root.create_subfolder("folder1")
+    folder2 = folder1.create_subfolder("folder2")
+    document = folder2.create_document("doc")
+    session.add(root)
+    session.flush()
+
+    assert root._id_path == f"/{root.id}"
+    assert folder2._id_path == f"/{root.id}/{folder1.id}/{folder2.id}"
+    assert document._path == "/folder1/folder2/doc"
+    assert document.path == "/folder1/folder2/doc"
+    assert document._indexable_parent_ids == folder2._id_path
+    assert root._indexable_parent_ids == "/"
+    assert folder2.depth == 2
+
+    assert root.get_object_by_path("/folder1/folder2/doc") is document
+    assert folder1.get_object_by_path("/folder2") is folder2
+    assert root.get_object_by_path("/folder2") is None
+    assert set(root.query_descendants()) == {folder1, folder2, document}
+    assert root.query_descendants(Document).all() == [document]
+    assert root.document_count == 1
+
+
+def test_materialized_paths_move_and_rename(session: Session) -> None:
+    root = Folder(title="/")
+    folder1 = root.create_subfolder("folder1")
+    folder2 = root.create_subfolder("folder2")
+    subfolder = folder1.create_subfolder("sub")
+    document = subfolder.create_document("doc")
+    session.add(root)
+    session.flush()
+
+    # not flushed yet: path is computed from parents
+    subfolder.parent = folder2
+    assert subfolder.path == "/folder2/sub"
+
+    session.flush()
+    assert subfolder._id_path == f"{folder2._id_path}/{subfolder.id}"
+    assert document._id_path == f"{subfolder._id_path}/{document.id}"
+    assert document.path == "/folder2/sub/doc"
+
+    # ancestor renamed or moved, not flushed yet: paths are computed from
+    # parents
+    folder2.title = "renamed"
+    assert document.path == "/renamed/sub/doc"
+    session.flush()
+    assert document.path == "/renamed/sub/doc"
+
+    folder2.parent = folder1
+    assert document.path == "/folder1/renamed/sub/doc"
+    assert subfolder.depth == 3
+    assert document._indexable_parent_ids == (
+        f"/{root.id}/{folder1.id}/{folder2.id}/{subfolder.id}"
+    )
+    session.flush()
+    assert document._has_materialized_path()
+    assert document.path == "/folder1/renamed/sub/doc"
+    folder2.parent = root
+    session.flush()
+
+    session.expire_all()
+    assert document._path == "/renamed/sub/doc"
+    assert root.get_object_by_path("/renamed/sub/doc") is document
+    assert folder1.document_count == 0
+    assert folder2.document_count == 1
+
+
+def test_folder_stats(session: Session) -> None:
+    root = Folder(title="/")
+    folder1 = root.create_subfolder("folder1")
+    folder2 = root.create_subfolder("folder2")
+    subfolder = folder1.create_subfolder("sub")
+    folder1.create_document("doc1").content = b"abc"
+    subfolder.create_document("doc2").content = b"defgh"
+    session.add(root)
+    session.flush()
+
+    stats = folder_stats([root, folder1, folder2, subfolder])
+    assert stats == {
+        root.id: FolderStats(2, 8),
+        folder1.id: FolderStats(2, 8),
+        folder2.id: FolderStats(0, 0),
+        subfolder.id: FolderStats(1, 5),
+    }
+    assert folder1.document_count == 2
+    assert folder1.total_size == 8
+    assert folder2.total_size == 0
+
+    # moved, not flushed yet: the materialized path is outdated
+    with session.no_autoflush:
+        subfolder.parent = folder2
+        assert not subfolder._has_materialized_path()
+        assert folder_stats([subfolder]) == {subfolder.id: FolderStats(1, 5)}
@@ -0,0 +1,45 @@
+# Copyright (c) 2012-2024, Abilian SAS
+
+from __future__ import annotations
+
+from io import BytesIO
+from typing import TYPE_CHECKING
+from zipfile import ZIP_DEFLATED, ZIP_STORED, ZipFile
+
+from abilian.sbe.apps.documents.zipstream import is_compressed, zip_stream
+
+if TYPE_CHECKING:
+    from pathlib import Path
+
+
+def test_is_compressed() -> None:
+    assert is_compressed("image/jpeg")
+    assert is_compressed("video/mp4")
+    assert is_compressed(
+        "application/vnd.openxmlformats-officedocument.wordprocessingml.document"
+    )
+    assert not is_compressed("text/plain; charset=utf-8")
+    assert not is_compressed("")
+
+
+def test_zip_stream(tmp_path: Path) -> None:
+    text = tmp_path / "text.txt"
+    text.write_bytes(b"hello " * 50_000)
+    image = tmp_path / "image.jpg"
+    image.write_bytes(b"\xff\xd8" + b"x" * 1000)
+
+    entries = [
+        ("folder/text.txt", text, "text/plain", None),
+        ("folder/image.jpg", image, "image/jpeg", 1002),
+        ("empty", None, "application/octet-stream", None),
+    ]
+    chunks = list(zip_stream(entries))
+    assert len(chunks) > 3
+
+    with ZipFile(BytesIO(b"".join(chunks))) as zipfile:
+        assert zipfile.namelist() == ["folder/text.txt", "folder/image.jpg", "empty"]
+        assert zipfile.read("folder/text.txt") == text.read_bytes()
+        assert zipfile.read("folder/image.jpg") == image.read_bytes()
+        assert zipfile.read("empty") == b""
+        assert zipfile.getinfo("folder/text.txt").compress_type == ZIP_DEFLATED
+        assert zipfile.getinfo("folder/image.jpg").compress_type == ZIP_STORED
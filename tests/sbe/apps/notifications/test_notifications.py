@@ -2,17 +2,23 @@
 
 from __future__ import annotations
 
+from datetime import datetime, timedelta
 from typing import TYPE_CHECKING, cast
 
 from flask import render_template
+from flask_mail import Message
 
 from abilian.core.models.subjects import User
 from abilian.sbe.apps.communities.models import WRITER, Community
 from abilian.sbe.apps.notifications.tasks.social import (
     CommunityDigest,
     generate_unsubscribe_token,
+    load_community_digests,
+    send_daily_social_digest,
+    send_messages,
 )
 from abilian.services import get_service
+from abilian.services.activity import ActivityEntry
 from abilian.web import url_for
 
 if TYPE_CHECKING:
@@ -66,3 +72,70 @@ def test_mail_templates(db: SQLAlchemy, app_context) -> None:
     token = generate_unsubscribe_token(user)
     ctx = {"digests": digests, "token": token}
     render_template("notifications/daily-social-digest.html", **ctx)
+
+
+def test_daily_digest(app: Application, db: SQLAlchemy) -> None:
+    preferences = cast("PreferenceService", get_service("preferences"))
+    community = Community(name="My Community")
+    quiet_community = Community(name="Quiet Community")
+    users = [
+        User(email=f"user_{i}@example.com", password="abc", can_login=True)  # noqa: S106
+        for i in range(3)
+    ]
+    db.session.add_all([community, quiet_community, *users])
+    for user in users:
+        community.set_membership(user, WRITER)
+        quiet_community.set_membership(user, WRITER)
+    # users[2] has not subscribed
+    for user in users[:2]:
+        preferences.set_preferences(user, **{"sbe:notifications:daily": True})
+    activity = ActivityEntry(
+        actor=users[0],
+        verb="join",
+        object=community,
+        object_type=community.object_type,
+    )
+    db.session.add(activity)
+    db.session.commit()
+
+    since = datetime.utcnow() - timedelta(days=1)
+    digests = load_community_digests([community, quiet_community], since)
+    assert list(digests) == [community.id]
+    assert digests[community.id].new_members == [users[0]]
+
+    # one message per SMTP connection
+    app.config["ABILIAN_SBE"]["DAILY_SOCIAL_DIGEST_BATCH_SIZE"] = 1
+    mail = app.extensions["mail"]
+    with app.test_request_context(), mail.record_messages() as outbox:
+        send_daily_social_digest()
+
+    assert sorted(msg.recipients[0] for msg in outbox) == [
+        "user_0@example.com",
+        "user_1@example.com",
+    ]
+
+
+def test_send_messages_connection_error(app: Application, monkeypatch) -> None:
+    app.config["ABILIAN_SBE"]["DAILY_SOCIAL_DIGEST_BATCH_SIZE"] = 1
+    mail = app.extensions["mail"]
+    connect = mail.connect
+    connections = []
+
+    def flaky_connect():
+        connections.append(None)
+        if len(connections) == 1:
+            msg = "connection refused"
+            raise ConnectionRefusedError(msg)
+        return connect()
+
+    monkeypatch.setattr(mail, "connect", flaky_connect)
+    messages = [
+        Message("digest", sender="sender@example.com", recipients=[f"{i}@example.com"])
+        for i in range(3)
+    ]
+    with app.test_request_context(), mail.record_messages() as outbox:
+        # the first batch is lost, the other ones are sent
+        assert send_messages(messages) == 2
+
+    assert len(connections) == 3
+    assert len(outbox) == 2
@@ -0,0 +1,183 @@
+# Copyright (c) 2012-2024, Abilian SAS
+
+from __future__ import annotations
+
+from datetime import UTC, datetime
+from io import BytesIO
+from typing import TYPE_CHECKING, Any
+
+from pytest import fixture, raises
+
+from abilian.core.models.blob import Blob
+from abilian.services.blob_store import blob_store
+from abilian.services.blob_store.backends import LocalBackend, S3Backend
+
+if TYPE_CHECKING:
+    from pathlib import Path
+
+    from flask import Flask
+
+    from abilian.core.sqlalchemy import SQLAlchemy
+
+
+class FakeS3Error(Exception):
+    def __init__(self, code: str) -> None:
+        super().__init__(code)
+        self.response = {"Error": {"Code": code}}
+
+
+class FakeS3Client:
+    """In-memory stand-in for the subset of the S3 API used by the
+    backend."""
+
+    def __init__(self) -> None:
+        self.objects: dict[tuple[str, str], tuple[bytes, datetime]] = {}
+        self.headers: dict[tuple[str, str], dict[str, Any]] = {}
+
+    def _get(self, bucket: str, key: str) -> tuple[bytes, datetime]:
+        try:
+            return self.objects[bucket, key]
+        except KeyError:
+            raise FakeS3Error("404") from None  # noqa: EM101
+
+    def head_object(self, Bucket: str, Key: str) -> dict[str, Any]:
+        data, modified = self._get(Bucket, Key)
+        headers = self.headers.get((Bucket, Key), {"Metadata": {}})
+        return {"ContentLength": len(data), "LastModified": modified, **headers}
+
+    def get_object(self, Bucket: str, Key: str) -> dict[str, Any]:
+        data, _modified = self._get(Bucket, Key)
+        return {"Body": BytesIO(data)}
+
+    def upload_fileobj(self, file, bucket: str, key: str) -> None:
+        self.objects[bucket, key] = (file.read(), datetime.now(UTC))
+
+    def delete_object(self, Bucket: str, Key: str) -> None:
+        self.objects.pop((Bucket, Key), None)
+        self.headers.pop((Bucket, Key), None)
+
+    def copy_object(
+        self, Bucket: str, Key: str, CopySource, MetadataDirective="COPY", **kwargs
+    ) -> None:
+        source = (CopySource["Bucket"], CopySource["Key"])
+        data, _modified = self._get(*source)
+        self.objects[Bucket, Key] = (data, datetime.now(UTC))
+        # like S3, metadata not given with "REPLACE" are lost
+        if MetadataDirective == "REPLACE":
+            self.headers[Bucket, Key] = kwargs
+        else:
+            self.headers[Bucket, Key] = dict(self.headers.get(source, {}))
+
+    def get_paginator(self, name: str) -> FakeS3Client:
+        assert name == "list_objects_v2"
+        return self
+
+    def paginate(self, Bucket: str, Prefix: str):
+        contents = [
+            {"Key": key, "Size": len(data), "LastModified": modified}
+            for (bucket, key), (data, modified) in sorted(self.objects.items())
+            if bucket == Bucket and key.startswith(Prefix)
+        ]
+        yield {"Contents": contents}
+
+
+@fixture
+def s3_backend(app: Flask, monkeypatch) -> S3Backend:
+    backend = S3Backend(FakeS3Client(), "bucket", prefix="app")
+    monkeypatch.setattr(blob_store.app_state, "backend", backend)
+    return backend
+
+
+def test_local_backend_shards(tmp_path: Path) -> None:
+    roots = [tmp_path / "a", tmp_path / "b", tmp_path / "c"]
+    backend = LocalBackend(roots)
+
+    keys = [f"{i:02d}/{i:02d}/file-{i}" for i in range(30)]
+    for key in keys:
+        src = tmp_path / "src"
+        src.write_bytes(key.encode())
+        backend.put(key, src)
+        assert not src.exists()
+
+    # files are spread between directories
+    assert all(list(root.rglob("file-*")) for root in roots)
+    for key in keys:
+        assert backend.exists(key)
+        assert backend.size(key) == len(key)
+        assert backend.mtime(key) == backend.local_path(key).stat().st_mtime
+        with backend.open(key) as f:
+            assert f.read() == key.encode()
+
+    assert len(list(backend.iter_files(""))) == len(keys)
+
+    # files outside of their shard (written before directories were added)
+    # are still found
+    (roots[0] / "x").mkdir()
+    (roots[0] / "x" / "old").write_bytes(b"old")
+    assert backend.local_path("x/old") == roots[0] / "x" / "old"
+
+    backend.delete("x/old")
+    assert not backend.exists("x/old")
+    with raises(KeyError):
+        backend.open("x/old")
+
+
+def test_s3_backend(tmp_path: Path) -> None:
+    client = FakeS3Client()
+    backend = S3Backend(client, "bucket", prefix="/app/")
+
+    src = tmp_path / "src"
+    src.write_bytes(b"content")
+    backend.put("ab/cd/key", src)
+    assert not src.exists()
+    assert ("bucket", "app/ab/cd/key") in client.objects
+
+    assert backend.exists("ab/cd/key")
+    assert backend.size("ab/cd/key") == 7
+    assert backend.open("ab/cd/key").read() == b"content"
+    assert backend.mtime("ab/cd/key") <= datetime.now(UTC).timestamp()
+    assert backend.local_path("ab/cd/key") is None
+    assert [key for key, _size, _mtime in backend.iter_files("ab/")] == ["ab/cd/key"]
+
+    # touching keeps the metadata of the object
+    headers = {"Metadata": {"name": "value"}, "ContentType": "text/plain"}
+    client.headers["bucket", "app/ab/cd/key"] = dict(headers)
+    backend.touch("ab/cd/key")
+    assert client.headers["bucket", "app/ab/cd/key"] == headers
+    assert backend.open("ab/cd/key").read() == b"content"
+
+    backend.delete("ab/cd/key")
+    assert not backend.exists("ab/cd/key")
+    with raises(KeyError):
+        backend.open("ab/cd/key")
+    with raises(KeyError):
+        backend.delete("ab/cd/key")
+    with raises(KeyError):
+        backend.touch("ab/cd/key")
+
+
+def test_blob_with_s3_backend(app: Flask, db: SQLAlchemy, s3_backend) -> None:
+    session = db.session
+    blob = Blob(b"remote content")
+    session.add(blob)
+    session.commit()
+
+    key = f"app/{blob_store.rel_path(blob.uuid).as_posix()}"
+    assert ("bucket", key) in s3_backend.client.objects
+    assert blob.file is None
+    assert blob
+    assert blob.size == 14
+    assert blob.value == b"remote content"
+    with blob.open() as f:
+        assert f.read() == b"remote content"
+
+    session.delete(blob)
+    session.commit()
+    assert ("bucket", key) not in s3_backend.client.objects
+    assert not blob_store.exists(blob.uuid)
+
+
+def test_no_garbage_collection_with_s3_backend(app_context, s3_backend) -> None:
+    with raises(RuntimeError):
+        blob_store.collect_garbage(set(), min_age=0)
+    assert blob_store.collect_garbage(set(), min_age=0, dry_run=True) == (0, 0)
@@ -2,7 +2,9 @@
 
 from __future__ import annotations
 
+import hashlib
 import uuid
+from io import BytesIO
 from pathlib import Path
 from typing import TYPE_CHECKING
 
@@ -69,6 +71,26 @@ def test_set(session: Session) -> None:
     assert p.open("rb").read() == b"my file content"
 
 
+def test_set_stream(session: Session) -> None:
+    u1 = uuid.uuid4()
+    content = b"0123456789" * 20_000
+    stored = blob_store.set(u1, BytesIO(content))
+    assert blob_store.abs_path(u1).read_bytes() == content
+    assert stored.size == len(content)
+    assert stored.md5 == hashlib.md5(content).hexdigest()  # noqa: S324
+    # no temporary file left
+    assert list(blob_store.abs_path(u1).parent.iterdir()) == [blob_store.abs_path(u1)]
+
+
+def test_store_file(session: Session, tmp_path: Path) -> None:
+    u1 = uuid.uuid4()
+    path = tmp_path / "file"
+    path.write_bytes(b"my file content")
+    blob_store.store_file(u1, path)
+    assert blob_store.abs_path(u1).read_bytes() == b"my file content"
+    assert not path.exists()
+
+
 def test_setitem(session: Session) -> None:
     u1 = uuid.uuid4()
     p = blob_store.abs_path(u1)
@@ -0,0 +1,127 @@
+# Copyright (c) 2012-2024, Abilian SAS
+
+from __future__ import annotations
+
+from typing import TYPE_CHECKING
+
+from pytest import fixture
+
+from abilian.services.conversion.cache import Cache
+
+if TYPE_CHECKING:
+    from pathlib import Path
+
+
+def make_cache(cache_dir: Path, **kwargs) -> Cache:
+    cache = Cache(**kwargs)
+    cache.cache_dir = cache_dir
+    return cache
+
+
+@fixture
+def cache(tmp_path: Path) -> Cache:
+    return make_cache(tmp_path, max_size=100, touch_interval=0)
+
+
+def test_get_set(cache: Cache) -> None:
+    assert ("pdf", "a") not in cache
+    assert cache.get(("pdf", "a")) is None
+    assert cache.open(("pdf", "a")) is None
+
+    cache["pdf", "a"] = b"pdf content"
+    cache["txt", "a"] = "texte accentué"
+    assert ("pdf", "a") in cache
+    assert cache["pdf", "a"] == b"pdf content"
+    assert cache["txt", "a"] == "texte accentué"
+    with cache.open(("pdf", "a")) as f:
+        assert f.read() == b"pdf content"
+
+    # no temporary file left
+    assert [p.name for p in (cache.cache_dir / "pdf").iterdir()] == ["a.blob"]
+
+    stats = cache.stats()
+    assert stats["entries"] == 2
+    assert stats["bytes"] == 11 + len("texte accentué".encode())
+    assert stats["types"]["pdf"] == {"entries": 1, "bytes": 11}
+
+
+def test_lru_eviction(cache: Cache) -> None:
+    cache["pdf", "a"] = b"a" * 40
+    cache["pdf", "b"] = b"b" * 40
+    assert cache["pdf", "a"]
+
+    cache["pdf", "c"] = b"c" * 40
+    # "b" is the least recently used
+    assert ("pdf", "b") not in cache
+    assert ("pdf", "a") in cache
+    assert ("pdf", "c") in cache
+    assert cache.total_size() == 80
+
+
+def test_lfu_eviction(tmp_path: Path) -> None:
+    cache = make_cache(tmp_path, max_size=100, policy="lfu", touch_interval=0)
+    cache["pdf", "a"] = b"a" * 40
+    cache["pdf", "b"] = b"b" * 40
+    for _i in range(3):
+        cache.get(("pdf", "a"))
+    cache.get(("pdf", "b"))
+    cache.get(("pdf", "a"))
+
+    cache["pdf", "c"] = b"c" * 40
+    assert ("pdf", "b") not in cache
+    assert ("pdf", "a") in cache
+
+
+def test_prune_and_clear(cache: Cache) -> None:
+    for name in "abc":
+        cache["txt", name] = name * 30
+    assert cache.prune(max_size=30) == (2, 60)
+    assert cache.stats()["entries"] == 1
+
+    cache.clear()
+    assert cache.stats()["entries"] == 0
+    assert not list(cache.cache_dir.glob("*/*.blob"))
+
+
+def test_existing_files_indexed(tmp_path: Path) -> None:
+    (tmp_path / "pdf").mkdir()
+    (tmp_path / "pdf" / "old.blob").write_bytes(b"x" * 10)
+
+    cache = make_cache(tmp_path, max_size=None)
+    assert cache.stats()["entries"] == 1
+    assert cache.prune(max_size=0) == (1, 10)
+    assert ("pdf", "old") not in cache
+
+
+def test_touch_throttled(tmp_path: Path) -> None:
+    cache = make_cache(tmp_path, max_size=100)
+    cache["pdf", "a"] = b"a" * 40
+    cache["pdf", "b"] = b"b" * 40
+    # "a" was accessed too recently for its access time to be updated
+    assert cache["pdf", "a"]
+    cache["pdf", "c"] = b"c" * 40
+    assert ("pdf", "a") not in cache
+    assert ("pdf", "b") in cache
+
+
+def test_total_size(cache: Cache) -> None:
+    cache["pdf", "a"] = b"a" * 40
+    cache["pdf", "a"] = b"a" * 30
+    cache["pdf", "b"] = b"b" * 20
+    assert cache.total_size() == 50
+    del cache["pdf", "a"]
+    assert cache.total_size() == 20
+
+    # the total is shared with other processes using the same index
+    other = make_cache(cache.cache_dir, max_size=100)
+    assert other.total_size() == 20
+    other["pdf", "c"] = b"c" * 10
+    assert cache.total_size() == 30
+
+
+def test_missing_file_forgotten(cache: Cache) -> None:
+    cache["pdf", "a"] = b"a" * 40
+    cache._path(("pdf", "a")).unlink()
+    assert cache.get(("pdf", "a")) is None
+    assert cache.total_size() == 0
+    assert cache.stats()["entries"] == 0
@@ -9,15 +9,18 @@ from typing import TYPE_CHECKING
 from warnings import warn
 
 from magic import Magic
-from pytest import fixture, mark
+from pytest import fixture, mark, raises
 
-from abilian.services.conversion.handlers import HAS_LIBREOFFICE, HAS_PDFTOTEXT
+from abilian.services.conversion import ConversionError, Converter
+from abilian.services.conversion.handlers import (
+    HAS_LIBREOFFICE,
+    HAS_PDFTOTEXT,
+    Handler,
+)
 
 if TYPE_CHECKING:
     from collections.abc import Iterator
 
-    from abilian.services.conversion.service import Converter
-
 mime_sniffer = Magic(mime=True)
 encoding_sniffer = Magic(mime_encoding=True)
 
@@ -107,3 +110,42 @@ def test_word_to_images(converter: Converter) -> None:
     blob = read_file("test.doc")
     image = converter.to_image("", blob, "application/msword", 0)
     assert mime_sniffer.from_buffer(image) == "image/jpeg"
+
+
+class FakeRenderer(Handler):
+    accepts_mime_types = ["application/pdf"]
+    produces_mime_types = ["image/jpeg"]
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.calls: list[tuple[int, int, int]] = []
+
+    def convert(self, blob: bytes, size=500, first=None, last=None, **kw):
+        self.calls.append((size, first, last))
+        return [f"page {first} at {size}".encode()]
+
+
+def test_render_single_page(tmp_path: Path) -> None:
+    renderer = FakeRenderer()
+    converter = Converter()
+    converter.register_handler(renderer)
+    converter.init_work_dirs(tmp_path / "cache", tmp_path / "tmp")
+    converter.cache["pages", "digest"] = b"3"
+
+    image = converter.to_image("digest", b"%PDF", "application/pdf", 2, 300)
+    assert image == b"page 2 at 300"
+    assert renderer.calls == [(300, 2, 2)]
+
+    # rendered pages are cached
+    assert converter.get_image("digest", b"%PDF", "application/pdf", 2, 300) == image
+    assert renderer.calls == [(300, 2, 2)]
+
+    # pages of a PDF are rendered on demand
+    image = converter.get_image("digest", b"%PDF", "application/pdf", 1, 300)
+    assert image == b"page 1 at 300"
+
+    with raises(ConversionError):
+        converter.to_image("digest", b"%PDF", "application/pdf", 3, 300)
+
+    # no conversion to PDF from a web request
+    assert converter.get_image("other", b"doc", "application/msword", 0) is None
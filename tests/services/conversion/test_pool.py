@@ -0,0 +1,101 @@
+# Copyright (c) 2012-2024, Abilian SAS
+
+from __future__ import annotations
+
+import sys
+import threading
+import time
+from typing import TYPE_CHECKING
+
+from pytest import fixture, raises
+
+from abilian.services.conversion import ConversionError
+from abilian.services.conversion.handlers import PdfToTextHandler
+from abilian.services.conversion.pool import ConversionPool, get_pool
+
+if TYPE_CHECKING:
+    from pathlib import Path
+
+    from flask import Flask
+
+
+@fixture
+def pool(tmp_path: Path) -> ConversionPool:
+    pool = ConversionPool("test", size=2)
+    pool.work_dir = tmp_path
+    return pool
+
+
+def test_pool_concurrency(pool: ConversionPool) -> None:
+    running = []
+    max_running = 0
+    lock = threading.Lock()
+
+    def convert() -> None:
+        nonlocal max_running
+        with pool.slot() as slot:
+            with lock:
+                running.append(slot.index)
+                max_running = max(max_running, len(running))
+                # a slot is never used twice at the same time
+                assert len(set(running)) == len(running)
+            time.sleep(0.05)
+            with lock:
+                running.remove(slot.index)
+
+    threads = [threading.Thread(target=convert) for _i in range(6)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert max_running == 2
+    stats = pool.stats()
+    assert stats["completed"] == 6
+    assert stats["running"] == 0
+    assert stats["waiting"] == 0
+    assert stats["avg_time"] >= 0.05
+
+
+def test_pool_timeout(pool: ConversionPool) -> None:
+    with pool.slot() as slot:
+        (slot.work_dir / "profile").write_text("state")
+        cmd = [sys.executable, "-c", "import time; time.sleep(30)"]
+        start = time.monotonic()
+        with raises(ConversionError):
+            slot.run(cmd, timeout=0.2)
+        assert time.monotonic() - start < 10
+
+        # work directory has been reset
+        assert not (slot.work_dir / "profile").exists()
+
+    stats = pool.stats()
+    assert stats["timeouts"] == 1
+    assert stats["restarts"] == 1
+
+
+def test_pool_no_free_slot(pool: ConversionPool) -> None:
+    with pool.slot(), pool.slot():
+        with raises(ConversionError), pool.slot(timeout=0.2):
+            pass
+        assert pool.stats()["running"] == 2
+
+    with pool.slot() as slot:
+        assert slot.index == 0
+
+
+def test_handler_timeout(app: Flask, tmp_path: Path, monkeypatch) -> None:
+    pdftotext = tmp_path / "pdftotext"
+    pdftotext.write_text("#!/bin/sh\nsleep 30\n")
+    pdftotext.chmod(0o755)
+    monkeypatch.setenv("POPPLER_BIN", str(tmp_path))
+
+    handler = PdfToTextHandler()
+    handler.run_timeout = 0.2
+    pool = get_pool("PdfToTextHandler")
+    timeouts = pool.timeouts
+    start = time.monotonic()
+    with raises(ConversionError):
+        handler.convert(b"%PDF-1.4")
+    assert time.monotonic() - start < 10
+    assert pool.stats()["timeouts"] == timeouts + 1
@@ -6,7 +6,9 @@ from pathlib import Path
 
 from pytest import fixture
 
+from abilian.services.conversion.cache import Cache
 from abilian.services.image import CROP, SCALE, get_save_format, get_size, resize
+from abilian.services.image.cache import ResizeCache
 
 
 @fixture
@@ -43,3 +45,35 @@ def test_scale(orig_image: bytes) -> None:
 def test_crop(orig_image: bytes) -> None:
     image = resize(orig_image, 500, 500, CROP)
     assert get_size(image) == (500, 500)
+
+
+def test_resize_cache(tmp_path: Path) -> None:
+    store = Cache(max_size=150_000)
+    store.cache_dir = tmp_path
+    cache = ResizeCache(max_bytes=100_000)
+    cache.store = store
+    assert cache.get("a") is None
+
+    cache.set("a", b"a" * 60_000)
+    cache.set("b", b"b" * 60_000)
+    # memory tier is bounded, "a" is still on disk
+    assert len(cache) == 1
+    assert cache.get("a") == b"a" * 60_000
+    assert cache.stats()["hits"] == 1
+
+    cache.clear()
+    assert len(cache) == 0
+    assert cache.get("b") == b"b" * 60_000
+
+    # files are evicted within the budget of the store
+    cache.set("c", b"c" * 60_000)
+    assert store.total_size() == 120_000
+    cache.clear()
+    assert cache.get("a") is None
+    assert cache.get("c") == b"c" * 60_000
+
+
+def test_resize_with_key(orig_image: bytes) -> None:
+    image = resize(orig_image, 100, 100, CROP, key="cat")
+    # same key: the cached image is returned, the original isn't read
+    assert resize(b"not an image", 100, 100, CROP, key="cat") == image
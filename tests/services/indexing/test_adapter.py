@@ -176,3 +176,27 @@ def test_get_document_with_schema() -> None:
     assert doc["name"] == "related name"
     assert "related name" in doc["text"]
     assert "description text" in doc["text"]
+
+
+def test_eager_loads() -> None:
+    schema = Schema()
+    adapter = SAAdapter(SubclassEntityIndexable, schema)
+    paths = {tuple(r.key for r in path) for path in adapter.eager_load_paths}
+    assert ("creator",) in paths
+    assert ("owner",) in paths
+
+    adapter = SAAdapter(SANotIndexable, Schema())
+    assert adapter.eager_load_paths == []
+
+
+def test_retrieve_many(app, db) -> None:
+    schema = Schema()
+    adapter = SAAdapter(SubclassEntityIndexable, schema)
+    objs = [SubclassEntityIndexable(name=f"entity {i}") for i in range(3)]
+    db.session.add_all(objs)
+    db.session.flush()
+
+    pks = [obj.id for obj in objs]
+    retrieved = adapter.retrieve_many([*pks[:2], 1000])
+    assert retrieved == {pks[0]: objs[0], pks[1]: objs[1]}
+    assert adapter.retrieve_many([]) == {}
@@ -0,0 +1,63 @@
+# Copyright (c) 2012-2024, Abilian SAS
+
+""""""
+
+from __future__ import annotations
+
+from whoosh import query as wq
+from whoosh.fields import ID, KEYWORD, Schema
+from whoosh.filedb.filestore import RamStorage
+
+from abilian.services.indexing.filter_cache import SearchFilterCache
+
+
+def _make_index():
+    schema = Schema(object_key=ID(stored=True), allowed=KEYWORD(stored=True))
+    index = RamStorage().create_index(schema)
+    with index.writer() as writer:
+        writer.add_document(object_key="a", allowed="user:1")
+        writer.add_document(object_key="b", allowed="user:2")
+        writer.add_document(object_key="c", allowed="user:1 user:2")
+    return index
+
+
+def test_cache_hit_and_generation() -> None:
+    index = _make_index()
+    cache = SearchFilterCache()
+    calls = []
+
+    def factory():
+        calls.append(1)
+        return wq.Term("allowed", "user:1")
+
+    with index.searcher() as searcher:
+        docs = cache.get(searcher, "user:1", factory)
+        keys = sorted(searcher.stored_fields(n)["object_key"] for n in docs)
+        assert keys == ["a", "c"]
+
+        cache.get(searcher, "user:1", factory)
+        assert len(calls) == 1
+        assert cache.hits == 1
+        assert cache.misses == 1
+
+    # new generation: filter is computed again
+    with index.writer() as writer:
+        writer.add_document(object_key="d", allowed="user:1")
+
+    with index.searcher() as searcher:
+        docs = cache.get(searcher, "user:1", factory)
+        assert len(calls) == 2
+        assert len(list(docs)) == 3
+
+
+def test_eviction_and_clear() -> None:
+    index = _make_index()
+    cache = SearchFilterCache(max_size=1)
+
+    with index.searcher() as searcher:
+        cache.get(searcher, "user:1", lambda: wq.Term("allowed", "user:1"))
+        cache.get(searcher, "user:2", lambda: wq.Term("allowed", "user:2"))
+        assert len(cache) == 1
+
+    cache.clear()
+    assert len(cache) == 0
@@ -0,0 +1,200 @@
+# Copyright (c) 2012-2024, Abilian SAS
+
+""""""
+
+from __future__ import annotations
+
+from typing import TYPE_CHECKING, Any, cast
+
+import sqlalchemy as sa
+from pytest import fixture
+from whoosh.filedb.filestore import FileStorage
+from whoosh.index import FileIndex
+
+from abilian.cli.indexing import Checkpoint, ParallelReindexer
+from abilian.core.entities import Entity
+from abilian.services import get_service
+from abilian.testing.conftest import TestConfig
+
+if TYPE_CHECKING:
+    from collections.abc import Iterator
+    from pathlib import Path
+
+    from pytest import TempPathFactory
+    from sqlalchemy.orm import Session
+
+    from abilian.app import Application
+    from abilian.services.indexing.service import WhooshIndexService
+
+
+class ReindexedContact(Entity):
+    entity_type = "abilian.services.indexing.ReindexedContact"
+    name = sa.Column(sa.UnicodeText)
+
+
+@fixture(scope="module")
+def config(tmp_path_factory: TempPathFactory) -> Any:
+    # worker processes open their own connection: they share a database
+    # file with the parent, not an in-memory one. Like an in-memory database,
+    # the parent uses a single connection (see `cleanup_db()`).
+    db_path = tmp_path_factory.mktemp("db") / "reindex.db"
+
+    class ReindexConfig(TestConfig):
+        SQLALCHEMY_DATABASE_URI = f"sqlite:///{db_path}"
+        SQLALCHEMY_ENGINE_OPTIONS = {
+            "poolclass": sa.pool.StaticPool,
+            "connect_args": {"check_same_thread": False},
+        }
+
+    return ReindexConfig
+
+
+@fixture
+def contacts(session: Session) -> list[ReindexedContact]:
+    # created before the indexing service is started: nothing is indexed yet
+    _contacts = [ReindexedContact(name=f"Contact {i}") for i in range(5)]
+    session.add_all(_contacts)
+    session.commit()
+    return _contacts
+
+
+@fixture
+def svc(
+    app: Application, contacts: list[ReindexedContact]
+) -> Iterator[WhooshIndexService]:
+    _svc = cast("WhooshIndexService", get_service("indexing"))
+    with app.app_context():
+        _svc.start(ignore_state=True)
+        yield _svc
+
+
+@fixture
+def file_index(svc: WhooshIndexService, tmp_path: Path, monkeypatch) -> FileIndex:
+    # sub-writers of a multiprocess writer can't share an index in memory
+    index = svc.app_state.indexes["default"]
+    storage = FileStorage(str(tmp_path / "index")).create()
+    file_index = FileIndex.create(storage, index.schema, "default")
+    monkeypatch.setitem(svc.app_state.indexes, "default", file_index)
+    return file_index
+
+
+def _indexed_keys(svc: WhooshIndexService) -> list[str]:
+    with svc.index().searcher() as searcher:
+        return sorted(
+            doc["object_key"]
+            for doc in searcher.documents(object_type=ReindexedContact.entity_type)
+        )
+
+
+def test_checkpoint(tmp_path: Path) -> None:
+    path = tmp_path / "checkpoint.json"
+    checkpoint = Checkpoint(path)
+    assert not checkpoint.started
+
+    checkpoint.set_last_pk("a.B", 12)
+    loaded = Checkpoint(path)
+    loaded.load()
+    assert loaded.started
+    assert loaded.last_pk("a.B") == 12
+
+    loaded.mark_done("a.B")
+    assert loaded.is_done("a.B")
+    assert loaded.last_pk("a.B") is None
+
+    loaded.remove()
+    assert not path.exists()
+
+
+def test_parallel_reindex(
+    contacts: list[ReindexedContact], svc: WhooshIndexService, tmp_path: Path
+) -> None:
+    checkpoint_path = tmp_path / "checkpoint.json"
+    reindexer = ParallelReindexer(
+        clear=True, procs=1, range_size=2, checkpoint_path=checkpoint_path
+    )
+    reindexer.reindex_all()
+
+    expected = sorted(c.object_key for c in contacts)
+    assert _indexed_keys(svc) == expected
+    assert reindexer.stats[ReindexedContact.entity_type][0] == 5
+    # checkpoint is removed after a complete run
+    assert not checkpoint_path.exists()
+
+
+def test_parallel_reindex_resume(
+    contacts: list[ReindexedContact], svc: WhooshIndexService, tmp_path: Path
+) -> None:
+    pks = sorted(c.id for c in contacts)
+
+    # simulate a run interrupted after the first range
+    checkpoint_path = tmp_path / "checkpoint.json"
+    checkpoint = Checkpoint(checkpoint_path)
+    checkpoint.set_last_pk(ReindexedContact.entity_type, pks[1])
+
+    reindexer = ParallelReindexer(
+        clear=False,
+        procs=1,
+        range_size=2,
+        resume=True,
+        checkpoint_path=checkpoint_path,
+    )
+    ranges = list(reindexer.pk_ranges(ReindexedContact, start_after=pks[1]))
+    assert ranges == [(pks[2], pks[3]), (pks[4], pks[4])]
+
+    reindexer.reindex_all()
+    # only objects after the checkpoint have been indexed
+    assert reindexer.stats[ReindexedContact.entity_type][0] == 3
+    assert _indexed_keys(svc) == sorted(c.object_key for c in contacts if c.id > pks[1])
+
+
+def test_parallel_reindex_procs(
+    contacts: list[ReindexedContact],
+    svc: WhooshIndexService,
+    file_index: FileIndex,
+    tmp_path: Path,
+) -> None:
+    reindexer = ParallelReindexer(
+        clear=True, procs=2, range_size=2, checkpoint_path=tmp_path / "checkpoint"
+    )
+    reindexer.reindex_all()
+
+    # documents are built by the workers, and each range committed separately
+    assert _indexed_keys(svc) == sorted(c.object_key for c in contacts)
+    assert reindexer.stats[ReindexedContact.entity_type][0] == 5
+
+
+def test_parallel_reindex_procs_resume(
+    contacts: list[ReindexedContact],
+    svc: WhooshIndexService,
+    file_index: FileIndex,
+    tmp_path: Path,
+) -> None:
+    pks = sorted(c.id for c in contacts)
+
+    # a run interrupted after the first range had indexed the first objects,
+    # and maybe some of the next range
+    reindexer = ParallelReindexer(clear=False, procs=2, range_size=2)
+    reindexer.write_documents(_documents(svc, contacts[:3]), delete=False)
+
+    checkpoint_path = tmp_path / "checkpoint.json"
+    Checkpoint(checkpoint_path).set_last_pk(ReindexedContact.entity_type, pks[1])
+    reindexer = ParallelReindexer(
+        clear=True,
+        procs=2,
+        range_size=2,
+        resume=True,
+        checkpoint_path=checkpoint_path,
+    )
+    reindexer.reindex_all()
+
+    assert reindexer.stats[ReindexedContact.entity_type][0] == 3
+    # each object is indexed once
+    assert _indexed_keys(svc) == sorted(c.object_key for c in contacts)
+    assert not checkpoint_path.exists()
+
+
+def _documents(
+    svc: WhooshIndexService, contacts: list[ReindexedContact]
+) -> list[dict[str, Any]]:
+    adapter = svc.adapted[ReindexedContact.entity_type]
+    return [svc.get_document(contact, adapter) for contact in contacts]
@@ -0,0 +1,115 @@
+# Copyright (c) 2012-2024, Abilian SAS
+
+""""""
+
+from __future__ import annotations
+
+import gc
+import time
+
+from whoosh import query as wq
+from whoosh.fields import ID, Schema
+from whoosh.filedb.filestore import RamStorage
+
+from abilian.services.indexing.searchers import SearcherPool
+
+
+def _make_index():
+    index = RamStorage().create_index(Schema(object_key=ID(stored=True)))
+    with index.writer() as writer:
+        writer.add_document(object_key="a")
+    return index
+
+
+def _add(index, object_key: str) -> None:
+    with index.writer() as writer:
+        writer.add_document(object_key=object_key)
+
+
+def test_searcher_is_shared_until_commit() -> None:
+    index = _make_index()
+    pool = SearcherPool(check_interval=0)
+
+    with pool.searcher("default", index) as searcher:
+        with pool.searcher("default", index) as other:
+            assert other is searcher
+        assert pool.stats()["in_use"] == 1
+
+    _add(index, "b")
+    with pool.searcher("default", index) as new_searcher:
+        assert new_searcher is not searcher
+        assert new_searcher.doc_count() == 2
+
+    # previous searcher was not in use: closed when replaced
+    assert searcher.is_closed
+    assert pool.stats() == {
+        "open": 1,
+        "retired": 0,
+        "in_use": 0,
+        "opened": 2,
+        "closed": 1,
+    }
+
+
+def test_retired_searcher_kept_until_released() -> None:
+    index = _make_index()
+    pool = SearcherPool(check_interval=0)
+
+    searcher = pool.acquire("default", index)
+    _add(index, "b")
+    with pool.searcher("default", index) as new_searcher:
+        assert new_searcher.doc_count() == 2
+
+    # in-flight request keeps its snapshot
+    assert not searcher.is_closed
+    assert searcher.doc_count() == 1
+    assert pool.stats()["retired"] == 1
+
+    pool.release(searcher)
+    assert searcher.is_closed
+    assert pool.stats()["open"] == 1
+
+
+def test_keep_until_results_are_collected() -> None:
+    index = _make_index()
+    pool = SearcherPool(check_interval=0)
+
+    with pool.searcher("default", index) as searcher:
+        results = searcher.search(wq.Every())
+        pool.keep(searcher, results)
+
+    _add(index, "b")
+    pool.clear()
+    assert not searcher.is_closed
+    assert [hit["object_key"] for hit in results] == ["a"]
+
+    del results
+    gc.collect()
+    assert searcher.is_closed
+    assert pool.stats()["open"] == 0
+
+
+def test_generation_checked_once_per_interval(monkeypatch) -> None:
+    index = _make_index()
+    pool = SearcherPool(check_interval=60)
+    now = time.monotonic()
+    monkeypatch.setattr(time, "monotonic", lambda: now)
+
+    with pool.searcher("default", index) as searcher:
+        pass
+
+    # new generation is not seen until the interval has elapsed...
+    _add(index, "b")
+    with pool.searcher("default", index) as same:
+        assert same is searcher
+
+    now += 61
+    with pool.searcher("default", index) as new_searcher:
+        assert new_searcher is not searcher
+        assert new_searcher.doc_count() == 2
+
+    # ... or the pool is told the index has changed
+    _add(index, "c")
+    pool.expire("default")
+    with pool.searcher("default", index) as last:
+        assert last.doc_count() == 3
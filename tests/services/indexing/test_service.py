@@ -7,9 +7,11 @@ from __future__ import annotations
 from typing import TYPE_CHECKING, cast
 
 import sqlalchemy as sa
+from flask import g
 from pytest import fixture, mark
 
 from abilian.core.entities import Entity
+from abilian.core.models.subjects import User
 from abilian.services import get_service
 from tests.util import redis_available
 
@@ -76,3 +78,109 @@ def test_clear(app: Application, svc: WhooshIndexService) -> None:
     svc.start()
     svc.stop()
     svc.clear()
+
+
+def test_search_unreadable_documents(
+    app: Application, session: Session, svc: WhooshIndexService
+) -> None:
+    contact = IndexedContact(name="John Doe")
+    session.add(contact)
+    session.flush()
+    svc.index_objects([contact])
+
+    with app.test_request_context():
+        g.is_manager = True
+        assert len(svc.search("john")) == 1
+
+        # documents that cannot be read are not found
+        g.is_manager = False
+        assert len(svc.search("john")) == 0
+
+
+def test_search_page(
+    app: Application, session: Session, svc: WhooshIndexService
+) -> None:
+    contacts = [IndexedContact(name=f"John Doe {i}") for i in range(5)]
+    users = [User(email=f"john{i}@example.com", first_name="John") for i in range(2)]
+    session.add_all(contacts + users)
+    session.flush()
+    svc.index_objects(contacts + users)
+
+    facet_cache = svc.app_state.facet_cache
+    with app.test_request_context():
+        g.is_manager = True
+        results, counts = svc.search_page("john", 1, pagelen=2)
+        assert counts == {IndexedContact.entity_type: 5, User.entity_type: 2}
+        assert results.total == 7
+        assert results.pagecount == 4
+        assert len(list(results)) == 2
+
+        # counts are cached for next pages and type filters
+        results, counts = svc.search_page(
+            "john", 2, pagelen=2, object_types=[IndexedContact.entity_type]
+        )
+        assert facet_cache.hits == 1
+        assert counts[User.entity_type] == 2
+        assert results.total == 5
+        assert results.pagenum == 2
+        assert {hit["object_type"] for hit in results} == {IndexedContact.entity_type}
+
+        # pages after the last one return the last page
+        results, _counts = svc.search_page("john", 10, pagelen=2)
+        assert results.pagenum == 4
+        assert len(list(results)) == 1
+
+        # documents that cannot be read are not found
+        g.is_manager = False
+        results, counts = svc.search_page(
+            "john", 1, pagelen=2, object_types=[IndexedContact.entity_type]
+        )
+        assert counts == {User.entity_type: 2}
+        assert results.total == 0
+
+
+def test_live_search(
+    app: Application, session: Session, svc: WhooshIndexService
+) -> None:
+    contacts = [IndexedContact(name=f"Jérôme Dupont {i}") for i in range(7)]
+    contacts.append(IndexedContact(name="Jean Durand"))
+    users = [
+        User(email=f"jerome{i}@example.com", first_name="Jérôme", last_name="Martin")
+        for i in range(3)
+    ]
+    session.add_all(contacts + users)
+    session.flush()
+    svc.index_objects(contacts + users)
+
+    live_search = svc.app_state.live_search
+    with app.test_request_context():
+        g.is_manager = True
+        results = svc.live_search("jero", limit=5)
+        assert set(results) == {IndexedContact.entity_type, User.entity_type}
+        docs = results[IndexedContact.entity_type]
+        assert len(docs) == 5
+        assert all(doc["name"].startswith("Jérôme") for doc in docs)
+        assert len(results[User.entity_type]) == 3
+
+        # best hits are collected for each type
+        results = svc.live_search("jero", limit=2)
+        assert {type_: len(docs) for type_, docs in results.items()} == {
+            IndexedContact.entity_type: 2,
+            User.entity_type: 2,
+        }
+
+        # words longer than indexed prefixes, all words must match
+        results = svc.live_search("jerome dupo")
+        assert len(results[IndexedContact.entity_type]) == 5
+        assert svc.live_search("jerome durand") == {}
+        assert svc.live_search("j") == {}
+
+        # results are cached until the index changes
+        misses = live_search.misses
+        svc.live_search("jero", limit=5)
+        assert live_search.misses == misses
+        assert live_search.hits == 1
+
+        # anonymous user only sees users
+        g.is_manager = False
+        assert list(svc.live_search("jero")) == [User.entity_type]
@@ -0,0 +1,96 @@
+# Copyright (c) 2012-2024, Abilian SAS
+
+""""""
+
+from __future__ import annotations
+
+import time
+
+from abilian.services.indexing.update_queue import IndexUpdateQueue
+
+
+class Recorder:
+    def __init__(self) -> None:
+        self.calls: list[tuple[str, list]] = []
+
+    def __call__(self, index: str, items: list) -> None:
+        self.calls.append((index, items))
+
+
+def test_coalesce_and_deduplicate() -> None:
+    sent = Recorder()
+    queue = IndexUpdateQueue(sent, max_size=100, max_delay=60)
+
+    queue.put("default", [("new", "a.Contact", 1, {}), ("new", "a.Contact", 2, {})])
+    queue.put("default", [("changed", "a.Contact", 1, {})])
+    queue.put("default", [("deleted", "a.Contact", 2, {})])
+    assert sent.calls == []
+    assert queue.depth == 2
+
+    queue.flush()
+    assert sent.calls == [
+        (
+            "default",
+            [("changed", "a.Contact", 1, {}), ("deleted", "a.Contact", 2, {})],
+        )
+    ]
+    assert queue.depth == 0
+
+    metrics = queue.metrics()
+    assert metrics["received"] == 4
+    assert metrics["sent"] == 2
+    assert metrics["flushes"] == 1
+
+    # nothing pending: no message
+    queue.flush()
+    assert len(sent.calls) == 1
+
+
+def test_flush_on_size() -> None:
+    sent = Recorder()
+    queue = IndexUpdateQueue(sent, max_size=2, max_delay=60)
+
+    queue.put("default", [("new", "a.Contact", 1, {})])
+    assert sent.calls == []
+    queue.put("default", [("new", "a.Contact", 2, {})])
+    assert len(sent.calls) == 1
+    assert queue.depth == 0
+
+
+def test_flush_on_delay() -> None:
+    sent = Recorder()
+    queue = IndexUpdateQueue(sent, max_size=100, max_delay=0.05)
+
+    queue.put("default", [("new", "a.Contact", 1, {})])
+    assert sent.calls == []
+
+    deadline = time.monotonic() + 5
+    while not sent.calls and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+    assert sent.calls == [("default", [("new", "a.Contact", 1, {})])]
+    assert queue.metrics()["last_flush_latency"] >= 0.05
+
+
+def test_no_delay() -> None:
+    sent = Recorder()
+    queue = IndexUpdateQueue(sent, max_size=100, max_delay=0)
+
+    queue.put("default", [("new", "a.Contact", 1, {})])
+    assert len(sent.calls) == 1
+
+
+def test_reset_after_fork() -> None:
+    sent = Recorder()
+    queue = IndexUpdateQueue(sent, max_size=100, max_delay=60)
+    queue.put("default", [("new", "a.Contact", 1, {})])
+
+    # child process: parent sends pending updates
+    queue._reset_after_fork()
+    assert queue.depth == 0
+    queue.flush()
+    assert sent.calls == []
+
+    queue.put("default", [("new", "a.Contact", 2, {})])
+    queue.flush()
+    assert sent.calls == [("default", [("new", "a.Contact", 2, {})])]
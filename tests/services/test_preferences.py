@@ -44,8 +44,8 @@ class AdminPanel(PreferencePanel):
 
 
 @fixture
-def app(config: type) -> Application:
-    app = Application()
+def app(config: type, instance_path: str) -> Application:
+    app = Application(instance_path=instance_path)
     app.configure(config)
     setup_app(app)
 
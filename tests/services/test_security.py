@@ -26,6 +26,7 @@ from abilian.services.security import (
     SecurityAudit,
     security,
 )
+from abilian.services.security.cache import PermissionCache
 
 if TYPE_CHECKING:
     from collections.abc import Iterator
@@ -541,3 +542,105 @@ def test_add_delete_permissions_expunged_obj(session: Session) -> None:
     # something wrong (`Key (permission, role, object_id)=(..., ..., ...)
     # already exists`)
     session.flush()
+
+
+def test_has_permission_batch(session: Session) -> None:
+    user = User(email="john@example.com", password="x")  # noqa: S106
+    root = Folder(title="root")
+    inherited = root.create_subfolder("inherited")
+    private = root.create_subfolder("private")
+    private.inherit_security = False
+    public = root.create_subfolder("public")
+    document = inherited.create_document("doc")
+    session.add_all([user, root])
+    session.flush()
+
+    security.grant_role(user, READER, obj=root)
+    security.add_permission(READ, AUTHENTICATED, public)
+    objs = [root, inherited, private, public, document]
+
+    expected = [True, True, False, True, True]
+    assert security.has_permission_batch(user, READ, objs, inherit=True) == expected
+    assert [
+        security.has_permission(user, READ, obj, inherit=True) for obj in objs
+    ] == expected
+
+    expected = [True, False, False, True, False]
+    assert security.has_permission_batch(user, READ, objs) == expected
+    assert security.filter_with_permission(user, READ, objs) == [root, public]
+    assert security.has_permission_batch(user, READ, []) == []
+
+
+def test_permission_cache(session: Session) -> None:
+    user = User(email="john@example.com", password="x")  # noqa: S106
+    obj = DummyModel()
+    session.add_all([user, obj])
+    session.flush()
+
+    cache = security.app_state.permission_cache
+    assert not security.has_permission(user, READ, obj)
+    misses = cache.misses
+    assert not security.has_permission(user, READ, obj)
+    assert cache.misses == misses
+    assert security.permission_cache_stats()["hits"] >= 1
+
+    # invalidated by security changes
+    security.add_permission(READ, AUTHENTICATED, obj)
+    assert security.has_permission(user, READ, obj)
+    security.delete_permission(READ, AUTHENTICATED, obj)
+    assert not security.has_permission(user, READ, obj)
+
+    security.grant_role(user, READER, obj)
+    assert security.has_permission(user, READ, obj)
+    security.ungrant_role(user, READER, obj)
+    assert not security.has_permission(user, READ, obj)
+
+    # ... and by direct changes in DB
+    session.add(PermissionAssignment(role=AUTHENTICATED, permission=READ, object=obj))
+    session.flush()
+    assert security.has_permission(user, READ, obj)
+
+    # unrelated changes keep cached decisions
+    misses = cache.misses
+    session.add(DummyModel())
+    session.flush()
+    assert security.has_permission(user, READ, obj)
+    assert cache.misses == misses
+
+
+def test_permission_cache_rollback(session: Session, monkeypatch) -> None:
+    user = User(email="john@example.com", password="x")  # noqa: S106
+    obj = DummyModel()
+    session.add_all([user, obj])
+    session.commit()
+
+    cache = PermissionCache(ttl=60)
+    monkeypatch.setattr(security.app_state, "permission_cache", cache)
+
+    # decisions depending on rolled back changes are forgotten
+    session.add(PermissionAssignment(role=AUTHENTICATED, permission=READ, object=obj))
+    session.flush()
+    assert security.has_permission(user, READ, obj)
+    session.rollback()
+    assert cache.stats()["shared_size"] == 0
+    assert not security.has_permission(user, READ, obj)
+
+
+def test_permission_cache_shared_tier() -> None:
+    # outside of an application context, only the shared tier is used
+    cache = PermissionCache(ttl=60, max_size=1)
+    assert cache.get("a") is None
+    cache.set("a", False)
+    assert cache.get("a") is False
+
+    cache.set("b", True)
+    assert cache.get("a") is None
+    assert cache.get("b") is True
+
+    cache.clear()
+    assert cache.get("b") is None
+    assert cache.stats()["hits"] == 2
+
+    cache = PermissionCache(ttl=0)
+    cache.set("a", True)
+    assert cache.get("a") is None
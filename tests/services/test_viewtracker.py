@@ -0,0 +1,93 @@
+# Copyright (c) 2012-2024, Abilian SAS
+
+from __future__ import annotations
+
+from typing import TYPE_CHECKING
+
+from abilian.core.entities import Entity
+from abilian.core.models.subjects import User
+from abilian.services.viewtracker import viewtracker
+from abilian.services.viewtracker.models import Hit, View
+
+if TYPE_CHECKING:
+    from flask import Flask
+    from sqlalchemy.orm import Session
+
+
+class ViewedPage(Entity):
+    pass
+
+
+def test_hits_are_buffered(app: Flask, session: Session) -> None:
+    app.config["VIEWTRACKER_BATCH_SIZE"] = 4
+    user = User(email="viewer@example.com")
+    other = User(email="other@example.com")
+    page = ViewedPage(name="page")
+    session.add_all([user, other, page])
+    session.flush()
+
+    for _i in range(3):
+        viewtracker.record_hit(page, user)
+    assert View.query.count() == 0
+    assert len(viewtracker.app_state.pending) == 3
+
+    # batch is full: hits are written in bulk
+    viewtracker.record_hit(page, other)
+    assert not viewtracker.app_state.pending
+    assert View.query.count() == 2
+    assert Hit.query.count() == 4
+
+    # reading views writes pending hits first
+    viewtracker.record_hit(page, user)
+    views = {view.user: view for view in viewtracker.get_views(entity=page)}
+    assert views[user].hit_count == 4
+    assert views[other].hit_count == 1
+    assert views[user].entity == page
+    hits = viewtracker.get_hits(view=views[user])
+    assert len(hits) == 4
+    assert views[user].last_viewed_at == hits[-1].viewed_at
+
+
+def test_flush_errors_are_not_raised(app: Flask, session: Session, monkeypatch) -> None:
+    user = User(email="viewer@example.com")
+    page = ViewedPage(name="page")
+    broken = ViewedPage(name="broken")
+    session.add_all([user, page, broken])
+    session.flush()
+
+    write_hits = viewtracker._write_hits
+
+    def failing_write_hits(pending):
+        if any(entity_id == broken.id for entity_id, _user_id, _at in pending):
+            msg = "cannot write"
+            raise RuntimeError(msg)
+        write_hits(pending)
+
+    monkeypatch.setattr(viewtracker, "_write_hits", failing_write_hits)
+    viewtracker.record_hit(page, user)
+    viewtracker.record_hit(broken, user)
+
+    # hits of the failing view are dropped, other ones are written
+    views = viewtracker.get_views(entities=[page, broken])
+    assert [(view.entity, view.hit_count) for view in views] == [(page, 1)]
+    assert not viewtracker.app_state.pending
+
+
+def test_hits_are_written_after_interval(app: Flask, session: Session) -> None:
+    app.config["VIEWTRACKER_BATCH_SIZE"] = 100
+    app.config["VIEWTRACKER_FLUSH_INTERVAL"] = 0.05
+    user = User(email="viewer@example.com")
+    page = ViewedPage(name="page")
+    session.add_all([user, page])
+    session.flush()
+
+    viewtracker.record_hit(page, user)
+    timer = viewtracker.app_state.timer
+    assert timer is not None
+
+    # no other hit is recorded: the timer writes the buffered one
+    timer.join(timeout=5)
+    assert not viewtracker.app_state.pending
+    assert viewtracker.app_state.timer is None
+    assert View.query.count() == 1
+    assert Hit.query.count() == 1
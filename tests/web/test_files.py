@@ -0,0 +1,48 @@
+# Copyright (c) 2012-2024, Abilian SAS
+
+from __future__ import annotations
+
+from typing import TYPE_CHECKING
+
+from abilian.core.models.blob import Blob
+from abilian.web.views.files import send_blob
+
+if TYPE_CHECKING:
+    from flask import Flask
+
+    from abilian.core.sqlalchemy import SQLAlchemy
+
+
+def test_send_blob(app: Flask, db: SQLAlchemy) -> None:
+    blob = Blob(b"0123456789" * 10)
+    db.session.add(blob)
+    db.session.commit()
+    etag = blob.meta["md5"]
+
+    with app.test_request_context():
+        response = send_blob(blob, filename="data.bin", as_attachment=True)
+        response.direct_passthrough = False
+        assert response.status_code == 200
+        assert response.get_data() == b"0123456789" * 10
+        assert response.headers["ETag"] == f'"{etag}"'
+        assert response.headers["Content-Disposition"].startswith("attachment")
+
+    with app.test_request_context(headers={"Range": "bytes=10-19"}):
+        response = send_blob(blob)
+        response.direct_passthrough = False
+        assert response.status_code == 206
+        assert response.get_data() == b"0123456789"
+
+    with app.test_request_context(headers={"If-None-Match": f'"{etag}"'}):
+        assert send_blob(blob).status_code == 304
+
+    app.config["BLOB_X_ACCEL_REDIRECT"] = "/_blobs/"
+    try:
+        with app.test_request_context():
+            response = send_blob(blob)
+            path = response.headers["X-Accel-Redirect"]
+            assert path.startswith("/_blobs/")
+            assert path.endswith(str(blob.uuid))
+            assert response.get_data() == b""
+    finally:
+        del app.config["BLOB_X_ACCEL_REDIRECT"]
@@ -0,0 +1,41 @@
+# Copyright (c) 2012-2024, Abilian SAS
+
+from __future__ import annotations
+
+from pathlib import Path
+from typing import TYPE_CHECKING
+
+from abilian.core.models.blob import Blob
+from abilian.services.image import get_size
+
+if TYPE_CHECKING:
+    from flask.testing import FlaskClient
+    from pytest import MonkeyPatch
+
+    from abilian.core.sqlalchemy import SQLAlchemy
+
+CAT = Path(__file__).parents[1] / "services" / "image" / "cat.jpg"
+
+
+def test_blob_image_cached(
+    client: FlaskClient, db: SQLAlchemy, monkeypatch: MonkeyPatch
+) -> None:
+    blob = Blob(CAT.read_bytes())
+    db.session.add(blob)
+    db.session.commit()
+    url = f"/images/files/{blob.id}?s=50"
+
+    response = client.get(url)
+    assert response.status_code == 200
+    assert response.content_type == "image/jpeg"
+    assert get_size(response.data) == (50, 50)
+
+    # resized image is served from cache, without opening the blob
+    def fail(*args, **kwargs):
+        raise AssertionError
+
+    monkeypatch.setattr(Blob, "open", fail)
+    cached = client.get(url)
+    assert cached.status_code == 200
+    assert cached.content_type == "image/jpeg"
+    assert cached.data == response.data
@@ -0,0 +1,30 @@
+# Copyright (c) 2012-2024, Abilian SAS
+
+from __future__ import annotations
+
+from datetime import datetime
+from io import BytesIO
+
+import openpyxl
+
+from abilian.services.security import MANAGER
+from abilian.web.xlsx import write_xlsx
+
+
+def test_write_xlsx() -> None:
+    rows = ([f"name {i}", i, datetime(2024, 1, 1), MANAGER] for i in range(500))
+    title = "A sheet title longer than 31 characters"
+
+    file = BytesIO()
+    write_xlsx(file, title, ["Name", "Number", "Date", "Role"], rows, sample_size=10)
+
+    file.seek(0)
+    wb = openpyxl.load_workbook(file)
+    ws = wb.active
+    assert ws.title == "A sheet title longer than 31 c…"
+    values = list(ws.values)
+    assert len(values) == 501
+    assert values[0] == ("Name", "Number", "Date", "Role")
+    assert values[-1] == ("name 499", 499, datetime(2024, 1, 1), "manager")
+    # estimated from the header and first rows
+    assert ws.column_dimensions["A"].width == len("name 0") + 1